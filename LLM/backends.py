@@ -0,0 +1,301 @@
+import json
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from TNC.settings import get_setting
+from TNC.tasks import in_submitter_context
+from .scheduler import get_scheduler, is_rate_limit_error
+
+logger = logging.getLogger("Backends")
+
+GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta/openai/"
+
+# Latency assumed for a backend that has not answered yet, so it gets tried.
+_DEFAULT_LATENCY = 2.0
+
+# Seconds after which half of a backend's recorded history is forgotten, so
+# a backend that was slow or failing gets tried again once it is left idle.
+_HISTORY_HALF_LIFE = 300.0
+
+
+class Backend:
+    """
+    One OpenAI-compatible chat completion endpoint with rolling latency and
+    error statistics.
+    """
+
+    def __init__(self, name: str, client: Any, model: str, alpha: float = 0.2):
+        """
+        Args:
+            name: Label used in logs and reports
+            client: OpenAI client pointed at the endpoint
+            model: Model name sent to this endpoint
+            alpha: Weight of the newest sample in the rolling averages
+        """
+        self.name = name
+        self.client = client
+        self.model = model
+        self.alpha = alpha
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.in_flight = 0
+        self.last_used = time.monotonic()
+        self.stats = {"calls": 0, "errors": 0, "wins": 0, "hedged": 0}
+        self._lock = threading.Lock()
+
+    def record(self, elapsed: float, ok: bool) -> None:
+        """Fold one finished call into the rolling latency and error rate."""
+        with self._lock:
+            self.stats["calls"] += 1
+            self.last_used = time.monotonic()
+            if ok:
+                self.latency = elapsed if self.latency is None else (1 - self.alpha) * self.latency + self.alpha * elapsed
+            else:
+                self.stats["errors"] += 1
+            self.error_rate = (1 - self.alpha) * self.error_rate + self.alpha * (0.0 if ok else 1.0)
+
+    def score(self) -> float:
+        """Expected cost of sending the next call here; lower is better."""
+        if self.latency is None:
+            return _DEFAULT_LATENCY * (1 + 4 * self.error_rate) * (1 + 0.5 * self.in_flight)
+        # Idle backends drift back towards the neutral prior
+        weight = 0.5 ** ((time.monotonic() - self.last_used) / _HISTORY_HALF_LIFE)
+        latency = weight * self.latency + (1 - weight) * _DEFAULT_LATENCY
+        return latency * (1 + 4 * self.error_rate * weight) * (1 + 0.5 * self.in_flight)
+
+    def report(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats, name=self.name, model=self.model, latency=self.latency,
+                        error_rate=round(self.error_rate, 3), score=round(self.score(), 3))
+
+
+class BackendPool:
+    """
+    Sends each chat completion to the best-scoring backend and hedges it: if
+    no valid response has arrived after a delay (or the call failed), the same
+    request is also sent to the next backend, and the first valid response
+    wins. Streams count as answered once their first chunk arrives.
+    """
+
+    def __init__(self, backends: List[Backend], hedge_after: Optional[float] = None, min_hedge_after: float = 1.0,
+                 max_attempts: int = 2):
+        """
+        Args:
+            backends: The configured backends
+            hedge_after: Fixed hedging delay in seconds; by default twice the
+                chosen backend's rolling latency, but at least min_hedge_after
+            min_hedge_after: Lower bound of the adaptive hedging delay
+            max_attempts: Maximum number of backends one request is sent to
+        """
+        if not backends:
+            raise ValueError("At least one backend is required")
+        self.backends = backends
+        self.hedge_after = hedge_after
+        self.min_hedge_after = min_hedge_after
+        self.max_attempts = max(1, max_attempts)
+        self._executor = ThreadPoolExecutor(max_workers=8 * len(backends), thread_name_prefix="llm-backend")
+
+    @classmethod
+    def from_settings(cls) -> "BackendPool":
+        """
+        Build the pool from LLM_BACKENDS, a JSON list of
+        {"name", "model", "base_url", "api_key_setting"} objects. Without it,
+        OpenAI's gpt-4o is used, plus Gemini if GEMINI_API_KEY is set.
+        LLM_HEDGE_AFTER and LLM_HEDGE_MAX_ATTEMPTS tune hedging.
+
+        The OpenAI client's own retries are only used for a single backend
+        without the completion scheduler. Otherwise a failed call is retried
+        on another backend or through the scheduler, which has to see every
+        rate-limit response to adapt its limit.
+        """
+        from openai import OpenAI
+
+        configured = get_setting("LLM_BACKENDS")
+        if configured:
+            specs = json.loads(configured) if isinstance(configured, str) else list(configured)
+        else:
+            specs = [{"name": "openai", "model": "gpt-4o", "api_key_setting": "OPENAI_API_KEY"}]
+            if get_setting("GEMINI_API_KEY"):
+                specs.append({"name": "gemini", "model": "gemini-1.5-pro", "base_url": GEMINI_BASE_URL,
+                              "api_key_setting": "GEMINI_API_KEY"})
+
+        usable = []
+        for spec in specs:
+            api_key = get_setting(spec.get("api_key_setting", "OPENAI_API_KEY"))
+            if not api_key:
+                logger.warning(f"Skipping backend {spec.get('name')}: {spec.get('api_key_setting')} is not set")
+                continue
+            usable.append((spec, api_key))
+        if not usable:
+            raise ValueError("API_KEY environment variable is not set")
+
+        max_retries = 2 if len(usable) == 1 and get_scheduler() is None else 0
+        backends = [
+            Backend(spec.get("name", spec["model"]),
+                    OpenAI(api_key=api_key, base_url=spec.get("base_url"), max_retries=max_retries), spec["model"])
+            for spec, api_key in usable
+        ]
+
+        hedge_after = get_setting("LLM_HEDGE_AFTER")
+        return cls(
+            backends,
+            hedge_after=float(hedge_after) if hedge_after else None,
+            max_attempts=int(get_setting("LLM_HEDGE_MAX_ATTEMPTS", 2)),
+        )
+
+    def with_models(self, models: Dict[str, str], suffix: str = "") -> "BackendPool":
+        """
+        Return a pool over the same endpoints and connections that sends
+        other models, e.g. a smaller model tier.
+
+        Args:
+            models: Model to use instead of each backend's model; backends whose model is missing keep it
+            suffix: Appended to the backend names in logs and reports
+        """
+        backends = [Backend(f"{backend.name}{suffix}", backend.client, models.get(backend.model, backend.model),
+                            alpha=backend.alpha) for backend in self.backends]
+        return BackendPool(backends, hedge_after=self.hedge_after, min_hedge_after=self.min_hedge_after,
+                           max_attempts=self.max_attempts)
+
+    def ordered(self) -> List[Backend]:
+        """Backends from best to worst score."""
+        return sorted(self.backends, key=lambda backend: backend.score())
+
+    def _hedge_delay(self, backend: Backend) -> float:
+        if self.hedge_after is not None:
+            return self.hedge_after
+        if backend.latency is None:
+            return max(self.min_hedge_after, _DEFAULT_LATENCY)
+        return max(self.min_hedge_after, 2 * backend.latency)
+
+    def _race(self, request: Dict[str, Any], call: Callable[[Backend, Dict[str, Any]], Any],
+              discard: Callable[[Any], None]) -> Any:
+        """
+        Run call(backend, request) on up to max_attempts backends, starting
+        the next one after the hedging delay or right after a failure, and
+        return the first successful result. Late results are passed to discard.
+        """
+        candidates = self.ordered()[:self.max_attempts]
+        results: "queue.Queue" = queue.Queue()
+        lock = threading.Lock()
+        state = {"done": False}
+
+        def attempt(backend: Backend) -> None:
+            start = time.monotonic()
+            try:
+                value, ok = call(backend, dict(request, model=backend.model)), True
+            except Exception as e:
+                value, ok = e, False
+                if is_rate_limit_error(e):
+                    # Reported even when another backend's answer wins the race
+                    scheduler = get_scheduler()
+                    if scheduler is not None:
+                        scheduler.rate_limited(backend.name)
+            backend.record(time.monotonic() - start, ok)
+            with backend._lock:
+                backend.in_flight -= 1
+            with lock:
+                if not state["done"]:
+                    results.put((backend, ok, value))
+                    return
+            if ok:
+                discard(value)
+
+        def launch(backend: Backend) -> None:
+            with backend._lock:
+                backend.in_flight += 1
+            self._executor.submit(in_submitter_context(attempt), backend)
+
+        launch(candidates[0])
+        launched, pending, error = 1, 1, None
+        deadline = time.monotonic() + self._hedge_delay(candidates[0])
+        while True:
+            timeout = max(0.0, deadline - time.monotonic()) if launched < len(candidates) else None
+            try:
+                backend, ok, value = results.get(timeout=timeout)
+            except queue.Empty:
+                hedge = candidates[launched]
+                logger.info(f"No response after {self._hedge_delay(candidates[0]):.1f}s, hedging with {hedge.name}")
+                hedge.stats["hedged"] += 1
+                launch(hedge)
+                launched, pending = launched + 1, pending + 1
+                deadline = time.monotonic() + self._hedge_delay(hedge)
+                continue
+
+            pending -= 1
+            if ok:
+                with lock:
+                    state["done"] = True
+                    late = []
+                    while not results.empty():
+                        late.append(results.get_nowait())
+                for _, late_ok, late_value in late:
+                    if late_ok:
+                        discard(late_value)
+                backend.stats["wins"] += 1
+                if launched > 1:
+                    logger.info(f"Completion served by {backend.name} after hedging")
+                return value
+
+            error = value
+            logger.warning(f"Completion on {backend.name} failed: {value}")
+            if launched < len(candidates):
+                launch(candidates[launched])
+                launched, pending = launched + 1, pending + 1
+                deadline = time.monotonic() + self._hedge_delay(candidates[launched - 1])
+            elif pending == 0:
+                raise error
+
+    def create(self, request: Dict[str, Any]) -> Any:
+        """
+        Run a blocking chat completion.
+
+        Args:
+            request: Keyword arguments for chat.completions.create; "model" is set per backend
+
+        Returns:
+            The first valid ChatCompletion
+        """
+        def call(backend: Backend, backend_request: Dict[str, Any]) -> Any:
+            completion = backend.client.chat.completions.create(**backend_request)
+            if not completion.choices:
+                raise ValueError(f"{backend.name} returned no choices")
+            return completion
+
+        return self._race(request, call, discard=lambda completion: None)
+
+    def stream(self, request: Dict[str, Any]) -> Iterator[Any]:
+        """
+        Run a streamed chat completion; the backend whose first chunk arrives
+        first is streamed to the end.
+
+        Args:
+            request: Keyword arguments for chat.completions.create; "model" is set per backend
+
+        Yields:
+            ChatCompletionChunk objects
+        """
+        def call(backend: Backend, backend_request: Dict[str, Any]) -> Any:
+            stream = backend.client.chat.completions.create(stream=True, **backend_request)
+            iterator = iter(stream)
+            try:
+                first = next(iterator)
+            except StopIteration:
+                raise ValueError(f"{backend.name} returned an empty stream")
+            return stream, iterator, first
+
+        def discard(value: Any) -> None:
+            close = getattr(value[0], "close", None)
+            if close:
+                close()
+
+        _, iterator, first = self._race(request, call, discard)
+        yield first
+        yield from iterator
+
+    def report(self) -> List[Dict[str, Any]]:
+        """Rolling statistics of every backend, best first."""
+        return [backend.report() for backend in self.ordered()]
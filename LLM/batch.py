@@ -0,0 +1,230 @@
+"""
+Batch question answering: runs questions from a JSONL file through the
+assistant concurrently and streams answers, tool traces and timings to an
+output JSONL file.
+
+Input lines look like {"id": "q1", "question": "..."}; "id" defaults to the
+line number. Re-running with the same output file resumes the run: questions
+that already have a record, "ok" or error, are skipped; with --retry-errors
+only those with an "ok" record are.
+
+Usage:
+    python -m LLM.batch questions.jsonl -o answers.jsonl --workers 16 --rate 4
+    python -m LLM.batch questions.jsonl -o answers.jsonl --service-url http://127.0.0.1:8600
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Set
+
+logger = logging.getLogger("BatchRunner")
+
+ERROR_PREFIX = "Oops, something went wrong"
+
+
+class RateLimiter:
+    """Token bucket limiting how many questions are started per second."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        """
+        Args:
+            rate: Questions per second; 0 disables the limit
+            burst: Number of questions that may start back to back
+        """
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def read_questions(path: str) -> Iterator[Dict[str, Any]]:
+    """Yields {"id", "question"} records from a JSONL file."""
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                record = {"question": record}
+            yield {"id": str(record.get("id", line_number)), "question": record["question"]}
+
+
+def completed_ids(path: str, retry_errors: bool) -> Set[str]:
+    """
+    Ids to skip when resuming into an existing output file.
+
+    Args:
+        path: The output file
+        retry_errors: Only count ids with an "ok" record as done; otherwise
+            any recorded id is, including those that failed
+
+    Returns:
+        The ids not to run again
+    """
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A line cut short by an interrupted run
+                continue
+            if record.get("status") == "ok" or not retry_errors:
+                done.add(str(record["id"]))
+    return done
+
+
+class BatchRunner:
+    """Answers questions concurrently and appends one JSON record per question."""
+
+    def __init__(self, engine, output_path: str, workers: int, limiter: RateLimiter):
+        """
+        Args:
+            engine: GenerativeAI or ChatServiceClient instance
+            output_path: JSONL file the records are appended to
+            workers: Number of questions answered concurrently
+            limiter: Rate limiter applied before each question starts
+        """
+        self.engine = engine
+        self.workers = workers
+        self.limiter = limiter
+        self._output = open(output_path, "a", encoding="utf-8")
+        self._lock = threading.Lock()
+        self.counts = {"ok": 0, "error": 0}
+
+    def _answer(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        self.limiter.acquire()
+        tools: List[Dict[str, Any]] = []
+        first_token: List[float] = []
+        started = time.perf_counter()
+
+        def on_event(event: Dict[str, Any]) -> None:
+            if event["type"] == "tool_call":
+                tools.append({"name": event["name"], "arguments": event.get("arguments")})
+            elif event["type"] == "tool_result" and tools:
+                tools[-1]["elapsed"] = event.get("elapsed")
+            elif event["type"] == "token" and not first_token:
+                first_token.append(time.perf_counter() - started)
+
+        record = {
+            "id": item["id"],
+            "question": item["question"],
+            "started_at": datetime.now(timezone.utc).isoformat(),
+        }
+        try:
+            # Each question is its own conversation
+            session = _BatchSession(session_id=f"batch-{uuid.uuid4().hex}")
+            answer = self.engine.process_message_and_get_response(item["question"], session, on_event=on_event)
+            status = "error" if answer.startswith(ERROR_PREFIX) else "ok"
+            record.update(status=status, answer=answer)
+        except Exception as e:
+            logger.exception(f"Question {item['id']} failed")
+            record.update(status="error", answer=None, error=str(e))
+
+        record["tools"] = tools
+        record["timings"] = {
+            "total_s": round(time.perf_counter() - started, 3),
+            "first_token_s": round(first_token[0], 3) if first_token else None,
+        }
+        self._write(record)
+        return record
+
+    def _write(self, record: Dict[str, Any]) -> None:
+        with self._lock:
+            self._output.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._output.flush()
+            self.counts[record["status"]] += 1
+
+    def run(self, items: List[Dict[str, Any]]) -> Dict[str, int]:
+        """
+        Answer all items, reporting progress on stderr.
+
+        Returns:
+            Number of "ok" and "error" records written
+        """
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="batch") as pool:
+            futures = [pool.submit(self._answer, item) for item in items]
+            for done, future in enumerate(as_completed(futures), start=1):
+                record = future.result()
+                elapsed = time.perf_counter() - started
+                print(f"\r[{done}/{len(items)}] {done / elapsed:.2f} q/s  last={record['id']} ({record['status']})",
+                      end="", file=sys.stderr, flush=True)
+        print(file=sys.stderr)
+        self._output.close()
+        return self.counts
+
+
+class _BatchSession(dict):
+    """Minimal stand-in for Streamlit's session state."""
+
+    def __init__(self, session_id: str):
+        super().__init__(session_id=session_id)
+        self.messages: List[Dict[str, Any]] = []
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions with the TNC assistant.")
+    parser.add_argument("input", help="JSONL file with {'id', 'question'} records.")
+    parser.add_argument("-o", "--output", required=True, help="JSONL file to append answers to (enables resume).")
+    parser.add_argument("--workers", type=int, default=8, help="Questions answered concurrently (default: 8).")
+    parser.add_argument("--rate", type=float, default=0,
+                        help="Maximum questions started per second; 0 for no limit (default: 0).")
+    parser.add_argument("--burst", type=int, default=1, help="Questions that may start back to back (default: 1).")
+    parser.add_argument("--retry-errors", action="store_true", help="Re-run questions whose last record is an error.")
+    parser.add_argument("--limit", type=int, help="Answer at most this many pending questions.")
+    parser.add_argument("--service-url", help="Use the chat service at this URL instead of an in-process engine.")
+    args = parser.parse_args()
+
+    done = completed_ids(args.output, args.retry_errors)
+    items = [item for item in read_questions(args.input) if item["id"] not in done]
+    if args.limit is not None:
+        items = items[:args.limit]
+    print(f"{len(done)} already answered, {len(items)} to go", file=sys.stderr)
+    if not items:
+        return 0
+
+    engine: Optional[Any]
+    if args.service_url:
+        from LLM.client import ChatServiceClient
+        engine = ChatServiceClient(args.service_url)
+    else:
+        from LLM.llm import GenerativeAI
+        engine = GenerativeAI(debug_mode=False)
+        # Keep the progress line readable; logs still go to llm_debug.log
+        for handler in logging.getLogger().handlers:
+            if isinstance(handler, logging.StreamHandler) and not isinstance(handler, logging.FileHandler):
+                handler.setLevel(logging.WARNING)
+
+    runner = BatchRunner(engine, args.output, args.workers, RateLimiter(args.rate, args.burst))
+    counts = runner.run(items)
+    print(f"Finished: {counts['ok']} ok, {counts['error']} errors -> {args.output}", file=sys.stderr)
+    return 1 if counts["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
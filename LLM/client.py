@@ -0,0 +1,91 @@
+import http.client
+import json
+import logging
+import uuid
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import urlsplit
+from .request_context import profile_requested
+
+logger = logging.getLogger("ChatServiceClient")
+
+
+class ChatServiceClient:
+    """
+    Thin client for the headless chat service (LLM/service.py). Exposes the
+    same process_message_and_get_response interface as GenerativeAI, so the
+    Streamlit app can use either one.
+    """
+
+    def __init__(self, base_url: str, timeout: float = 300.0):
+        """
+        Args:
+            base_url: URL of the chat service, e.g. "http://127.0.0.1:8600"
+            timeout: Socket timeout in seconds for a whole conversation turn
+        """
+        parts = urlsplit(base_url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.port = parts.port or 80
+        self.timeout = timeout
+
+    def _stream(self, method: str, path: str, body: Optional[Dict[str, Any]] = None):
+        conn = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        data = json.dumps(body).encode("utf-8") if body is not None else None
+        headers = {"Content-Type": "application/json"} if data else {}
+        if profile_requested.get():
+            headers["X-Profile"] = "1"
+        conn.request(method, path, body=data, headers=headers)
+        res = conn.getresponse()
+        if res.status != 200:
+            raise RuntimeError(f"Chat service returned {res.status}: {res.read()[:200]!r}")
+        return conn, res
+
+    def process_message_and_get_response(self, prompt: str, session_state,
+                                         on_event: Optional[Callable[[Dict[str, Any]], None]] = None) -> str:
+        """
+        Send a user message to the chat service and collect the streamed answer.
+
+        Args:
+            prompt: The user's input message
+            session_state: Streamlit's session state; gains a "session_id" if missing
+            on_event: Optional callback receiving the streamed events
+
+        Returns:
+            The AI response string
+        """
+        if "session_id" not in session_state:
+            session_state["session_id"] = uuid.uuid4().hex
+        session_state.messages.append({"role": "user", "content": prompt})
+
+        answer, error = "", None
+        try:
+            conn, res = self._stream("POST", "/v1/chat",
+                                     {"session_id": session_state["session_id"], "message": prompt})
+            try:
+                for line in res:
+                    if not line.strip():
+                        continue
+                    event = json.loads(line)
+                    if on_event and event["type"] not in ("answer", "done"):
+                        on_event(event)
+                    if event["type"] == "answer":
+                        answer = event["content"]
+                    elif event["type"] == "error":
+                        error = event["message"]
+            finally:
+                conn.close()
+        except Exception as e:
+            logger.exception("Error talking to the chat service")
+            error = str(e)
+
+        if error and not answer:
+            # Answer the user message so the history keeps alternating
+            answer = f"Oops, something went wrong: {error}"
+
+        session_state.messages.append({"role": "assistant", "content": answer})
+        return answer
+
+    def reset_session(self, session_id: str) -> None:
+        """Ask the service to forget a session's history."""
+        conn, res = self._stream("DELETE", f"/v1/sessions/{session_id}")
+        res.read()
+        conn.close()
@@ -0,0 +1,177 @@
+"""
+A fake OpenAI-compatible chat completion endpoint for local testing of the
+backend pool, hedging and the agent loop without API keys or network access.
+
+It answers POST /v1/chat/completions (streamed or not) and GET /v1/models.
+When tools are offered and no tool result is in the conversation yet, it
+calls one tool; otherwise it returns a fixed answer. Latency, jitter and
+error rate are configurable so a degraded provider can be simulated.
+
+Usage:
+    python -m LLM.fake_backend --port 9901 --delay 0.2
+    python -m LLM.fake_backend --port 9902 --delay 3 --error-rate 0.3
+    LLM_BACKENDS='[{"name": "fast", "model": "fake", "base_url": "http://127.0.0.1:9901/v1"},
+                   {"name": "slow", "model": "fake", "base_url": "http://127.0.0.1:9902/v1"}]' streamlit run app.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+
+
+class FakeBackendConfig:
+    """Behavior of a fake backend."""
+
+    def __init__(self, delay: float = 0.0, jitter: float = 0.0, error_rate: float = 0.0,
+                 answer: str = "This is a test answer.", tool_name: Optional[str] = "find_website_section",
+                 tool_arguments: str = '{"topic": "volunteer"}', seed: Optional[int] = None,
+                 error_status: int = 500):
+        """
+        Args:
+            delay: Seconds before the response (or the first streamed chunk)
+            jitter: Extra random delay of up to this many seconds
+            error_rate: Share of requests answered with an error
+            answer: Final answer text
+            tool_name: Tool called when tools are offered, or None to never call one
+            tool_arguments: JSON arguments of that tool call
+            seed: Random seed for reproducible jitter and errors
+            error_status: HTTP status of the errors, e.g. 429 to simulate rate limits
+        """
+        self.delay = delay
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.answer = answer
+        self.tool_name = tool_name
+        self.tool_arguments = tool_arguments
+        self.requests = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self) -> Tuple[float, bool]:
+        """Delay and failure decision for the next request."""
+        with self._lock:
+            self.requests += 1
+            return self.delay + self._random.uniform(0, self.jitter), self._random.random() < self.error_rate
+
+
+def _reply(config: FakeBackendConfig, body: Dict[str, Any]) -> Dict[str, Any]:
+    has_tool_result = any(message.get("role") == "tool" for message in body.get("messages", []))
+    if body.get("tools") and config.tool_name and not has_tool_result:
+        return {"role": "assistant", "content": None, "tool_calls": [{
+            "id": f"call_{int(time.time() * 1000)}", "type": "function",
+            "function": {"name": config.tool_name, "arguments": config.tool_arguments},
+        }]}
+    return {"role": "assistant", "content": config.answer}
+
+
+class FakeBackendHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = FakeBackendConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: Dict[str, Any]) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _send_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        self._send_json(200, {"object": "list", "data": [{"id": "fake", "object": "model", "owned_by": "local"}]})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        delay, fail = self.config.draw()
+        time.sleep(delay)
+        if fail:
+            error_type = "rate_limit_exceeded" if self.config.error_status == 429 else "server_error"
+            self._send_json(self.config.error_status,
+                            {"error": {"message": "Simulated backend failure", "type": error_type}})
+            return
+
+        message = _reply(self.config, body)
+        base = {"id": "chatcmpl-fake", "created": int(time.time()), "model": body.get("model", "fake")}
+        if not body.get("stream"):
+            self._send_json(200, dict(base, object="chat.completion", choices=[
+                {"index": 0, "message": message, "finish_reason": "tool_calls" if message.get("tool_calls") else "stop"}
+            ], usage={"prompt_tokens": 100, "completion_tokens": 10, "total_tokens": 110}))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send(delta: Dict[str, Any], finish_reason: Optional[str] = None) -> None:
+            chunk = dict(base, object="chat.completion.chunk",
+                         choices=[{"index": 0, "delta": delta, "finish_reason": finish_reason}])
+            self._send_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+
+        if message.get("tool_calls"):
+            call = message["tool_calls"][0]
+            send({"role": "assistant", "tool_calls": [{"index": 0, "id": call["id"], "type": "function",
+                                                       "function": {"name": call["function"]["name"], "arguments": ""}}]})
+            send({"tool_calls": [{"index": 0, "function": {"arguments": call["function"]["arguments"]}}]})
+            send({}, "tool_calls")
+        else:
+            words = message["content"].split(" ")
+            for i, word in enumerate(words):
+                send({"content": word if i == len(words) - 1 else word + " "})
+            send({}, "stop")
+        self._send_chunk(b"data: [DONE]\n\n")
+        self._send_chunk(b"")
+
+
+def start_fake_backend(port: int = 0, **config: Any) -> Tuple[ThreadingHTTPServer, str]:
+    """
+    Start a fake backend in a daemon thread.
+
+    Args:
+        port: Port to listen on (0 picks a free one)
+        **config: FakeBackendConfig arguments
+
+    Returns:
+        Tuple of (server, base URL for the OpenAI client)
+    """
+    handler = type("ConfiguredFakeBackendHandler", (FakeBackendHandler,), {"config": FakeBackendConfig(**config)})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-backend", daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible chat completion endpoint.")
+    parser.add_argument("--port", type=int, default=9901)
+    parser.add_argument("--delay", type=float, default=0.0, help="Seconds before each response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random delay of up to this many seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests failing")
+    parser.add_argument("--error-status", type=int, default=500, help="HTTP status of the failures (429 for rate limits)")
+    parser.add_argument("--answer", default="This is a test answer.")
+    parser.add_argument("--tool", default="find_website_section", help="Tool to call first ('' for none)")
+    parser.add_argument("--tool-arguments", default='{"topic": "volunteer"}')
+    args = parser.parse_args()
+
+    handler = type("ConfiguredFakeBackendHandler", (FakeBackendHandler,), {"config": FakeBackendConfig(
+        delay=args.delay, jitter=args.jitter, error_rate=args.error_rate, error_status=args.error_status,
+        answer=args.answer,
+        tool_name=args.tool or None, tool_arguments=args.tool_arguments,
+    )})
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), handler)
+    print(f"Fake backend listening on http://127.0.0.1:{args.port}/v1")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,41 +1,65 @@
 # LLM/llm.py
 from datetime import datetime
+from types import SimpleNamespace
 import json
 import os
 import logging
 import time
-import streamlit as st
-from openai import OpenAI
-from colorama import Fore, Style, init
-from typing import List, Dict, Any, Optional, Union, Type
-from pydantic import BaseModel
+from typing import List, Dict, Any, Optional, Union, Type, Callable
+from TNC.memory import memory_tracked
+from TNC.settings import get_setting
+from .backends import BackendPool
+from .profiling import profile_span, profiled
 from .prompts import TNC_SYSTEM_PROMPT
+from .query_log import get_query_log
+from .request_context import current_on_event, current_question, current_session_id, session_id_of
+from .router import IntentRouter
+from .scheduler import get_scheduler, is_retryable_error
+from .tiers import PLANNER_MODELS, TierUsage, escalation_reason, estimate_tokens
+from .tool_select import ToolSelection, ToolSelector
 from .tools import (
     get_media_accounts,
     get_website_structure,
+    find_website_section,
     visit_any_web_site,
+    search_visited_pages,
     search_TNC_knowledge_base,
     event_search,
     news_search,
-    TOOLS
+    TOOLS,
+    JSONText
 )
 
-# Initialize colorama
-init()
+logger = logging.getLogger("GenerativeAI")
 
-# Configure logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("llm_debug.log"),
-        logging.StreamHandler()
-    ]
-)
+# Times a failed completion is queued again under the scheduler, which builds clients without retries.
+_SCHEDULED_RETRIES = 2
 
-GEMINI_BASE_URL = "https://generativelanguage.googleapis.com/v1beta/openai/"
+_logging_configured = False
 
-logger = logging.getLogger("GenerativeAI")
+
+def _configure_logging() -> None:
+    """
+    Configure file and console logging and colorama once per process.
+    Deferred until the first GenerativeAI instance so that importing this
+    module stays cheap.
+    """
+    global _logging_configured
+    if _logging_configured:
+        return
+    _logging_configured = True
+
+    from colorama import init
+    init()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler("llm_debug.log"),
+            logging.StreamHandler()
+        ]
+    )
 
 class _SingletonMeta(type):
     """
@@ -54,45 +78,64 @@ class GenerativeAI(metaclass=_SingletonMeta):
     Singleton class for Generative AI functions using OpenAI's API.
     """
 
-    def __init__(self, debug_mode=True):
+    def __init__(self, debug_mode=True, use_router=True):
         """
         Initialize the GenerativeAI instance with an API key from environment variables.
         
         Args:
             debug_mode: Whether to enable detailed debugging output
+            use_router: Whether to answer static-lookup questions with the local intent router
         """
+        _configure_logging()
         self.debug_mode = debug_mode
         logger.info("Initializing GenerativeAI instance")
         
-        # api_key = st.secrets["GEMINI_API_KEY"]
-        api_key = st.secrets["OPENAI_API_KEY"]
-        if not api_key:
+        # OpenAI-compatible backends (OpenAI, optionally Gemini) with hedged requests
+        try:
+            self.backends = BackendPool.from_settings()
+        except ValueError:
             logger.error("API_KEY environment variable is not set")
-            raise ValueError("API_KEY environment variable is not set")
-        
-        self.client = OpenAI(
-                        api_key=api_key,
-                        # base_url=GEMINI_BASE_URL
-                    )
+            raise
+        self.client = self.backends.backends[0].client
         self.system_message = TNC_SYSTEM_PROMPT
-        # self.model = "gemini-1.5-pro"
-        self.model = "gpt-4o"
-        logger.info(f"Using model: {self.model}")
+        self.model = self.backends.backends[0].model
+        logger.info(f"Using backends: {', '.join(f'{b.name} ({b.model})' for b in self.backends.backends)}")
+        
+        # Smaller, faster model tier for the tool-selection turns; LLM_PLANNER_MODEL
+        # overrides the model and "off" sends every turn to the synthesis tier
+        planner_model = get_setting("LLM_PLANNER_MODEL")
+        if planner_model is not None and str(planner_model).strip().lower() in ("", "off", "none", "0"):
+            self.planner = None
+        else:
+            models = {b.model: planner_model for b in self.backends.backends} if planner_model else PLANNER_MODELS
+            self.planner = self.backends.with_models(models, suffix="/planner")
+            if all(p.model == b.model for p, b in zip(self.planner.backends, self.backends.backends)):
+                self.planner = None
+        if self.planner:
+            logger.info(f"Planner tier: {', '.join(b.model for b in self.planner.backends)}")
         
         self.available_tools = TOOLS
         
         logger.info(f"Registered {len(self.available_tools)} tools")
         
+        # Offers each request only the tools (and prompt sections) its question needs
+        self.tool_selector = ToolSelector(self.available_tools)
+        
         # Map function names to their implementations
         self.tool_functions = {
             "get_media_accounts": get_media_accounts,
             "get_website_structure": get_website_structure,
+            "find_website_section": find_website_section,
             "visit_any_web_site": visit_any_web_site,
+            "search_visited_pages": search_visited_pages,
             "search_TNC_knowledge_base": search_TNC_knowledge_base,
             "news_search": news_search,
             "event_search": event_search
         }
         
+        # Local fast path for questions answerable from static data
+        self.router = IntentRouter() if use_router else None
+        
         logger.info("GenerativeAI initialization completed")
     
     def _debug_print(self, title: str, content: Any, is_function_call: bool = False) -> None:
@@ -105,6 +148,8 @@ class GenerativeAI(metaclass=_SingletonMeta):
             is_function_call: Whether this debug message is related to a function call
         """
         if self.debug_mode:
+            from colorama import Fore, Style
+            
             if isinstance(content, (dict, list)):
                 content_str = json.dumps(content, indent=2)
             else:
@@ -132,7 +177,7 @@ class GenerativeAI(metaclass=_SingletonMeta):
             JSON serializable version of the object
         """
         # If it's a Pydantic model, convert to dict
-        if isinstance(obj, BaseModel):
+        if hasattr(obj, "model_dump"):
             return obj.model_dump()
 
         # If it's a list, recursively process its items
@@ -147,42 +192,68 @@ class GenerativeAI(metaclass=_SingletonMeta):
         else:
             return obj
     
-    def generate_ai_response(self, question: str) -> str:
+    @profiled("generate_ai_response")
+    @memory_tracked("generate_ai_response", session=current_session_id.get)
+    def generate_ai_response(self, question: str, on_event: Optional[Callable[[Dict[str, Any]], None]] = None) -> str:
         """
         Generate a response to a single question without chat history.
+        
+        Args:
+            question: The user's question
+            on_event: Optional callback receiving progress events (see _process_completion_with_tools)
         """
         try:
             logger.info(f"Generating response for question: {question[:50]}...")
+            current_question.set(question)
+            routed_response = self._route_locally(question)
+            if routed_response is not None:
+                return routed_response
+            
             messages = [
                 {"role": "system", "content": self.system_message},
                 {"role": "user", "content": question}
             ]
 
             self._debug_print("Initial Messages", messages)
-            return self._process_completion_with_tools(messages)
+            return self._process_completion_with_tools(messages, on_event=on_event)
         except Exception as e:
             logger.exception("Error in generate_ai_response")
             return f"Oops, something went wrong with the AI service: {str(e)}"
     
-    def process_message_and_get_response(self, prompt: str, session_state) -> str:
+    @profiled("process_message_and_get_response")
+    @memory_tracked("process_message_and_get_response", session=current_session_id.get)
+    def process_message_and_get_response(self, prompt: str, session_state,
+                                         on_event: Optional[Callable[[Dict[str, Any]], None]] = None) -> str:
         """
         Process a new user message, update session state, and get AI response.
         
         Args:
             prompt: The user's input message
             session_state: Streamlit's session state containing message history
+            on_event: Optional callback receiving progress events (see _process_completion_with_tools)
             
         Returns:
             The AI response string
         """
         try:
             logger.info(f"Processing new message: {prompt[:50]}...")
+            current_question.set(prompt)
+            current_session_id.set(session_id_of(session_state))
             self._debug_print("Session state before processing", 
                              {"message_count": len(session_state.messages) if hasattr(session_state, 'messages') else 0})
             
+            # Follow-ups depend on earlier turns, so only first questions are routed locally
+            has_history = any(msg.get("role") == "user" for msg in session_state.messages)
+            
             # Add user message to session
             session_state.messages.append({"role": "user", "content": prompt})
             
+            # Answer static-lookup questions without the LLM loop
+            routed_response = self._route_locally(prompt, has_history)
+            if routed_response is not None:
+                session_state.messages.append({"role": "assistant", "content": routed_response})
+                return routed_response
+            
             # Format messages with chat history
             formatted_messages = [
                 {"role": "system", "content": self.system_message}
@@ -196,7 +267,7 @@ class GenerativeAI(metaclass=_SingletonMeta):
             
             # Get AI response
             start_time = time.time()
-            response = self._process_completion_with_tools(formatted_messages)
+            response = self._process_completion_with_tools(formatted_messages, on_event=on_event)
             elapsed_time = time.time() - start_time
             
             logger.info(f"Response generated in {elapsed_time:.2f} seconds")
@@ -211,7 +282,67 @@ class GenerativeAI(metaclass=_SingletonMeta):
             
         except Exception as e:
             logger.exception("Error in process_message_and_get_response")
-            return f"Oops, something went wrong: {str(e)}"
+            error_reply = f"Oops, something went wrong: {str(e)}"
+            # Answer the user message so the history keeps alternating
+            if session_state.messages and session_state.messages[-1].get("role") == "user":
+                session_state.messages.append({"role": "assistant", "content": error_reply})
+            return error_reply
+    
+    def warm_up(self) -> None:
+        """
+        Pre-open upstream connections and prime static caches, so the first
+        user request after a deploy does not pay for them.
+        """
+        from TNC.news_index import get_news_index
+        from TNC.parse_pool import warm_up as start_parse_workers
+        from TNC.scraper import get_client
+        from TNC.site_index import find_sections_json
+        
+        start_time = time.time()
+        get_client().warm_up()
+        # Starts the newsroom poller so "latest news" is answered from the index
+        get_news_index()
+        # Opens the query log and starts its cache warmer if QUERY_WARM is on
+        get_query_log()
+        # Spawning parse workers takes a moment; do it before the first large page
+        start_parse_workers()
+        
+        for backend in self.backends.backends:
+            try:
+                # Cheap authenticated call that opens the backend's connection pool
+                backend.client.models.list()
+            except Exception:
+                logger.warning(f"Could not pre-open the {backend.name} connection", exc_info=True)
+        
+        for topic in ("donate", "volunteer", "events", "member"):
+            find_sections_json(topic)
+        if self.router:
+            self.router.classify("warm up")
+        
+        logger.info(f"Warm-up completed in {time.time() - start_time:.2f} seconds")
+    
+    def _route_locally(self, question: str, has_history: bool = False) -> Optional[str]:
+        """
+        Try to answer a question with the local intent router.
+
+        Args:
+            question: The user's message
+            has_history: Whether the session already has earlier turns
+
+        Returns:
+            The routed answer, or None if the question needs the full agent
+        """
+        if not self.router:
+            return None
+        
+        start_time = time.time()
+        response = self.router.route(question, has_history)
+        if response is not None:
+            elapsed_time = time.time() - start_time
+            logger.info(f"Answered by local router in {elapsed_time * 1000:.1f} ms "
+                        f"(hit rate {self.router.hit_rate():.1%})")
+            self._debug_print("Router response", response)
+        return response
     
     def _execute_tool(self, function_name: str, function_args: Dict[str, Any]) -> Any:
         """
@@ -235,10 +366,20 @@ class GenerativeAI(metaclass=_SingletonMeta):
                 return {"error": f"Function {function_name} not implemented"}
 
             # Execute the function with the provided arguments
-            if function_args:
-                result = function(**function_args)
-            else:
-                result = function()
+            query_log = get_query_log()
+            start = time.perf_counter()
+            with profile_span(function_name):
+                try:
+                    if function_args:
+                        result = function(**function_args)
+                    else:
+                        result = function()
+                except Exception:
+                    if query_log is not None:
+                        query_log.record(function_name, function_args, time.perf_counter() - start, error=True)
+                    raise
+            if query_log is not None:
+                query_log.record(function_name, function_args, time.perf_counter() - start, result)
 
             # Convert any Pydantic models to dictionaries
             serialized_result = self._serialize_pydantic_model(result)
@@ -253,18 +394,179 @@ class GenerativeAI(metaclass=_SingletonMeta):
             logger.exception(f"Error executing function {function_name}")
             return {"error": str(e)}
     
-    def _process_completion_with_tools(self, messages: List[Dict[str, str]], max_turns: int = 3) -> str:
+    def _create_completion(self, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None,
+                           on_event: Optional[Callable[[Dict[str, Any]], None]] = None, tier: str = "synthesis",
+                           usage: Optional[TierUsage] = None) -> Any:
+        """
+        Request a chat completion once the scheduler admits it and return its
+        message. While the call waits for a slot, its queue position is sent
+        to the request's event callback as "queued" events.
+        
+        See _send_completion for the arguments.
+        """
+        scheduler = get_scheduler()
+        if scheduler is None:
+            return self._send_completion(messages, tools, on_event, tier, usage)
+        
+        request_on_event = current_on_event.get()
+        
+        def on_wait(position: int, waiting: int) -> None:
+            logger.info(f"Completion queued at position {position} of {waiting}")
+            if request_on_event:
+                request_on_event({"type": "queued", "position": position, "waiting": waiting})
+        
+        streamed = []
+        
+        def forward(event: Dict[str, Any]) -> None:
+            streamed.append(True)
+            on_event(event)
+        
+        # Earlier turns of a request go first, so new questions are not stuck behind long tool loops.
+        # Clients do not retry under the scheduler; a failed call queues again behind the (possibly
+        # lowered) limit instead, as many times as the client would have retried
+        for retry in range(_SCHEDULED_RETRIES + 1):
+            try:
+                with scheduler.slot(current_session_id.get(), turn=usage.completions if usage else 0,
+                                    on_wait=on_wait):
+                    return self._send_completion(messages, tools, forward if on_event else None, tier, usage)
+            except Exception as e:
+                # Tokens already shown cannot be taken back
+                if retry == _SCHEDULED_RETRIES or streamed or not is_retryable_error(e):
+                    raise
+                logger.info(f"Completion failed ({e}), retrying through the scheduler")
+                time.sleep(0.5 * 2 ** retry)
+    
+    def _send_completion(self, messages: List[Dict[str, Any]], tools: Optional[List[Dict[str, Any]]] = None,
+                         on_event: Optional[Callable[[Dict[str, Any]], None]] = None, tier: str = "synthesis",
+                         usage: Optional[TierUsage] = None) -> Any:
+        """
+        Request a chat completion and return its message.
+        
+        Without an event callback this is a plain blocking request. With one,
+        the completion is streamed: content deltas are forwarded as "token"
+        events and tool call deltas are assembled into complete calls. Either
+        way the request is hedged across the configured backends.
+        
+        Args:
+            messages: List of message objects with 'role' and 'content'
+            tools: Tool schemas to offer, or None for a plain completion
+            on_event: Optional callback receiving "token" events
+            tier: "planner" for the small tool-selection model, "synthesis" for the main model
+            usage: Optional per-request record of latency, tokens and cost per tier
+            
+        Returns:
+            Message object with 'content' and 'tool_calls' attributes
+        """
+        pool = self.planner if tier == "planner" and self.planner else self.backends
+        request = {"model": pool.backends[0].model, "messages": messages, "temperature": 0}
+        if tools:
+            request["tools"] = tools
+        
+        if usage is not None and tools:
+            usage.tool_completions += 1
+        
+        start_time = time.time()
+        if on_event is None:
+            completion = pool.create(request)
+            if usage is not None:
+                tokens = completion.usage
+                usage.record(tier, completion.model or request["model"], time.time() - start_time,
+                             tokens.prompt_tokens if tokens else 0, tokens.completion_tokens if tokens else 0)
+            return completion.choices[0].message
+        
+        content_parts = []
+        tool_calls = {}
+        model = request["model"]
+        for chunk in pool.stream(request):
+            model = getattr(chunk, "model", None) or model
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if delta.content:
+                content_parts.append(delta.content)
+                on_event({"type": "token", "content": delta.content})
+            for tc in delta.tool_calls or []:
+                call = tool_calls.setdefault(tc.index, SimpleNamespace(
+                    id="", type="function", function=SimpleNamespace(name="", arguments="")))
+                if tc.id:
+                    call.id = tc.id
+                if tc.function and tc.function.name:
+                    call.function.name += tc.function.name
+                if tc.function and tc.function.arguments:
+                    call.function.arguments += tc.function.arguments
+        
+        if usage is not None:
+            # Streamed responses carry no usage data
+            arguments = "".join(call.function.arguments for call in tool_calls.values())
+            usage.record(tier, model, time.time() - start_time, estimate_tokens(json.dumps(request["messages"]) + json.dumps(tools or [])),
+                         estimate_tokens("".join(content_parts) + arguments), estimated=True)
+        
+        return SimpleNamespace(
+            content="".join(content_parts) or None,
+            tool_calls=[tool_calls[index] for index in sorted(tool_calls)] or None
+        )
+    
+    def _process_completion_with_tools(self, messages: List[Dict[str, str]], max_turns: int = 3,
+                                       on_event: Optional[Callable[[Dict[str, Any]], None]] = None) -> str:
         """
         Process a completion request with tool calling capabilities.
         
         Args:
             messages: List of message objects with 'role' and 'content'
             max_turns: Maximum number of tool-calling iterations
+            on_event: Optional callback receiving progress events as dictionaries:
+                {"type": "token", "content"} for streamed answer text,
+                {"type": "tool_call", "name", "arguments"} before a tool runs,
+                {"type": "tool_result", "name", "elapsed"} after it finished and
+                {"type": "queued", "position", "waiting"} while a completion waits for a slot
             
         Returns:
             String response from the AI
         """
+        selection = self._select_tools(messages)
+        usage = TierUsage()
+        event_token = current_on_event.set(on_event)
+        try:
+            return self._run_tool_loop(messages, max_turns, on_event, usage, selection)
+        finally:
+            current_on_event.reset(event_token)
+            logger.info(f"Tier usage: {usage.summary()}")
+            saved = self.tool_selector.record(selection, usage.completions, usage.tool_completions)
+            logger.info(f"Tool pruning: {len(selection.tools)}/{len(self.available_tools)} tools offered "
+                        f"({selection.reason}), ~{saved} prompt tokens saved over {usage.completions} completion(s)")
+    
+    def _select_tools(self, messages: List[Dict[str, Any]]) -> ToolSelection:
+        """
+        Choose the tools for a request and put the matching system prompt in
+        front of the conversation. Custom system messages are left untouched
+        and get every tool.
+        """
+        if not messages or messages[0].get("role") != "system" or messages[0].get("content") != TNC_SYSTEM_PROMPT:
+            return self.tool_selector.full("custom system message")
+        selection = self.tool_selector.select(messages)
+        messages[0] = {"role": "system", "content": selection.system_prompt}
+        return selection
+    
+    def _calls_pruned_tool(self, message: Any, selection: ToolSelection) -> bool:
+        """Whether a response asks for a registered tool that was left out of the request."""
+        return any(call.function.name in self.tool_functions and not selection.offers(call.function.name)
+                   for call in message.tool_calls or [])
+    
+    def _run_tool_loop(self, messages: List[Dict[str, str]], max_turns: int,
+                       on_event: Optional[Callable[[Dict[str, Any]], None]], usage: TierUsage,
+                       selection: ToolSelection) -> str:
+        """
+        The tool-calling loop behind _process_completion_with_tools.
+        
+        Tool-selection turns go to the planner tier. A planner turn is redone
+        by the synthesis tier (which then keeps the remaining turns) when it
+        is malformed or looks unsure; once the planner stops calling tools,
+        the synthesis tier writes the final answer. A turn that asks for a
+        tool the selection left out is redone with the full tool set.
+        """
         turn_count = 0
+        planning = self.planner is not None
+        seen_calls = set()
         
         logger.info(f"Starting tool-calling process with max {max_turns} turns")
         
@@ -277,19 +579,33 @@ class GenerativeAI(metaclass=_SingletonMeta):
                                  {"message_count": len(messages)})
                 
                 start_time = time.time()
-                response = self.client.chat.completions.create(
-                    model=self.model,
-                    messages=messages,
-                    temperature=0,
-                    tools=self.available_tools
-                )
+                tier = "planner" if planning else "synthesis"
+                logger.info(f"Turn {turn_count} routed to the {tier} tier")
+                # Planner turns are never shown to the user, so they are not streamed
+                response_message = self._create_completion(messages, selection.tools,
+                                                           None if planning else on_event, tier=tier, usage=usage)
+                if self._calls_pruned_tool(response_message, selection):
+                    logger.info(f"Turn {turn_count} asked for a pruned tool, retrying with the full tool set")
+                    selection.widen(self.available_tools, self.system_message, "widened after a pruned tool call")
+                    messages[0] = {"role": "system", "content": selection.system_prompt}
+                    response_message = self._create_completion(messages, selection.tools,
+                                                               None if planning else on_event, tier=tier, usage=usage)
+                if planning:
+                    reason = escalation_reason(response_message, selection.tools, seen_calls,
+                                               first_turn=not seen_calls)
+                    if reason:
+                        logger.info(f"Escalating turn {turn_count} to the synthesis tier: {reason}")
+                        usage.escalations += 1
+                        planning = False
+                        response_message = self._create_completion(messages, selection.tools, on_event,
+                                                                   tier="synthesis", usage=usage)
+                    elif not response_message.tool_calls:
+                        logger.info("Planner finished selecting tools, handing over to the synthesis tier")
+                        break
                 elapsed_time = time.time() - start_time
                 
                 logger.info(f"LLM API response received in {elapsed_time:.2f} seconds")
                 
-                # Get the message from the response
-                response_message = response.choices[0].message
-                
                 # Debug information about the response
                 has_tool_calls = bool(response_message.tool_calls)
                 tool_call_count = len(response_message.tool_calls) if has_tool_calls else 0
@@ -313,7 +629,13 @@ class GenerativeAI(metaclass=_SingletonMeta):
                 messages.append({
                     "role": "assistant",
                     "content": response_message.content or "",
-                    "tool_calls": response_message.tool_calls or []
+                    "tool_calls": [
+                        {
+                            "id": tc.id,
+                            "type": "function",
+                            "function": {"name": tc.function.name, "arguments": tc.function.arguments}
+                        } for tc in (response_message.tool_calls or [])
+                    ]
                 })
                 
                 # If no tool calls were made, return the content
@@ -326,20 +648,29 @@ class GenerativeAI(metaclass=_SingletonMeta):
                     # Extract function details
                     function_name = tool_call.function.name
                     function_args = json.loads(tool_call.function.arguments)
+                    seen_calls.add((function_name, json.dumps(function_args, sort_keys=True)))
                     
                     logger.info(f"Processing tool call: {function_name}")
                     self._debug_print(f"Function {function_name} arguments", function_args, is_function_call=True)
                     
                     # Execute the appropriate function
                     if function_name in self.tool_functions:
+                        if on_event:
+                            on_event({"type": "tool_call", "name": function_name, "arguments": function_args})
+                        
                         start_time = time.time()
                         function_response = self._execute_tool(function_name, function_args)
                         elapsed_time = time.time() - start_time
                         
                         logger.info(f"Function {function_name} executed in {elapsed_time:.2f} seconds")
+                        if on_event:
+                            on_event({"type": "tool_result", "name": function_name, "elapsed": round(elapsed_time, 3)})
                         
                         # Debug the function response (truncate if too long)
-                        function_response_str = json.dumps(function_response)
+                        if isinstance(function_response, JSONText):
+                            function_response_str = str(function_response)
+                        else:
+                            function_response_str = json.dumps(function_response)
                         self._debug_print(
                             f"Function {function_name} response", 
                             function_response_str[:500] + "..." if len(function_response_str) > 500 else function_response_str,
@@ -351,7 +682,7 @@ class GenerativeAI(metaclass=_SingletonMeta):
                             "role": "tool",
                             "tool_call_id": tool_call.id,
                             "name": function_name,
-                            "content": json.dumps(function_response)
+                            "content": function_response_str
                         })
                     else:
                         logger.warning(f"Function {function_name} not found in tool registry")
@@ -370,16 +701,12 @@ class GenerativeAI(metaclass=_SingletonMeta):
             logger.info("Requesting final response after tool calls")
             
             start_time = time.time()
-            final_response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                temperature=0
-            )
+            final_message = self._create_completion(messages, on_event=on_event, usage=usage)
             elapsed_time = time.time() - start_time
             
             logger.info(f"Final response received in {elapsed_time:.2f} seconds")
             
-            final_content = final_response.choices[0].message.content.strip()
+            final_content = (final_message.content or "").strip()
             self._debug_print("Final response content", final_content[:500] + "..." if len(final_content) > 500 else final_content)
             
             return final_content
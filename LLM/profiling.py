@@ -0,0 +1,413 @@
+"""
+On-demand profiling of single chat requests.
+
+A profiled request is sampled by a background thread that reads the request
+thread's stack every few milliseconds; tool calls are recorded as spans.
+Work the request hands to a thread pool through TNC.tasks.in_submitter_context
+(backend hedging, batched searches, prefetches) is sampled on the pool thread
+while it runs, under a "[thread <name>]" root frame. Work in other processes
+(the parse pool) shows up only as the request thread waiting for it.
+The result is written to PROFILE_DIR as collapsed stacks (for flamegraph.pl
+or speedscope) and/or a speedscope JSON file.
+
+A request is profiled when PROFILE is on, at random with probability
+PROFILE_SAMPLE_RATE, or when it asks for it (X-Profile header of the chat
+service, ?profile=1 in the app) and PROFILE_ALLOW_REQUEST is on. Otherwise
+nothing is sampled or recorded. Only the newest PROFILE_MAX_FILES profile
+files are kept.
+
+Usage:
+    python -m LLM.profiling top profiles/<file>.folded
+"""
+import argparse
+import contextlib
+import functools
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from TNC.settings import get_flag, get_setting
+from TNC.tasks import register_task_hook
+from .request_context import current_session_id, profile_requested
+
+logger = logging.getLogger("Profiling")
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Frames of the task wrapper on pool threads; sampled stacks start below them.
+_TASKS_FILE = os.path.join(_ROOT, "TNC", "tasks.py")
+
+# Profile of the request running in the current context, if it is being profiled.
+_active: ContextVar[Optional["RequestProfile"]] = ContextVar("active_profile", default=None)
+
+
+@functools.lru_cache(maxsize=1)
+def profiling_settings() -> Dict[str, Any]:
+    """PROFILE, PROFILE_SAMPLE_RATE, PROFILE_ALLOW_REQUEST, PROFILE_INTERVAL_MS, PROFILE_DIR, PROFILE_FORMAT and PROFILE_MAX_FILES, read once."""
+    return {
+        "always": get_flag("PROFILE", False),
+        "allow_request": get_flag("PROFILE_ALLOW_REQUEST", False),
+        "sample_rate": float(get_setting("PROFILE_SAMPLE_RATE", 0) or 0),
+        "interval": float(get_setting("PROFILE_INTERVAL_MS", 5)) / 1000,
+        "directory": get_setting("PROFILE_DIR", os.path.join(_ROOT, "profiles")),
+        "format": get_setting("PROFILE_FORMAT", "speedscope"),
+        "max_files": int(get_setting("PROFILE_MAX_FILES", 200)),
+    }
+
+
+def _frame_name(frame: Any) -> str:
+    code = frame.f_code
+    path = code.co_filename
+    if path.startswith(_ROOT):
+        path = os.path.relpath(path, _ROOT)
+    else:
+        path = "/".join(path.replace("\\", "/").split("/")[-2:])
+    return f"{code.co_name} ({path}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """
+    Samples the stack of one thread, plus pool threads attached while they
+    run its work, at a fixed interval and folds the samples into collapsed
+    stacks.
+    """
+
+    def __init__(self, thread_id: int, skip_frames: int = 0, interval: float = 0.005, max_depth: int = 128):
+        """
+        Args:
+            thread_id: Thread to sample
+            skip_frames: Outermost frames to leave out (those above the profiled call)
+            interval: Seconds between samples
+            max_depth: Deepest stack recorded; deeper frames are cut off
+        """
+        self.thread_id = thread_id
+        self.skip_frames = skip_frames
+        self.interval = interval
+        self.max_depth = max_depth
+        self.counts: Counter = Counter()
+        self.seconds: Dict[Tuple[str, ...], float] = {}
+        # Attached pool thread -> root frame of its samples, e.g. "[thread kb-search_0]"
+        self._workers: Dict[int, str] = {}
+        self._workers_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def attach(self, thread_id: int, name: str) -> None:
+        """Also sample a pool thread while it runs work of the profiled request."""
+        with self._workers_lock:
+            self._workers[thread_id] = f"[thread {name}]"
+
+    def detach(self, thread_id: int) -> None:
+        with self._workers_lock:
+            self._workers.pop(thread_id, None)
+
+    def _stack(self, frame: Any, skip_frames: int) -> Tuple[str, ...]:
+        stack = []
+        while frame is not None:
+            stack.append(frame)
+            frame = frame.f_back
+        stack.reverse()
+        return tuple(_frame_name(f) for f in stack[skip_frames:skip_frames + self.max_depth])
+
+    def _worker_stack(self, frame: Any, root: str) -> Tuple[str, ...]:
+        stack = []
+        # Stop at the task wrapper, leaving out the pool's own frames
+        while frame is not None and frame.f_code.co_filename != _TASKS_FILE:
+            stack.append(frame)
+            frame = frame.f_back
+        stack.reverse()
+        return (root,) + tuple(_frame_name(f) for f in stack[:self.max_depth]) if stack else ()
+
+    def _sample(self) -> List[Tuple[str, ...]]:
+        frames = sys._current_frames()
+        stacks = []
+        frame = frames.get(self.thread_id)
+        if frame is not None:
+            stacks.append(self._stack(frame, self.skip_frames))
+        with self._workers_lock:
+            workers = list(self._workers.items())
+        for thread_id, root in workers:
+            frame = frames.get(thread_id)
+            if frame is not None:
+                stacks.append(self._worker_stack(frame, root))
+        return [stack for stack in stacks if stack]
+
+    def _run(self) -> None:
+        last = time.perf_counter()
+        while not self._stop.wait(self.interval):
+            stacks = self._sample()
+            now = time.perf_counter()
+            for stack in stacks:
+                self.counts[stack] += 1
+                # Weighted by the time actually covered, which is longer than
+                # the interval while the GIL is busy
+                self.seconds[stack] = self.seconds.get(stack, 0.0) + now - last
+            last = now
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def _thread_of(stack: Tuple[str, ...]) -> str:
+    """Root frame of a pool thread's samples, or "" for the request thread."""
+    return stack[0] if stack[0].startswith("[thread ") else ""
+
+
+class RequestProfile:
+    """Samples and tool spans of one profiled request."""
+
+    def __init__(self, label: str, skip_frames: int, interval: float):
+        self.label = label
+        self.id = uuid.uuid4().hex[:8]
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.elapsed = 0.0
+        # (name, start, end) in seconds since the request started
+        self.spans: List[Tuple[str, float, float]] = []
+        self.sampler = SamplingProfiler(threading.get_ident(), skip_frames=skip_frames, interval=interval)
+
+    def now(self) -> float:
+        return time.perf_counter() - self._start
+
+    def start(self) -> None:
+        self.sampler.start()
+
+    def stop(self) -> None:
+        self.sampler.stop()
+        self.elapsed = self.now()
+
+    def collapsed(self) -> str:
+        """Samples as collapsed stacks: one "frame;frame;frame count" line per stack."""
+        return "".join(f"{';'.join((self.label,) + stack)} {count}\n"
+                       for stack, count in self.sampler.counts.most_common())
+
+    def speedscope(self) -> Dict[str, Any]:
+        """Samples and tool spans in the speedscope file format."""
+        frames: List[Dict[str, Any]] = []
+        index: Dict[str, int] = {}
+
+        def frame_id(name: str) -> int:
+            if name not in index:
+                index[name] = len(frames)
+                frames.append({"name": name})
+            return index[name]
+
+        # Pool threads run concurrently with the request thread, so each gets its own profile
+        by_thread: Dict[str, List[Tuple[Tuple[str, ...], float]]] = {}
+        for stack, seconds in self.sampler.seconds.items():
+            by_thread.setdefault(_thread_of(stack), []).append((stack, seconds))
+        sampled = [
+            {
+                "type": "sampled", "name": f"{self.label} {thread or '(samples)'}", "unit": "seconds",
+                "startValue": 0, "endValue": sum(seconds for _, seconds in stacks),
+                "samples": [[frame_id(name) for name in (self.label,) + stack] for stack, _ in stacks],
+                "weights": [seconds for _, seconds in stacks],
+            }
+            for thread, stacks in sorted(by_thread.items())
+        ]
+        events = []
+        for name, start, end in sorted(self.spans, key=lambda span: (span[1], -span[2])):
+            events.append({"type": "O", "frame": frame_id(name), "at": start})
+            events.append({"type": "C", "frame": frame_id(name), "at": end})
+        events.sort(key=lambda event: (event["at"], event["type"] == "O"))
+        spans = {
+            "type": "evented", "name": f"{self.label} (tool calls)", "unit": "seconds",
+            "startValue": 0, "endValue": self.elapsed, "events": events,
+        }
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": f"{self.label} {self.id}",
+            "exporter": "tnc_search",
+            "shared": {"frames": frames},
+            "profiles": sampled + [spans],
+        }
+
+    def summary(self, limit: int = 5) -> str:
+        """The frames with the most samples on top of the request thread's stack."""
+        own = Counter()
+        for stack, count in self.sampler.counts.items():
+            if not _thread_of(stack):
+                own[stack[-1]] += count
+        total = sum(own.values()) or 1
+        return ", ".join(f"{name} {count / total:.0%}" for name, count in own.most_common(limit))
+
+    def write(self, directory: str, fmt: str) -> List[str]:
+        """
+        Write the profile files.
+
+        Args:
+            directory: Output directory, created if missing
+            fmt: "collapsed", "speedscope" or "both"
+
+        Returns:
+            Paths of the written files
+        """
+        os.makedirs(directory, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(self.started_at))
+        # The session id is only known once the request has started
+        base = os.path.join(directory, f"{stamp}-{current_session_id.get() or 'nosession'}-{self.id}")
+        paths = []
+        if fmt in ("collapsed", "both"):
+            with open(f"{base}.folded", "w", encoding="utf-8") as f:
+                f.write(self.collapsed())
+            paths.append(f"{base}.folded")
+        if fmt in ("speedscope", "both"):
+            with open(f"{base}.speedscope.json", "w", encoding="utf-8") as f:
+                json.dump(self.speedscope(), f)
+            paths.append(f"{base}.speedscope.json")
+        return paths
+
+
+def _prune_profiles(directory: str, max_files: int) -> None:
+    """Delete the oldest profile files in directory beyond the newest max_files (0 keeps all)."""
+    if max_files <= 0:
+        return
+    files = []
+    for name in os.listdir(directory):
+        if name.endswith((".folded", ".speedscope.json")):
+            path = os.path.join(directory, name)
+            try:
+                files.append((os.path.getmtime(path), path))
+            except OSError:
+                pass
+    files.sort(reverse=True)
+    for _, path in files[max_files:]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def should_profile() -> bool:
+    """Whether the request starting in the current context is profiled."""
+    settings = profiling_settings()
+    if settings["allow_request"] and profile_requested.get():
+        return True
+    return settings["always"] or (settings["sample_rate"] > 0 and random.random() < settings["sample_rate"])
+
+
+@contextlib.contextmanager
+def _profiling(label: str):
+    settings = profiling_settings()
+    # Leave out the frames above the profiled call (thread start-up, Streamlit, ...)
+    depth, frame = 0, sys._getframe(2)
+    while frame is not None:
+        depth, frame = depth + 1, frame.f_back
+    profile = RequestProfile(label, skip_frames=depth, interval=settings["interval"])
+    token = _active.set(profile)
+    profile.start()
+    try:
+        yield profile
+    finally:
+        profile.stop()
+        _active.reset(token)
+        try:
+            paths = profile.write(settings["directory"], settings["format"])
+            _prune_profiles(settings["directory"], settings["max_files"])
+            logger.info(f"Profiled {label} in {profile.elapsed:.2f}s, {sum(profile.sampler.counts.values())} "
+                        f"samples (top: {profile.summary()}), written to {', '.join(paths)}")
+        except OSError:
+            logger.warning(f"Could not write the profile of {label}", exc_info=True)
+
+
+def profiled(label: str) -> Callable:
+    """
+    Decorator that profiles calls of a request entry point when
+    should_profile() says so. Nested profiled calls join the outer profile.
+    """
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _active.get() is not None or not should_profile():
+                return function(*args, **kwargs)
+            with _profiling(label):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+@contextlib.contextmanager
+def _span(profile: RequestProfile, name: str):
+    start = profile.now()
+    try:
+        yield
+    finally:
+        profile.spans.append((name, start, profile.now()))
+
+
+@contextlib.contextmanager
+def _sample_pool_thread(profile: RequestProfile):
+    thread = threading.current_thread()
+    profile.sampler.attach(thread.ident, thread.name)
+    try:
+        yield
+    finally:
+        profile.sampler.detach(thread.ident)
+
+
+def _pool_task_hook():
+    """Samples the pool thread running a task submitted by a profiled request."""
+    profile = _active.get()
+    if profile is None or profile.sampler.thread_id == threading.get_ident():
+        return contextlib.nullcontext()
+    return _sample_pool_thread(profile)
+
+
+register_task_hook(_pool_task_hook)
+
+
+def profile_span(name: str):
+    """
+    Context manager recording a named span (e.g. a tool call) in the profile
+    of the current request; a no-op when the request is not profiled.
+    """
+    profile = _active.get()
+    if profile is None:
+        return contextlib.nullcontext()
+    return _span(profile, name)
+
+
+def _top(path: str, limit: int) -> None:
+    own: Counter = Counter()
+    inclusive: Counter = Counter()
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            stack, _, count = line.rstrip("\n").rpartition(" ")
+            frames = stack.split(";")
+            own[frames[-1]] += int(count)
+            for name in set(frames):
+                inclusive[name] += int(count)
+    total = sum(own.values()) or 1
+    print(f"{total} samples")
+    print(f"{'self':>6} {'total':>6}  frame")
+    for name, count in own.most_common(limit):
+        print(f"{count / total:6.1%} {inclusive[name] / total:6.1%}  {name}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Inspect request profiles.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    top = commands.add_parser("top", help="Print the frames with the most samples in a collapsed stacks file")
+    top.add_argument("path")
+    top.add_argument("--limit", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.command == "top":
+        _top(args.path, args.limit)
+
+
+if __name__ == "__main__":
+    main()
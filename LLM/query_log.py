@@ -0,0 +1,492 @@
+"""
+Query log of tool calls, analytics over it, and a cache warmer for the
+most popular queries.
+
+Every tool call is appended to QUERY_LOG_PATH as one JSON line with the
+tool, its normalized arguments, latency and result count. The warmer
+re-fetches the pages behind the most frequent searches, news searches and
+page visits shortly before their stored copies expire, so the head of the
+query distribution is always served from the page store. It only works
+while no tool call has come in for a while, and stops a pass as soon as
+one does.
+
+Usage:
+    python -m LLM.query_log report --days 7 --limit 20
+    python -m LLM.query_log warm --top 20
+"""
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from TNC.page_store import get_page_store
+from TNC.parse_pool import parser_for
+from TNC.prefetch import normalize_url
+from TNC.scraper import get_client, page_cache_ttl
+from TNC.settings import get_flag, get_setting
+from TNC.snapshot import get_snapshot
+from TNC.tnc_api import normalize_query
+from .request_context import current_session_id
+
+logger = logging.getLogger("QueryLog")
+
+# Check the log's size for rotation every this many records.
+_ROTATE_CHECK_EVERY = 500
+
+
+def _normalize_text(text: Any) -> str:
+    # The same form search_url and news_search_url put in listing URLs, so warmed keys match live traffic
+    return normalize_query(text)
+
+
+def normalize_args(tool: str, args: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Bring tool arguments into a canonical form, so that the same query asked
+    in different spelling counts once.
+
+    Args:
+        tool: Name of the tool
+        args: Arguments the model passed
+
+    Returns:
+        The normalized arguments; knowledge-base searches always use "queries"
+    """
+    args = dict(args or {})
+    if tool == "search_TNC_knowledge_base":
+        queries = ([args["query"]] if args.get("query") else []) + list(args.get("queries") or [])
+        return {"queries": list(dict.fromkeys(_normalize_text(q) for q in queries if q and str(q).strip()))}
+    if tool == "visit_any_web_site" and args.get("url"):
+        return {"url": normalize_url(str(args["url"]))}
+    return {name: _normalize_text(value) if isinstance(value, str) else value for name, value in sorted(args.items())}
+
+
+def query_keys(tool: str, args: Dict[str, Any]) -> List[Tuple[str, str]]:
+    """
+    Split a logged call into the queries it ran, as (tool, key) pairs; a
+    knowledge-base search with several queries counts for each of them.
+    """
+    if tool == "search_TNC_knowledge_base":
+        return [(tool, query) for query in args.get("queries", [])]
+    if tool == "visit_any_web_site":
+        return [(tool, args["url"])] if "url" in args else []
+    return [(tool, json.dumps(args, sort_keys=True) if len(args) != 1 else str(next(iter(args.values()))))]
+
+
+def result_count(result: Any) -> Optional[int]:
+    """Number of items a tool returned, 0 for errors, None for results that are not lists."""
+    if isinstance(result, dict) and "error" in result:
+        return 0
+    if isinstance(result, dict) and isinstance(result.get("results"), list):
+        # Batched search where some queries failed
+        result = result["results"]
+    if isinstance(result, (list, tuple)):
+        return len(result)
+    return None
+
+
+class QueryStats:
+    """Aggregated calls of one query."""
+
+    def __init__(self, tool: str, key: str):
+        self.tool = tool
+        self.key = key
+        self.calls = 0
+        self.errors = 0
+        self.empty = 0
+        self.results = 0
+        self.counted = 0
+        self.latencies: List[float] = []
+        self.sessions: Set[str] = set()
+        self.last_seen = 0.0
+
+    def add(self, record: Dict[str, Any]) -> None:
+        self.calls += 1
+        self.errors += bool(record.get("error"))
+        self.latencies.append(record.get("ms", 0.0))
+        if record.get("results") is not None:
+            self.counted += 1
+            self.results += record["results"]
+            self.empty += record["results"] == 0
+        if record.get("session"):
+            self.sessions.add(record["session"])
+        self.last_seen = max(self.last_seen, record.get("ts", 0.0))
+
+    def percentile(self, share: float) -> float:
+        latencies = sorted(self.latencies)
+        return latencies[min(len(latencies) - 1, int(share * len(latencies)))] if latencies else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "tool": self.tool, "query": self.key, "calls": self.calls, "sessions": len(self.sessions),
+            "avg_ms": sum(self.latencies) / self.calls if self.calls else 0.0, "p95_ms": self.percentile(0.95),
+            "avg_results": self.results / self.counted if self.counted else None,
+            "empty_rate": self.empty / self.counted if self.counted else None, "errors": self.errors,
+        }
+
+
+def aggregate(records: Iterable[Dict[str, Any]], tools: Optional[Set[str]] = None) -> List[QueryStats]:
+    """
+    Aggregate log records by query.
+
+    Args:
+        records: Records as written by QueryLog.record
+        tools: Only count these tools; None counts all
+
+    Returns:
+        Per-query statistics, most called first
+    """
+    stats: Dict[Tuple[str, str], QueryStats] = {}
+    for record in records:
+        if tools is not None and record["tool"] not in tools:
+            continue
+        for key in query_keys(record["tool"], record.get("args", {})):
+            if key not in stats:
+                stats[key] = QueryStats(*key)
+            stats[key].add(record)
+    return sorted(stats.values(), key=lambda s: (-s.calls, -len(s.sessions), -s.last_seen))
+
+
+class QueryLog:
+    """Append-only JSON lines log of tool calls, rotated to a single backup when it grows too large."""
+
+    def __init__(self, path: str, max_bytes: int = 50 << 20):
+        """
+        Args:
+            path: Log file
+            max_bytes: Size at which the log is moved to "<path>.1" and started afresh
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.last_call = 0.0
+        self._lock = threading.Lock()
+        self._file = None
+        self._since_check = 0
+
+    def _open(self) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def _rotate_if_needed(self) -> None:
+        self._since_check = 0
+        try:
+            if os.path.getsize(self.path) < self.max_bytes:
+                return
+        except OSError:
+            return
+        self._file.close()
+        os.replace(self.path, f"{self.path}.1")
+        self._open()
+        logger.info(f"Rotated the query log to {self.path}.1")
+
+    def record(self, tool: str, args: Optional[Dict[str, Any]], seconds: float, result: Any = None,
+               error: bool = False) -> None:
+        """
+        Append one tool call. Never raises; a failed write is logged and dropped.
+
+        Args:
+            tool: Name of the tool
+            args: Arguments the model passed
+            seconds: How long the call took
+            result: The tool's result, before serialization
+            error: Whether the call failed
+        """
+        self.last_call = time.monotonic()
+        count = result_count(result)
+        entry = {
+            "ts": round(time.time(), 3), "tool": tool, "args": normalize_args(tool, args),
+            "ms": round(seconds * 1000, 1), "results": count,
+            "error": error or (isinstance(result, dict) and "error" in result),
+            "session": current_session_id.get(),
+        }
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        try:
+            with self._lock:
+                if self._file is None:
+                    self._open()
+                # One write per line, so processes appending to the same file do not interleave
+                self._file.write(line)
+                self._file.flush()
+                self._since_check += 1
+                if self._since_check >= _ROTATE_CHECK_EVERY:
+                    self._rotate_if_needed()
+        except (OSError, ValueError):
+            logger.warning(f"Could not write to the query log {self.path}", exc_info=True)
+
+    def idle_seconds(self) -> float:
+        """Seconds since the last tool call recorded by this process."""
+        return time.monotonic() - self.last_call if self.last_call else float("inf")
+
+    def read(self, since: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """
+        Read the logged calls, oldest first, including the rotated backup.
+
+        Args:
+            since: Only calls at or after this Unix time
+
+        Yields:
+            Log records; malformed lines (e.g. cut off by a crash) are skipped
+        """
+        for path in (f"{self.path}.1", self.path):
+            try:
+                f = open(path, encoding="utf-8")
+            except FileNotFoundError:
+                continue
+            with f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if since is None or record.get("ts", 0) >= since:
+                        yield record
+
+    def top(self, limit: int = 20, days: float = 7, tools: Optional[Set[str]] = None) -> List[QueryStats]:
+        """The most called queries of the last days."""
+        return aggregate(self.read(since=time.time() - days * 86400), tools=tools)[:limit]
+
+
+# Tools whose results come from fetched pages, and the parser kind of those pages.
+WARMABLE_TOOLS = {
+    "search_TNC_knowledge_base": "search",
+    "news_search": "news",
+    "visit_any_web_site": "page",
+}
+
+
+def warm_target(tool: str, key: str) -> Optional[Tuple[str, str]]:
+    """The (url, parser kind) behind a query, or None if it needs no fetch."""
+    import TNC.tnc_api as tnc
+
+    if tool == "search_TNC_knowledge_base":
+        return tnc.search_url(key), "search"
+    if tool == "news_search":
+        return tnc.news_search_url(key), "news"
+    if tool == "visit_any_web_site":
+        return key, "page"
+    return None
+
+
+def _has_content(parsed: Any) -> bool:
+    """Whether a parse result has something to serve: search results, news cards or page text."""
+    if isinstance(parsed, dict):
+        return bool(parsed.get("text"))
+    return bool(parsed)
+
+
+class QueryWarmer:
+    """
+    Keeps the pages behind the most popular queries in the page store by
+    fetching them again shortly before their stored copy expires.
+    """
+
+    def __init__(self, log: QueryLog, top_n: int = 20, interval: float = 600.0, days: float = 7,
+                 idle: float = 30.0, hours: Optional[Set[int]] = None):
+        """
+        Args:
+            log: The query log to rank queries by
+            top_n: Number of queries kept warm
+            interval: Seconds between warm passes
+            days: Age of the oldest calls counted for popularity
+            idle: Seconds without tool calls before a pass may start or continue
+            hours: Local hours in which passes run; None for any hour
+        """
+        self.log = log
+        self.top_n = top_n
+        self.interval = interval
+        self.days = days
+        self.idle = idle
+        self.hours = hours
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.stats = {"passes": 0, "refreshed": 0, "fresh": 0, "skipped": 0, "interrupted": 0, "failed": 0}
+
+    def targets(self) -> List[Tuple[str, str]]:
+        """(url, kind) of the pages behind the most called queries, most called first."""
+        targets = []
+        for stats in self.log.top(self.top_n, days=self.days, tools=set(WARMABLE_TOOLS)):
+            target = warm_target(stats.tool, stats.key)
+            if target is not None and target not in targets:
+                targets.append(target)
+        return targets
+
+    def warm(self, force: bool = False) -> Dict[str, int]:
+        """
+        Run one warm pass.
+
+        Args:
+            force: Fetch every target again, and do not yield to live tool calls
+
+        Returns:
+            Counts of refreshed, still fresh, snapshot-served and failed targets;
+            a failed fetch, or a page that parses to nothing, keeps the stored copy
+        """
+        # Copies older than this would expire before the next pass
+        refresh_after = max(0.0, page_cache_ttl() - self.interval - 60)
+        store, snapshot = get_page_store(), get_snapshot()
+        counts = {"refreshed": 0, "fresh": 0, "skipped": 0, "failed": 0}
+        start = time.perf_counter()
+        for url, kind in self.targets():
+            if not force and self.log.idle_seconds() < self.idle:
+                self.stats["interrupted"] += 1
+                logger.info("Warm pass interrupted by a live request")
+                break
+            if snapshot is not None and (snapshot.by_source(url, kind=kind) or snapshot.by_url(url, kind=kind)):
+                counts["skipped"] += 1
+                continue
+            age = store.age(url)
+            if not force and age is not None and age < refresh_after:
+                counts["fresh"] += 1
+                continue
+            try:
+                # Fetch without storing: the stored copy is only replaced by a page that parses to results
+                data = get_client().fetch(url)
+                parsed = store.parse_cached(kind, data.decode("utf-8"), parser_for(kind))
+                if not _has_content(parsed):
+                    logger.warning(f"Not warming {url}: the fetched page parsed to no results")
+                    counts["failed"] += 1
+                    continue
+                store.put(url, data)
+                counts["refreshed"] += 1
+            except Exception:
+                logger.warning(f"Could not warm {url}", exc_info=True)
+                counts["failed"] += 1
+        for name, count in counts.items():
+            self.stats[name] += count
+        self.stats["passes"] += 1
+        logger.info(f"Warm pass in {time.perf_counter() - start:.1f}s: {counts['refreshed']} refreshed, "
+                    f"{counts['fresh']} still fresh, {counts['skipped']} in the snapshot, {counts['failed']} failed")
+        return counts
+
+    def _due(self) -> bool:
+        return self.hours is None or time.localtime().tm_hour in self.hours
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            if not self._due():
+                continue
+            # Wait for a quiet moment, but not past the next pass
+            deadline = time.monotonic() + self.interval / 2
+            while self.log.idle_seconds() < self.idle and time.monotonic() < deadline:
+                if self._stop.wait(self.idle - self.log.idle_seconds()):
+                    return
+            if self.log.idle_seconds() < self.idle:
+                continue
+            try:
+                self.warm()
+            except Exception:
+                logger.warning("Warm pass failed", exc_info=True)
+
+    def start(self) -> None:
+        """Start warming in a daemon thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="query-warmer", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def report(self) -> Dict[str, int]:
+        return dict(self.stats)
+
+
+def parse_hours(value: Optional[str]) -> Optional[Set[int]]:
+    """Parse an hour list such as "0-6,22,23" into a set of hours; empty means any hour."""
+    if not value or not str(value).strip():
+        return None
+    hours = set()
+    for part in str(value).split(","):
+        first, _, last = part.strip().partition("-")
+        hours.update(range(int(first), int(last or first) + 1))
+    return hours
+
+
+def url_popularity(days: float = 7) -> Dict[str, float]:
+    """Calls per page URL in the last days: page visits and, for searches, their listing page."""
+    log = get_query_log()
+    if log is None:
+        return {}
+    popularity: Dict[str, float] = {}
+    for stats in aggregate(log.read(since=time.time() - days * 86400), tools=set(WARMABLE_TOOLS)):
+        target = warm_target(stats.tool, stats.key)
+        if target is not None:
+            popularity[target[0]] = popularity.get(target[0], 0.0) + stats.calls
+    return popularity
+
+
+_log: Optional[QueryLog] = None
+_warmer: Optional[QueryWarmer] = None
+_log_lock = threading.Lock()
+
+
+def _new_log() -> QueryLog:
+    return QueryLog(get_setting("QUERY_LOG_PATH", "query_log.jsonl"),
+                    max_bytes=int(float(get_setting("QUERY_LOG_MAX_MB", 50)) * (1 << 20)))
+
+
+def _new_warmer(log: QueryLog) -> QueryWarmer:
+    return QueryWarmer(
+        log,
+        top_n=int(get_setting("QUERY_WARM_TOP", 20)),
+        interval=float(get_setting("QUERY_WARM_INTERVAL", 600)),
+        days=float(get_setting("QUERY_WARM_DAYS", 7)),
+        idle=float(get_setting("QUERY_WARM_IDLE", 30)),
+        hours=parse_hours(get_setting("QUERY_WARM_HOURS")),
+    )
+
+
+def get_query_log() -> Optional[QueryLog]:
+    """
+    Return the process-wide query log (QUERY_LOG_PATH, rotated at
+    QUERY_LOG_MAX_MB), or None if QUERY_LOG is off. Starts the warmer on
+    first use if QUERY_WARM is on.
+    """
+    global _log, _warmer
+    if _log is None and get_flag("QUERY_LOG", True):
+        with _log_lock:
+            if _log is None:
+                log = _new_log()
+                if get_flag("QUERY_WARM", False):
+                    _warmer = _new_warmer(log)
+                    _warmer.start()
+                _log = log
+    return _log
+
+
+def _print_report(log: QueryLog, days: float, limit: int, tool: Optional[str]) -> None:
+    rows = log.top(limit, days=days, tools={tool} if tool else None)
+    print(f"{'calls':>6} {'sess':>5} {'avg ms':>8} {'p95 ms':>8} {'results':>7} {'empty':>6}  tool: query")
+    for stats in rows:
+        row = stats.as_dict()
+        results = "-" if row["avg_results"] is None else f"{row['avg_results']:.1f}"
+        empty = "-" if row["empty_rate"] is None else f"{row['empty_rate']:.0%}"
+        print(f"{row['calls']:6d} {row['sessions']:5d} {row['avg_ms']:8.0f} {row['p95_ms']:8.0f} "
+              f"{results:>7} {empty:>6}  {row['tool']}: {row['query']}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Analyse the tool query log and warm the page store.")
+    parser.add_argument("--path", default=get_setting("QUERY_LOG_PATH", "query_log.jsonl"))
+    commands = parser.add_subparsers(dest="command", required=True)
+    report = commands.add_parser("report", help="Print the most called queries")
+    report.add_argument("--days", type=float, default=7)
+    report.add_argument("--limit", type=int, default=20)
+    report.add_argument("--tool", help="Only this tool")
+    warm = commands.add_parser("warm", help="Fetch the pages behind the most called queries now")
+    warm.add_argument("--top", type=int, default=int(get_setting("QUERY_WARM_TOP", 20)))
+    warm.add_argument("--days", type=float, default=7)
+    warm.add_argument("--force", action="store_true", help="Fetch pages even if their stored copy is fresh")
+    args = parser.parse_args()
+
+    log = QueryLog(args.path)
+    if args.command == "report":
+        _print_report(log, args.days, args.limit, args.tool)
+    elif args.command == "warm":
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+        print(QueryWarmer(log, top_n=args.top, days=args.days).warm(force=args.force))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Optional
+
+# The user message being answered, so tools can take the whole question into account.
+current_question: ContextVar[Optional[str]] = ContextVar("current_question", default=None)
+
+# Id of the session the current request belongs to, if known.
+current_session_id: ContextVar[Optional[str]] = ContextVar("current_session_id", default=None)
+
+# Whether the current request asked to be profiled (see LLM/profiling.py).
+profile_requested: ContextVar[bool] = ContextVar("profile_requested", default=False)
+
+# Progress event callback of the current request, for events raised below the
+# tool loop (e.g. the queue position of a completion waiting for a slot).
+current_on_event: ContextVar[Optional[Callable[[Dict[str, Any]], None]]] = ContextVar("current_on_event", default=None)
+
+
+def session_id_of(session_state: Any) -> Optional[str]:
+    """
+    Read the session id from Streamlit's session state or one of its stand-ins
+    (a dict, or an object with a session_id attribute).
+    """
+    try:
+        if "session_id" in session_state:
+            return session_state["session_id"]
+    except TypeError:
+        pass
+    return getattr(session_state, "session_id", None)
@@ -0,0 +1,287 @@
+import logging
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from TNC.context import TNC_in_social_media
+from TNC.site_index import SITE_PAGES
+
+logger = logging.getLogger("IntentRouter")
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# "X" only means the platform when written as a capitalized word of its own.
+_X_RE = re.compile(r"\bX\b")
+
+# "how do I ..." and "how to ..." ask for a place to go; any other "how" asks for an explanation.
+_PROCEDURAL_HOW_RE = re.compile(r"\bhow\s+(?:do|can|could|should|would)\s+(?:i|we)\b|\bhow\s+to\b", re.IGNORECASE)
+
+# Words that never carry intent on their own.
+_STOPWORDS = {
+    "a", "an", "the", "is", "are", "to", "of", "on", "in", "for", "and", "or",
+    "my", "your", "their", "its", "i", "me", "we", "you", "can", "do", "does",
+    "what", "whats", "s", "tnc", "tncs", "nature", "conservancy", "please",
+    "with", "at", "about", "it", "this", "that", "how", "there", "up", "be",
+}
+
+# Folds common variants onto the word used in the site map / platform names.
+_ALIASES = {
+    "tweet": "twitter", "tweets": "twitter",
+    "insta": "instagram", "ig": "instagram", "fb": "facebook",
+    "donation": "donate", "donations": "donate", "donating": "donate",
+    "volunteering": "volunteer", "volunteers": "volunteer",
+    "event": "events", "members": "member", "membership": "member",
+    "renewal": "renew", "renewing": "renew",
+    "calculator": "calculate", "report": "reports",
+}
+
+# Tokens that signal the user wants a link or a place rather than an explanation.
+_NAVIGATION_CUES = {
+    "where", "wheres", "link", "links", "url", "page", "website", "site", "find",
+    "go", "navigate", "sign", "signup", "handle", "account", "accounts",
+    "profile", "follow", "want", "become", "join", "channel",
+}
+
+# Tokens that signal a content or recency question the agent should research
+# instead; any of them keeps the question away from the router.
+_CONTENT_CUES = {
+    "why", "news", "latest", "recent", "recently", "lately", "new", "today",
+    "week", "month", "year", "now", "currently", "post", "posted", "posts",
+    "video", "article", "research", "explain", "history", "impact", "project",
+    "projects", "about", "information", "info",
+}
+
+# Penalty for each word the matched page or platform does not account for,
+# e.g. "texas" in "where does TNC work in Texas".
+_UNEXPLAINED_PENALTY = 0.5
+
+_SOCIAL_CUES = {"social", "media", "follow", "handle", "account", "accounts", "profile"}
+
+
+def _tokens(text: str) -> List[str]:
+    """Lowercases, tokenizes and alias-folds a piece of text."""
+    tokens = _TOKEN_RE.findall(_X_RE.sub("twitter", text).lower().replace("'", ""))
+    return [_ALIASES.get(token, token) for token in tokens]
+
+
+class IntentRouter:
+    """
+    Keyword router that answers static-lookup questions (social media accounts,
+    website sections) locally, without going through the LLM tool loop.
+    """
+
+    def __init__(self, threshold: float = 0.6):
+        """
+        Args:
+            threshold: Minimum confidence required to answer locally
+        """
+        self.threshold = threshold
+        self._pages = [
+            {**entry, "tokens": set(_tokens(entry["title"])) - _STOPWORDS,
+             "section_tokens": set(_tokens(entry["section"])) - _STOPWORDS}
+            for entry in SITE_PAGES
+        ]
+        self._lock = threading.Lock()
+        self.stats = {"total": 0, "hits": 0, "social_media": 0, "website_section": 0}
+
+    def _classify_social(self, tokens: List[str], procedural: bool) -> Tuple[float, Dict[str, str]]:
+        words = set(tokens) - _STOPWORDS
+        # A platform name alone ("what's on your Facebook") is not a request for the account
+        if not (procedural or _NAVIGATION_CUES & words):
+            return 0.0, {}
+        unexplained = words - set(TNC_in_social_media) - _SOCIAL_CUES - _NAVIGATION_CUES
+        penalty = _UNEXPLAINED_PENALTY * len(unexplained)
+        platforms = {name: url for name, url in TNC_in_social_media.items() if name in words}
+        if platforms:
+            return max(0.0, 0.9 - penalty), platforms
+        if "social" in words or "media" in words:
+            return max(0.0, 0.8 - penalty), dict(TNC_in_social_media)
+        return 0.0, {}
+
+    def _classify_website(self, tokens: List[str], procedural: bool) -> Tuple[float, List[Dict[str, str]]]:
+        words = set(tokens) - _STOPWORDS
+        if not words:
+            return 0.0, []
+        scored = []
+        for page in self._pages:
+            if not page["tokens"]:
+                continue
+            overlap = len(page["tokens"] & words) / len(page["tokens"])
+            if overlap:
+                scored.append((overlap, page))
+        if not scored:
+            return 0.0, []
+        scored.sort(key=lambda item: (-item[0], len(item[1]["section"])))
+        best = scored[0][0]
+        matches = [page for score, page in scored if score == best][:3]
+        title_words = set().union(*(page["tokens"] for page in matches))
+        # The cue must come from the question, not from the title it matched ("Where We Work")
+        if not (procedural or (_NAVIGATION_CUES & words) - title_words):
+            return 0.0, []
+        section_words = set().union(*(page["section_tokens"] for page in matches))
+        unexplained = words - title_words - section_words - _NAVIGATION_CUES
+        return max(0.0, best - _UNEXPLAINED_PENALTY * len(unexplained)), matches
+
+    def classify(self, question: str) -> Tuple[Optional[str], float, Any]:
+        """
+        Classify a question into a static-lookup intent. Only explicit
+        navigation requests ("where is", "link to", "how do I") qualify, and
+        any content or recency cue leaves the question to the agent.
+
+        Args:
+            question: The user's message
+
+        Returns:
+            Tuple of (intent or None, confidence, matched data)
+        """
+        tokens = _tokens(question)
+        if not tokens:
+            return None, 0.0, None
+
+        # Research-flavoured questions belong to the agent.
+        procedural = bool(_PROCEDURAL_HOW_RE.search(question))
+        if _CONTENT_CUES & set(tokens) or ("how" in tokens and not procedural):
+            return None, 0.0, None
+        penalty = 0.05 * max(0, len(tokens) - 10)
+
+        social_score, social = self._classify_social(tokens, procedural)
+        website_score, pages = self._classify_website(tokens, procedural)
+
+        if social_score >= website_score and social_score > 0:
+            return "social_media", max(0.0, social_score - penalty), social
+        if website_score > 0:
+            return "website_section", max(0.0, website_score - penalty), pages
+        return None, 0.0, None
+
+    def _render(self, intent: str, data: Any) -> str:
+        if intent == "social_media":
+            if len(data) == 1:
+                name, url = next(iter(data.items()))
+                return f"You can follow The Nature Conservancy on {name.capitalize()} here: [{url}]({url})"
+            lines = [f"- **{name.capitalize()}**: [{url}]({url})" for name, url in data.items()]
+            return "You can follow The Nature Conservancy on social media:\n\n" + "\n".join(lines)
+
+        if len(data) == 1:
+            page = data[0]
+            return f"You can find **{page['title']}** on TNC's website here: [{page['url']}]({page['url']})"
+        lines = []
+        for page in data:
+            section = f" ({page['section']})" if page["section"] else ""
+            lines.append(f"- **{page['title']}**{section}: [{page['url']}]({page['url']})")
+        return "Here are the relevant pages on TNC's website:\n\n" + "\n".join(lines)
+
+    def route(self, question: str, has_history: bool = False) -> Optional[str]:
+        """
+        Answer a question locally when the router is confident enough.
+
+        Args:
+            question: The user's message
+            has_history: Whether the session already has earlier turns; follow-ups
+                ("where is that page?") depend on them and always go to the agent
+
+        Returns:
+            The markdown answer, or None when the question should go to the agent
+        """
+        if has_history:
+            intent, confidence, data = None, 0.0, None
+        else:
+            intent, confidence, data = self.classify(question)
+        hit = intent is not None and confidence >= self.threshold
+
+        with self._lock:
+            self.stats["total"] += 1
+            if hit:
+                self.stats["hits"] += 1
+                self.stats[intent] += 1
+
+        logger.info(f"Router intent={intent} confidence={confidence:.2f} hit={hit} "
+                    f"hit_rate={self.hit_rate():.1%}")
+        return self._render(intent, data) if hit else None
+
+    def hit_rate(self) -> float:
+        """Fraction of routed questions that were answered locally."""
+        return self.stats["hits"] / self.stats["total"] if self.stats["total"] else 0.0
+
+
+# Labelled questions used to tune the router: (question, expected intent or None).
+ROUTER_EVAL_SAMPLES = [
+    ("What's TNC's Instagram handle?", "social_media"),
+    ("Where can I follow you on social media?", "social_media"),
+    ("Link to the TikTok account", "social_media"),
+    ("youtube channel", "social_media"),
+    ("Where's the donate page?", "website_section"),
+    ("How do I become a member?", "website_section"),
+    ("Where can I renew my membership?", "website_section"),
+    ("Link to the carbon footprint calculator", "website_section"),
+    ("I want to volunteer, where do I sign up?", "website_section"),
+    ("Is TNC on LinkedIn?", None),
+    ("Page about where you work in Africa", None),
+    ("What did TNC post on Instagram about wolves last week?", None),
+    ("What research is TNC doing on climate change adaptation?", None),
+    ("Tell me about TNC's coral reef protection", None),
+    ("What's new with TNC's conservation efforts?", None),
+    ("How are my donations used by TNC?", None),
+    ("Any volunteer events in Denver this month?", None),
+]
+
+# Edge cases written alongside the rules (near-miss wording, ambiguous "X",
+# questions that mention a platform or section but ask for content), kept so
+# a rule change that breaks one shows up. The rules were tuned with these in
+# view, so they are a regression set, not an estimate of unseen precision.
+ROUTER_REGRESSION_SAMPLES = [
+    ("Where can I find TNC on Facebook?", "social_media"),
+    ("Link to your LinkedIn profile", "social_media"),
+    ("What's the URL of the Twitter account?", "social_media"),
+    ("Which accounts should I follow on social media?", "social_media"),
+    ("Where do I donate?", "website_section"),
+    ("How can I give monthly?", "website_section"),
+    ("Link to the reports page", "website_section"),
+    ("How do I attend events?", "website_section"),
+    ("Where is the Take Action page?", "website_section"),
+    ("What's on your Facebook page lately about fires?", None),
+    ("Where does TNC work in Texas?", None),
+    ("Where can I find information on how TNC uses donations?", None),
+    ("x", None),
+    ("X", None),
+    ("Where can I find X-ray images of fish?", None),
+    ("How does TNC decide where to work?", None),
+    ("Where are the wolves being reintroduced?", None),
+    ("What did the latest report say about oceans?", None),
+    ("Find volunteer opportunities near Seattle", None),
+    ("Where can I see your YouTube videos on coral reefs?", None),
+    ("How do I calculate my carbon footprint for a flight to Paris?", None),
+]
+
+
+def evaluate_router(router: IntentRouter, samples=ROUTER_EVAL_SAMPLES) -> Dict[str, float]:
+    """
+    Measure hit rate and precision of the router on labelled questions.
+
+    Args:
+        router: The router to evaluate
+        samples: List of (question, expected intent or None) pairs
+
+    Returns:
+        Dictionary with hit_rate, precision and recall
+    """
+    hits = correct = expected_hits = 0
+    for question, expected in samples:
+        intent, confidence, _ = router.classify(question)
+        routed = intent if intent is not None and confidence >= router.threshold else None
+        expected_hits += expected is not None
+        if routed is not None:
+            hits += 1
+            correct += routed == expected
+    return {
+        "samples": len(samples),
+        "hit_rate": hits / len(samples) if samples else 0.0,
+        "precision": correct / hits if hits else 1.0,
+        "recall": correct / expected_hits if expected_hits else 1.0,
+    }
+
+
+if __name__ == "__main__":
+    router = IntentRouter()
+    for name, samples in (("tuning", ROUTER_EVAL_SAMPLES), ("regression", ROUTER_REGRESSION_SAMPLES)):
+        report = evaluate_router(router, samples)
+        print(f"{name}: samples={report['samples']} hit_rate={report['hit_rate']:.1%} "
+              f"precision={report['precision']:.1%} recall={report['recall']:.1%}")
@@ -0,0 +1,230 @@
+import itertools
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+from TNC.settings import get_setting
+
+logger = logging.getLogger("Scheduler")
+
+# Seconds of waiting that make up for one turn of priority, so that later
+# turns of a long tool loop are not starved by a stream of first turns.
+_AGING_SECONDS = 5.0
+
+# Minimum seconds between two halvings of the limit, so that a burst of
+# rate-limit errors from calls started together counts once.
+_DECREASE_INTERVAL = 2.0
+
+
+class _Waiter:
+    def __init__(self, session_id: str, turn: int, seq: int):
+        self.session_id = session_id
+        self.turn = turn
+        self.seq = seq
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+        self.position = 0
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """Whether an exception is a provider's rate-limit (HTTP 429) response."""
+    return getattr(error, "status_code", None) == 429 or type(error).__name__ == "RateLimitError"
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """Whether a failed completion is worth retrying: the errors the OpenAI client itself retries."""
+    status = getattr(error, "status_code", None)
+    if status is not None:
+        return status in (408, 409, 429) or status >= 500
+    return type(error).__name__ in ("APIConnectionError", "APITimeoutError", "RateLimitError")
+
+
+class CompletionScheduler:
+    """
+    Admission control for chat completions: at most `limit` run at once,
+    and waiting calls are served by priority instead of arrival order.
+
+    Priority goes to earlier turns of a request (a user's first turn before
+    another user's third tool turn), then to sessions with fewer calls
+    running, then to the longest waiting call; waiting also raises priority,
+    so no turn is starved. The limit halves when the provider answers with
+    rate-limit errors and grows back by one call per `limit` successes.
+    """
+
+    def __init__(self, max_concurrent: int = 8, min_concurrent: int = 1, timeout: float = 120.0):
+        """
+        Args:
+            max_concurrent: Most completions running at once
+            min_concurrent: The limit never drops below this after rate-limit errors
+            timeout: Seconds a call may wait for a slot before it fails
+        """
+        self.max_concurrent = max(1, max_concurrent)
+        self.min_concurrent = max(1, min(min_concurrent, self.max_concurrent))
+        self.timeout = timeout
+        self.limit = float(self.max_concurrent)
+        self.active = 0
+        self._active_by_session: Dict[str, int] = {}
+        self._waiters: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._last_decrease = 0.0
+        self._cond = threading.Condition()
+        self.stats = {"calls": 0, "queued": 0, "wait_seconds": 0.0, "max_wait_seconds": 0.0,
+                      "rate_limited": 0, "timeouts": 0}
+
+    def _priority(self, waiter: _Waiter, now: float):
+        aged_turn = waiter.turn - (now - waiter.enqueued_at) / _AGING_SECONDS
+        return aged_turn, self._active_by_session.get(waiter.session_id, 0), waiter.seq
+
+    def _grant(self) -> None:
+        """Hand free slots to the best waiters and renumber the rest. Called with the lock held."""
+        now = time.monotonic()
+        changed = False
+        while self._waiters and self.active < int(self.limit):
+            best = min(self._waiters, key=lambda waiter: self._priority(waiter, now))
+            self._waiters.remove(best)
+            self._start(best.session_id)
+            best.granted = changed = True
+        for position, waiter in enumerate(sorted(self._waiters, key=lambda w: self._priority(w, now)), start=1):
+            if waiter.position != position:
+                waiter.position = position
+                changed = True
+        if changed:
+            self._cond.notify_all()
+
+    def _start(self, session_id: str) -> None:
+        self.active += 1
+        self._active_by_session[session_id] = self._active_by_session.get(session_id, 0) + 1
+
+    def acquire(self, session_id: Optional[str], turn: int = 0,
+                on_wait: Optional[Callable[[int, int], None]] = None) -> None:
+        """
+        Wait for a slot.
+
+        Args:
+            session_id: Session making the call; calls without one share a bucket
+            turn: Number of completions the request has already made
+            on_wait: Called in the waiting thread with (position, waiting calls)
+                whenever the call's queue position changes
+
+        Raises:
+            TimeoutError: No slot became free within the timeout
+        """
+        session_id = session_id or "-"
+        with self._cond:
+            self.stats["calls"] += 1
+            if not self._waiters and self.active < int(self.limit):
+                self._start(session_id)
+                return
+
+            waiter = _Waiter(session_id, turn, next(self._seq))
+            self._waiters.append(waiter)
+            self.stats["queued"] += 1
+            self._grant()
+            reported, deadline = None, waiter.enqueued_at + self.timeout
+            while not waiter.granted:
+                if waiter.position != reported and on_wait is not None:
+                    reported = waiter.position
+                    # Reported without the lock, so a slow callback does not hold up the scheduler
+                    self._cond.release()
+                    try:
+                        on_wait(reported, len(self._waiters))
+                    finally:
+                        self._cond.acquire()
+                    continue
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._waiters.remove(waiter)
+                    self.stats["timeouts"] += 1
+                    self._grant()
+                    raise TimeoutError(f"No completion slot free after {self.timeout:.0f}s "
+                                       f"({self.active} running, {len(self._waiters)} waiting)")
+                # Positions also change as waiters age, hence the periodic wake-up
+                self._cond.wait(min(remaining, 1.0))
+                if not waiter.granted:
+                    self._grant()
+
+            waited = time.monotonic() - waiter.enqueued_at
+            self.stats["wait_seconds"] += waited
+            self.stats["max_wait_seconds"] = max(self.stats["max_wait_seconds"], waited)
+        if waited > 1.0:
+            logger.info(f"Completion for session {session_id} (turn {turn}) waited {waited:.1f}s for a slot")
+
+    def release(self, session_id: Optional[str], error: Optional[BaseException] = None) -> None:
+        """
+        Free a slot and adapt the limit to how the call ended.
+
+        Args:
+            session_id: Session that made the call
+            error: The exception the call raised, if any
+        """
+        session_id = session_id or "-"
+        with self._cond:
+            self.active -= 1
+            remaining = self._active_by_session.get(session_id, 1) - 1
+            if remaining:
+                self._active_by_session[session_id] = remaining
+            else:
+                self._active_by_session.pop(session_id, None)
+
+            # Rate limits were already reported by the backend pool through rate_limited()
+            if error is None and self.limit < self.max_concurrent:
+                self.limit = min(float(self.max_concurrent), self.limit + 1 / self.limit)
+            self._grant()
+
+    def rate_limited(self, backend: str = "") -> None:
+        """
+        Halve the limit after a rate-limit response. Called by the backend pool
+        for every attempt that got one, including hedged attempts whose failure
+        the pool absorbed.
+
+        Args:
+            backend: Name of the backend that answered with the rate limit
+        """
+        with self._cond:
+            self.stats["rate_limited"] += 1
+            now = time.monotonic()
+            if now - self._last_decrease >= _DECREASE_INTERVAL:
+                self._last_decrease = now
+                self.limit = max(float(self.min_concurrent), self.limit / 2)
+                logger.warning(f"Rate limited by {backend or 'the provider'}, completion limit lowered to "
+                               f"{int(self.limit)}")
+
+    @contextmanager
+    def slot(self, session_id: Optional[str], turn: int = 0, on_wait: Optional[Callable[[int, int], None]] = None):
+        """Hold a slot for the duration of a with block; see acquire and release."""
+        self.acquire(session_id, turn, on_wait)
+        try:
+            yield
+        except BaseException as e:
+            self.release(session_id, e)
+            raise
+        self.release(session_id)
+
+    def report(self) -> Dict[str, Any]:
+        """Current limit and load, and waiting statistics since the process started."""
+        with self._cond:
+            stats = dict(self.stats, limit=int(self.limit), active=self.active, waiting=len(self._waiters))
+        stats["avg_wait_seconds"] = stats["wait_seconds"] / stats["queued"] if stats["queued"] else 0.0
+        return stats
+
+
+_scheduler: Optional[CompletionScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> Optional[CompletionScheduler]:
+    """
+    Return the process-wide completion scheduler, configured from
+    LLM_MAX_CONCURRENCY (0 disables it) and LLM_QUEUE_TIMEOUT.
+    """
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                max_concurrent = int(get_setting("LLM_MAX_CONCURRENCY", 8))
+                if max_concurrent <= 0:
+                    return None
+                _scheduler = CompletionScheduler(max_concurrent=max_concurrent,
+                                                 timeout=float(get_setting("LLM_QUEUE_TIMEOUT", 120)))
+    return _scheduler
@@ -0,0 +1,301 @@
+"""
+Headless chat service that runs GenerativeAI conversations in a pool of
+worker processes, decoupled from the Streamlit UI.
+
+Each session is pinned to one worker (by a stable hash of its id), which keeps
+that session's history. Requests are answered with a stream of NDJSON events.
+
+Usage:
+    python -m LLM.service --workers 4 --threads 4 --port 8600
+
+API:
+    POST   /v1/chat            {"session_id": "...", "message": "..."} -> NDJSON event stream
+                               (header "X-Profile: 1" profiles the request if PROFILE_ALLOW_REQUEST is on, see LLM/profiling.py)
+    DELETE /v1/sessions/<id>   forget a session's history
+    GET    /healthz            worker status
+
+Events: token, tool_call, tool_result, queued, answer, error, done (see
+GenerativeAI._process_completion_with_tools for the first four).
+"""
+import argparse
+import contextlib
+import json
+import logging
+import multiprocessing
+import queue
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger("ChatService")
+
+
+def _worker_main(worker_id: int, requests: multiprocessing.Queue, events: multiprocessing.Queue, threads: int) -> None:
+    """
+    Worker process loop: owns a GenerativeAI engine and the history of every
+    session pinned to it, and answers chat requests on a small thread pool.
+    """
+    from LLM.llm import GenerativeAI
+    from LLM.request_context import profile_requested
+    from LLM.session_store import get_session_store
+
+    engine = GenerativeAI(debug_mode=False)
+    # Histories live in the service's own session file, so a restarted
+    # worker resumes its sessions
+    store = get_session_store("SERVICE_SESSION_DB_PATH", "service_sessions.db")
+    # session id -> [lock, requests holding or waiting for it]
+    session_locks: Dict[str, list] = {}
+    registry_lock = threading.Lock()
+
+    def _release_locks(session_ids) -> None:
+        # A session dropped from memory needs no lock until it is opened again,
+        # unless a request has already taken it and is about to acquire it
+        with registry_lock:
+            for session_id in session_ids:
+                entry = session_locks.get(session_id)
+                if entry is not None and entry[1] == 0:
+                    del session_locks[session_id]
+
+    store.add_eviction_listener(_release_locks)
+
+    @contextlib.contextmanager
+    def _session(session_id: str):
+        """The session, held under its lock; one turn at a time per session keeps its history consistent."""
+        with registry_lock:
+            entry = session_locks.setdefault(session_id, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield SimpleNamespace(messages=store.open(session_id), session_id=session_id)
+        finally:
+            with registry_lock:
+                entry[1] -= 1
+
+    def _handle(request: Dict[str, Any]) -> None:
+        request_id = request["request_id"]
+
+        def emit(event: Dict[str, Any]) -> None:
+            events.put((request_id, event))
+
+        try:
+            if request["type"] == "reset":
+                store.delete(request["session_id"])
+                return
+
+            profile_requested.set(bool(request.get("profile")))
+            with _session(request["session_id"]) as session:
+                answer = engine.process_message_and_get_response(request["message"], session, on_event=emit)
+            emit({"type": "answer", "content": answer})
+        except Exception as e:
+            logger.exception(f"Worker {worker_id} failed to handle request {request_id}")
+            emit({"type": "error", "message": str(e)})
+        finally:
+            events.put((request_id, {"type": "done"}))
+
+    with ThreadPoolExecutor(max_workers=threads, thread_name_prefix=f"worker-{worker_id}") as pool:
+        while True:
+            request = requests.get()
+            if request is None:
+                break
+            pool.submit(_handle, request)
+
+
+class WorkerPool:
+    """
+    Pool of agent worker processes with session affinity. Events coming back
+    from the workers are routed to per-request queues.
+    """
+
+    def __init__(self, workers: int, threads: int):
+        """
+        Args:
+            workers: Number of worker processes
+            threads: Concurrent requests handled by each worker
+        """
+        self.threads = threads
+        self._context = multiprocessing.get_context("spawn")
+        self._events = self._context.Queue()
+        self._pending: Dict[str, queue.Queue] = {}
+        self._pending_workers: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._workers = [self._start_worker(worker_id) for worker_id in range(workers)]
+
+        threading.Thread(target=self._route_events, name="event-router", daemon=True).start()
+        threading.Thread(target=self._monitor, name="worker-monitor", daemon=True).start()
+
+    def _start_worker(self, worker_id: int) -> SimpleNamespace:
+        requests = self._context.Queue()
+        process = self._context.Process(
+            target=_worker_main, args=(worker_id, requests, self._events, self.threads),
+            name=f"chat-worker-{worker_id}", daemon=True
+        )
+        process.start()
+        logger.info(f"Started worker {worker_id} (pid {process.pid})")
+        return SimpleNamespace(process=process, requests=requests)
+
+    def worker_for(self, session_id: str) -> int:
+        """Stable worker index for a session."""
+        return zlib.crc32(session_id.encode("utf-8")) % len(self._workers)
+
+    def _route_events(self) -> None:
+        while True:
+            request_id, event = self._events.get()
+            with self._lock:
+                target = self._pending.get(request_id)
+                if event["type"] == "done":
+                    self._pending.pop(request_id, None)
+                    self._pending_workers.pop(request_id, None)
+            if target is not None:
+                target.put(event)
+
+    def _monitor(self, interval: float = 2.0) -> None:
+        """Restarts dead workers and fails the requests they were handling."""
+        while True:
+            time.sleep(interval)
+            for worker_id, worker in enumerate(self._workers):
+                if worker.process.is_alive():
+                    continue
+                logger.error(f"Worker {worker_id} exited with code {worker.process.exitcode}, restarting")
+                with self._lock:
+                    lost = [rid for rid, wid in self._pending_workers.items() if wid == worker_id]
+                    targets = [self._pending.pop(rid) for rid in lost]
+                    for rid in lost:
+                        self._pending_workers.pop(rid)
+                for target in targets:
+                    target.put({"type": "error", "message": "Worker process exited"})
+                    target.put({"type": "done"})
+                self._workers[worker_id] = self._start_worker(worker_id)
+
+    def submit(self, request: Dict[str, Any]) -> queue.Queue:
+        """
+        Send a request to the worker owning its session.
+
+        Returns:
+            Queue receiving the request's events, ending with a "done" event
+        """
+        request_id = uuid.uuid4().hex
+        worker_id = self.worker_for(request["session_id"])
+        events: queue.Queue = queue.Queue()
+        with self._lock:
+            self._pending[request_id] = events
+            self._pending_workers[request_id] = worker_id
+        self._workers[worker_id].requests.put({**request, "request_id": request_id})
+        return events
+
+    def status(self) -> Dict[str, Any]:
+        """Liveness of every worker and the number of in-flight requests."""
+        with self._lock:
+            in_flight = len(self._pending)
+        return {
+            "workers": [
+                {"id": worker_id, "pid": worker.process.pid, "alive": worker.process.is_alive()}
+                for worker_id, worker in enumerate(self._workers)
+            ],
+            "in_flight": in_flight,
+        }
+
+    def shutdown(self) -> None:
+        for worker in self._workers:
+            worker.requests.put(None)
+        for worker in self._workers:
+            worker.process.join(timeout=5)
+
+
+class ChatRequestHandler(BaseHTTPRequestHandler):
+    """HTTP front end of the chat service."""
+
+    pool: Optional[WorkerPool] = None
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logger.info(format % args)
+
+    def _send_json(self, status: int, body: Dict[str, Any]) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self) -> None:
+        if self.path == "/healthz":
+            self._send_json(200, self.pool.status())
+        else:
+            self._send_json(404, {"error": "Not found"})
+
+    def do_DELETE(self) -> None:
+        if not self.path.startswith("/v1/sessions/"):
+            self._send_json(404, {"error": "Not found"})
+            return
+        session_id = self.path[len("/v1/sessions/"):]
+        self.pool.submit({"type": "reset", "session_id": session_id})
+        self._send_json(200, {"session_id": session_id, "reset": True})
+
+    def do_POST(self) -> None:
+        if self.path != "/v1/chat":
+            self._send_json(404, {"error": "Not found"})
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            session_id = str(body["session_id"])
+            message = str(body["message"])
+        except (ValueError, KeyError):
+            self._send_json(400, {"error": "Expected JSON body with 'session_id' and 'message'"})
+            return
+
+        profile = self.headers.get("X-Profile", "").strip().lower() in ("1", "true", "yes", "on")
+        events = self.pool.submit({"type": "chat", "session_id": session_id, "message": message, "profile": profile})
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("X-Worker", str(self.pool.worker_for(session_id)))
+        self.end_headers()
+        try:
+            while True:
+                event = events.get()
+                self._write_chunk(json.dumps(event).encode("utf-8") + b"\n")
+                if event["type"] == "done":
+                    break
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            logger.info(f"Client disconnected from session {session_id}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the headless TNC chat service.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8600)
+    parser.add_argument("--workers", type=int, default=max(1, multiprocessing.cpu_count()),
+                        help="Number of agent worker processes (default: CPU count).")
+    parser.add_argument("--threads", type=int, default=4,
+                        help="Concurrent conversations handled by each worker (default: 4).")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    ChatRequestHandler.pool = WorkerPool(args.workers, args.threads)
+    server = ThreadingHTTPServer((args.host, args.port), ChatRequestHandler)
+    logger.info(f"Chat service listening on http://{args.host}:{args.port} with {args.workers} worker(s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        ChatRequestHandler.pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
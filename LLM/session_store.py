@@ -0,0 +1,266 @@
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger("SessionStore")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (session_id, seq)
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    updated_at REAL NOT NULL
+);
+"""
+
+
+class SessionHistory:
+    """
+    Message history of one session. Behaves like the list of {"role", "content"}
+    dicts the app and GenerativeAI expect, but only the most recent turns are
+    held in memory (as compact tuples); every message is also written to the
+    store's SQLite file, from which older turns can be read back.
+    """
+
+    def __init__(self, store: "SessionStore", session_id: str, recent: List[Tuple[str, str]], total: int):
+        self.store = store
+        self.session_id = session_id
+        self._recent: Deque[Tuple[str, str]] = deque(recent)
+        self._recent_chars = sum(len(content) for _, content in recent)
+        self._total = total
+        self.last_used = time.monotonic()
+        self._trim()
+
+    def _trim(self) -> None:
+        # Keep at least the newest message even if it alone is over the budget
+        while len(self._recent) > 1 and (
+            len(self._recent) > self.store.recent_messages or self._recent_chars > self.store.recent_chars
+        ):
+            _, content = self._recent.popleft()
+            self._recent_chars -= len(content)
+
+    def append(self, message: Dict[str, str]) -> None:
+        """Append a message to the session and persist it."""
+        role, content = message["role"], message["content"] or ""
+        self.store._persist(self.session_id, role, content)
+        self._total += 1
+        self._recent.append((role, content))
+        self._recent_chars += len(content)
+        self.last_used = time.monotonic()
+        self._trim()
+
+    def __iter__(self) -> Iterator[Dict[str, str]]:
+        """Iterate over the in-memory (most recent) messages."""
+        self.last_used = time.monotonic()
+        return ({"role": role, "content": content} for role, content in list(self._recent))
+
+    def __len__(self) -> int:
+        """Total number of messages in the session, including spilled ones."""
+        return self._total
+
+    def __bool__(self) -> bool:
+        return self._total > 0
+
+    @property
+    def recent_count(self) -> int:
+        """Number of messages currently held in memory."""
+        return len(self._recent)
+
+    def load(self, start: int = 0, end: Optional[int] = None) -> List[Dict[str, str]]:
+        """
+        Read messages by position from the store, including spilled ones.
+
+        Args:
+            start: Index of the first message
+            end: Index after the last message (default: all)
+
+        Returns:
+            List of {"role", "content"} dictionaries
+        """
+        return self.store._load(self.session_id, start, self._total if end is None else end)
+
+
+class SessionStore:
+    """
+    Session histories with a bounded in-memory window per session, an
+    append-only SQLite file for everything else, resume by session id and
+    eviction of idle sessions from memory.
+    """
+
+    def __init__(self, path: str = "sessions.db", recent_messages: int = 20, recent_chars: int = 32_000,
+                 idle_seconds: float = 1800.0):
+        """
+        Args:
+            path: SQLite file holding all messages
+            recent_messages: Maximum messages per session kept in memory
+            recent_chars: Maximum characters per session kept in memory
+            idle_seconds: Sessions unused for this long are dropped from memory
+        """
+        self.path = path
+        self.recent_messages = recent_messages
+        self.recent_chars = recent_chars
+        self.idle_seconds = idle_seconds
+        self._lock = threading.RLock()
+        self._sessions: Dict[str, SessionHistory] = {}
+        self._eviction_listeners: List[Callable[[List[str]], None]] = []
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript(_SCHEMA)
+
+        threading.Thread(target=self._sweep, name="session-sweeper", daemon=True).start()
+
+    def open(self, session_id: Optional[str] = None) -> SessionHistory:
+        """
+        Open a session, resuming it from disk if it is not in memory.
+
+        Args:
+            session_id: Id of the session to resume; a new id is generated if None
+
+        Returns:
+            The session's history
+        """
+        session_id = session_id or uuid.uuid4().hex
+        with self._lock:
+            history = self._sessions.get(session_id)
+            if history is None:
+                total = self._db.execute(
+                    "SELECT COUNT(*) FROM messages WHERE session_id = ?", (session_id,)
+                ).fetchone()[0]
+                rows = self._db.execute(
+                    "SELECT role, content FROM messages WHERE session_id = ? ORDER BY seq DESC LIMIT ?",
+                    (session_id, self.recent_messages)
+                ).fetchall()
+                history = SessionHistory(self, session_id, list(reversed(rows)), total)
+                self._sessions[session_id] = history
+                if total:
+                    logger.info(f"Resumed session {session_id} with {total} messages")
+            history.last_used = time.monotonic()
+            return history
+
+    def exists(self, session_id: str) -> bool:
+        """Whether a session has any stored messages."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT 1 FROM sessions WHERE session_id = ?", (session_id,)
+            ).fetchone() is not None
+
+    def delete(self, session_id: str) -> None:
+        """Forget a session in memory and on disk."""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._db.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self._db.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        self._notify_evicted([session_id])
+
+    def add_eviction_listener(self, listener: Callable[[List[str]], None]) -> None:
+        """
+        Call listener with the ids of sessions dropped from memory (idle or
+        deleted), so per-session state kept elsewhere can be released too.
+        """
+        self._eviction_listeners.append(listener)
+
+    def _notify_evicted(self, session_ids: List[str]) -> None:
+        for listener in self._eviction_listeners:
+            try:
+                listener(session_ids)
+            except Exception:
+                logger.exception("Session eviction listener failed")
+
+    def _persist(self, session_id: str, role: str, content: str) -> None:
+        now = time.time()
+        with self._lock:
+            # The sequence number is assigned by SQLite so that several
+            # processes sharing the file never overwrite each other's messages
+            self._db.execute(
+                "INSERT INTO messages (session_id, seq, role, content, created_at) "
+                "SELECT ?, COALESCE(MAX(seq) + 1, 0), ?, ?, ? FROM messages WHERE session_id = ?",
+                (session_id, role, content, now, session_id)
+            )
+            self._db.execute(
+                "INSERT OR REPLACE INTO sessions (session_id, updated_at) VALUES (?, ?)", (session_id, now)
+            )
+
+    def _load(self, session_id: str, start: int, end: int) -> List[Dict[str, str]]:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT role, content FROM messages WHERE session_id = ? AND seq >= ? AND seq < ? ORDER BY seq",
+                (session_id, start, end)
+            ).fetchall()
+        return [{"role": role, "content": content} for role, content in rows]
+
+    def evict_idle(self, idle_seconds: Optional[float] = None) -> int:
+        """
+        Drop sessions that have not been used recently from memory. Their
+        messages stay on disk and are reloaded by open().
+
+        Returns:
+            Number of sessions evicted
+        """
+        cutoff = time.monotonic() - (self.idle_seconds if idle_seconds is None else idle_seconds)
+        with self._lock:
+            idle = [sid for sid, history in self._sessions.items() if history.last_used < cutoff]
+            for session_id in idle:
+                del self._sessions[session_id]
+        if idle:
+            logger.info(f"Evicted {len(idle)} idle session(s) from memory")
+            self._notify_evicted(idle)
+        return len(idle)
+
+    def _sweep(self) -> None:
+        while True:
+            time.sleep(max(1.0, self.idle_seconds / 4))
+            try:
+                self.evict_idle()
+            except Exception:
+                logger.exception("Idle session sweep failed")
+
+    def stats(self) -> Dict[str, int]:
+        """Number of sessions and messages held in memory."""
+        with self._lock:
+            return {
+                "sessions_in_memory": len(self._sessions),
+                "messages_in_memory": sum(h.recent_count for h in self._sessions.values()),
+                "chars_in_memory": sum(h._recent_chars for h in self._sessions.values()),
+            }
+
+
+_store: Optional[SessionStore] = None
+_store_lock = threading.Lock()
+
+
+def get_session_store(path_setting: str = "SESSION_DB_PATH", default_path: str = "sessions.db") -> SessionStore:
+    """
+    Return the process-wide session store, configured from the settings
+    SESSION_DB_PATH, SESSION_RECENT_MESSAGES, SESSION_RECENT_CHARS and
+    SESSION_IDLE_SECONDS.
+
+    Args:
+        path_setting: Name of the setting holding the SQLite path
+        default_path: Path used when the setting is not configured
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                from TNC.memory import register_evictor
+                from TNC.settings import get_setting
+                _store = SessionStore(
+                    path=get_setting(path_setting, default_path),
+                    recent_messages=int(get_setting("SESSION_RECENT_MESSAGES", 20)),
+                    recent_chars=int(get_setting("SESSION_RECENT_CHARS", 32_000)),
+                    idle_seconds=float(get_setting("SESSION_IDLE_SECONDS", 1800)),
+                )
+                # Under memory pressure, sessions idle for a few minutes go back to disk early
+                register_evictor("idle sessions", lambda: _store.evict_idle(min(_store.idle_seconds, 300.0)))
+    return _store
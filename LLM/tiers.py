@@ -0,0 +1,165 @@
+import json
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger("Tiers")
+
+# Low-latency model used for tool selection next to each synthesis model.
+PLANNER_MODELS = {
+    "gpt-4o": "gpt-4o-mini",
+    "gpt-4.1": "gpt-4.1-mini",
+    "gemini-1.5-pro": "gemini-1.5-flash",
+    "gemini-2.0-pro": "gemini-2.0-flash",
+}
+
+# USD per million (prompt, completion) tokens; matched by model name prefix.
+MODEL_PRICES = {
+    "gpt-4o-mini": (0.15, 0.60),
+    "gpt-4o": (2.50, 10.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1": (2.00, 8.00),
+    "gemini-1.5-flash": (0.075, 0.30),
+    "gemini-1.5-pro": (1.25, 5.00),
+    "gemini-2.0-flash": (0.10, 0.40),
+}
+
+# Parallel tool calls beyond which a planner turn is considered confused.
+MAX_PLANNER_CALLS = 4
+
+
+def cost_of(model: str, prompt_tokens: int, completion_tokens: int) -> float:
+    """Estimated cost in USD of one completion; 0 for models without a known price."""
+    matches = [name for name in MODEL_PRICES if model.startswith(name)]
+    if not matches:
+        return 0.0
+    prompt_price, completion_price = MODEL_PRICES[max(matches, key=len)]
+    return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+
+
+def escalation_reason(message: Any, tools: List[Dict[str, Any]], seen_calls: Set[Tuple[str, str]],
+                      first_turn: bool) -> Optional[str]:
+    """
+    Check a planner turn and tell why it should be redone by the synthesis
+    tier, if at all.
+
+    Args:
+        message: The planner's response message
+        tools: The tool schemas offered
+        seen_calls: (name, canonical arguments) of the calls already made in this request
+        first_turn: Whether no tool has been called yet in this request
+
+    Returns:
+        The reason to escalate, or None if the planner's turn can be used
+    """
+    if not message.tool_calls:
+        # The system prompt asks for a tool on almost every question
+        return "answered without calling a tool" if first_turn else None
+    if len(message.tool_calls) > MAX_PLANNER_CALLS:
+        return f"{len(message.tool_calls)} parallel tool calls"
+
+    schemas = {tool["function"]["name"]: tool["function"].get("parameters", {}) for tool in tools}
+    for call in message.tool_calls:
+        name = call.function.name
+        if name not in schemas:
+            return f"unknown tool {name!r}"
+        try:
+            args = json.loads(call.function.arguments or "{}")
+        except ValueError:
+            return f"malformed arguments for {name}"
+        if not isinstance(args, dict):
+            return f"malformed arguments for {name}"
+        properties = schemas[name].get("properties", {})
+        if properties and not args:
+            return f"no arguments for {name}"
+        missing = [param for param in schemas[name].get("required", []) if args.get(param) in (None, "")]
+        if missing:
+            return f"missing {', '.join(missing)} for {name}"
+        unknown = set(args) - set(properties)
+        if unknown:
+            return f"unknown arguments {', '.join(sorted(unknown))} for {name}"
+        if (name, json.dumps(args, sort_keys=True)) in seen_calls:
+            return f"repeated call to {name}"
+    return None
+
+
+class TierUsage:
+    """Calls, latency, tokens and cost per tier for one request."""
+
+    def __init__(self):
+        self.tiers: Dict[str, Dict[str, Any]] = {}
+        self.escalations = 0
+        # Completions that offered tools, out of all completions
+        self.tool_completions = 0
+
+    @property
+    def completions(self) -> int:
+        return sum(stats["calls"] for stats in self.tiers.values())
+
+    def record(self, tier: str, model: str, elapsed: float, prompt_tokens: int, completion_tokens: int,
+               estimated: bool = False) -> None:
+        """
+        Add one completion.
+
+        Args:
+            tier: "planner" or "synthesis"
+            model: Model that produced the completion
+            elapsed: Seconds the completion took
+            prompt_tokens: Prompt tokens used
+            completion_tokens: Completion tokens used
+            estimated: Whether the token counts are estimates (streamed responses)
+        """
+        stats = self.tiers.setdefault(tier, {"calls": 0, "seconds": 0.0, "prompt_tokens": 0,
+                                             "completion_tokens": 0, "cost": 0.0, "estimated": False})
+        cost = cost_of(model, prompt_tokens, completion_tokens)
+        stats["calls"] += 1
+        stats["seconds"] += elapsed
+        stats["prompt_tokens"] += prompt_tokens
+        stats["completion_tokens"] += completion_tokens
+        stats["cost"] += cost
+        stats["estimated"] = stats["estimated"] or estimated
+        _totals.add(tier, {"calls": 1, "seconds": elapsed, "cost": cost})
+
+    def summary(self) -> str:
+        parts = []
+        for tier, stats in self.tiers.items():
+            approx = "~" if stats["estimated"] else ""
+            parts.append(f"{tier}: {stats['calls']} call(s), {stats['seconds']:.2f}s, "
+                         f"{approx}{stats['prompt_tokens'] + stats['completion_tokens']} tokens, {approx}${stats['cost']:.4f}")
+        if self.escalations:
+            parts.append(f"{self.escalations} escalation(s)")
+        return "; ".join(parts)
+
+
+class _TierTotals:
+    """Process-wide totals per tier."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals: Dict[str, Dict[str, float]] = {}
+
+    def add(self, tier: str, stats_delta: Dict[str, float]) -> None:
+        with self._lock:
+            totals = self._totals.setdefault(tier, {"calls": 0, "seconds": 0.0, "cost": 0.0})
+            for key, value in stats_delta.items():
+                totals[key] += value
+
+    def report(self) -> Dict[str, Dict[str, float]]:
+        with self._lock:
+            report = {tier: dict(totals) for tier, totals in self._totals.items()}
+        for totals in report.values():
+            totals["avg_seconds"] = totals["seconds"] / totals["calls"] if totals["calls"] else 0.0
+        return report
+
+
+_totals = _TierTotals()
+
+
+def tier_report() -> Dict[str, Dict[str, float]]:
+    """Calls, average latency and cost per tier since the process started."""
+    return _totals.report()
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (4 characters per token) for responses without usage data."""
+    return max(1, len(text) // 4)
@@ -0,0 +1,244 @@
+import json
+import logging
+import threading
+from typing import Any, Dict, List
+from TNC.chunk_index import get_chunk_indexes
+from TNC.context import TNC_in_social_media
+from TNC.gazetteer import resolve_region
+from TNC.settings import get_flag
+from .prompts import build_system_prompt
+from .request_context import current_session_id
+from .router import _NAVIGATION_CUES, _STOPWORDS, _tokens
+from .tiers import estimate_tokens
+
+logger = logging.getLogger("ToolSelector")
+
+# Tools offered with every request: the default search and the page reader
+# that follows up on its results.
+CORE_TOOLS = {"search_TNC_knowledge_base", "visit_any_web_site"}
+
+# Cue words per optional tool group (after router alias folding).
+_NEWS_CUES = {
+    "news", "latest", "recent", "recently", "update", "updates", "press", "release", "releases",
+    "announcement", "announcements", "announced", "headline", "headlines", "today", "current", "currently",
+    "research", "study", "studies", "publication", "publications",
+}
+_EVENT_CUES = {
+    "events", "volunteer", "attend", "workshop", "workshops", "hike", "hikes", "tour", "tours",
+    "webinar", "webinars", "festival", "cleanup", "near", "nearby", "local", "locally", "weekend",
+    "calendar", "upcoming", "meetup", "involved", "help",
+}
+_WEBSITE_CUES = _NAVIGATION_CUES | {
+    "partner", "partnership", "partnerships", "company", "corporate", "business", "chapter", "chapters",
+    "donate", "give", "member", "renew", "monthly", "calculate", "footprint", "reports", "homepage",
+    "accountability", "contact", "careers", "jobs", "shop", "newsletter", "subscribe",
+}
+_MEDIA_CUES = {
+    "social", "media", "follow", "following", "connected", "handle", "account", "accounts",
+    "partner", "partnership", "partnerships", "company", "corporate", "business",
+} | set(TNC_in_social_media)
+
+# Words after which "new" asks for news rather than naming a place ("New York").
+_NEW_AS_NEWS = {"whats", "anything", "something", "is", "new"}
+
+# Follow-ups shorter than this (in content words) depend on the earlier
+# conversation, so the full tool set is offered.
+_MIN_FOLLOW_UP_WORDS = 3
+
+
+class ToolSelection:
+    """The tools and system prompt chosen for one request."""
+
+    def __init__(self, tools: List[Dict[str, Any]], system_prompt: str, reason: str, saved_tokens: int = 0,
+                 saved_tool_tokens: int = 0):
+        """
+        Args:
+            tools: Tool schemas to offer
+            system_prompt: System prompt matching those tools
+            reason: Why these tools were chosen, for the logs
+            saved_tokens: Estimated prompt tokens saved per completion by the shorter system prompt
+            saved_tool_tokens: Estimated prompt tokens saved per completion that offers tools
+        """
+        self.tools = tools
+        self.system_prompt = system_prompt
+        self.reason = reason
+        self.saved_tokens = saved_tokens
+        self.saved_tool_tokens = saved_tool_tokens
+        self.names = {tool["function"]["name"] for tool in tools}
+
+    def offers(self, name: str) -> bool:
+        return name in self.names
+
+    def widen(self, tools: List[Dict[str, Any]], system_prompt: str, reason: str) -> None:
+        """Switch to the full tool set for the rest of the request; its savings are given up."""
+        self.tools = tools
+        self.system_prompt = system_prompt
+        self.reason = reason
+        self.saved_tokens = self.saved_tool_tokens = 0
+        self.names = {tool["function"]["name"] for tool in tools}
+
+
+class ToolSelector:
+    """
+    Keyword classifier that picks the tools a question may need, so each
+    completion carries only their schemas and the prompt sections about them.
+    Falls back to the full tool set whenever the question gives too little
+    to go on.
+    """
+
+    def __init__(self, tools: List[Dict[str, Any]]):
+        """
+        Args:
+            tools: All tool schemas
+        """
+        self.tools = tools
+        self.full_prompt = build_system_prompt()
+        self._tool_tokens = {tool["function"]["name"]: estimate_tokens(json.dumps(tool)) for tool in tools}
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "pruned": 0, "completions": 0, "saved_tokens": 0}
+
+    def full(self, reason: str) -> ToolSelection:
+        """The full tool set with the full system prompt."""
+        return ToolSelection(self.tools, self.full_prompt, reason)
+
+    def score(self, question: str) -> Dict[str, float]:
+        """
+        Score the optional tool groups against a question.
+
+        Args:
+            question: The user's message
+
+        Returns:
+            Mapping of tool name to a score between 0 and 1; 0 means no cue was found
+        """
+        tokens = _tokens(question)
+        words = set(tokens)
+        news = len(words & _NEWS_CUES) + sum(
+            1 for i, token in enumerate(tokens) if token == "new" and i and tokens[i - 1] in _NEW_AS_NEWS)
+        events = len(words & _EVENT_CUES) + (2 if resolve_region(question) else 0)
+        website = len(words & _WEBSITE_CUES)
+        media = len(words & _MEDIA_CUES)
+        scores = {
+            "news_search": news,
+            "event_search": events,
+            "find_website_section": website,
+            "get_website_structure": website,
+            "get_media_accounts": media,
+        }
+        return {name: min(1.0, hits / 2) for name, hits in scores.items()}
+
+    def select(self, messages: List[Dict[str, Any]]) -> ToolSelection:
+        """
+        Choose the tools and system prompt for a conversation.
+
+        Args:
+            messages: The conversation; the last user message is classified
+
+        Returns:
+            The selection to use for every completion of this request
+        """
+        with self._lock:
+            self.stats["requests"] += 1
+        if not get_flag("TOOL_PRUNING", True):
+            return self.full("tool pruning is off")
+
+        user_messages = [m.get("content") or "" for m in messages if m.get("role") == "user"]
+        if not user_messages:
+            return self.full("no user message")
+        question = user_messages[-1]
+        if len(user_messages) > 1 and len(set(_tokens(question)) - _STOPWORDS) < _MIN_FOLLOW_UP_WORDS:
+            return self.full("short follow-up")
+
+        scores = self.score(question)
+        names = CORE_TOOLS | {name for name, score in scores.items() if score > 0}
+        # Follow-ups can be answered from the pages the session has already visited
+        if get_chunk_indexes().has_pages(current_session_id.get()):
+            names.add("search_visited_pages")
+        if len(names) >= len(self.tools):
+            return self.full("every tool matched")
+
+        tools = [tool for tool in self.tools if tool["function"]["name"] in names]
+        prompt = build_system_prompt(names)
+        selection = ToolSelection(
+            tools, prompt, f"matched {', '.join(sorted(names - CORE_TOOLS)) or 'no optional tool'}",
+            saved_tokens=estimate_tokens(self.full_prompt) - estimate_tokens(prompt),
+            saved_tool_tokens=sum(tokens for name, tokens in self._tool_tokens.items() if name not in names),
+        )
+        with self._lock:
+            self.stats["pruned"] += 1
+        return selection
+
+    def record(self, selection: ToolSelection, completions: int, tool_completions: int) -> int:
+        """
+        Add the savings of a finished request to the totals.
+
+        Args:
+            selection: The selection used by the request
+            completions: Number of completions sent with its system prompt
+            tool_completions: How many of them also offered its tools
+
+        Returns:
+            Estimated prompt tokens saved by the request
+        """
+        saved = selection.saved_tokens * completions + selection.saved_tool_tokens * tool_completions
+        with self._lock:
+            self.stats["completions"] += completions
+            self.stats["saved_tokens"] += saved
+        return saved
+
+    def report(self) -> Dict[str, Any]:
+        """Requests pruned and estimated prompt tokens saved since the process started."""
+        with self._lock:
+            stats = dict(self.stats)
+        stats["pruned_rate"] = stats["pruned"] / stats["requests"] if stats["requests"] else 0.0
+        stats["saved_per_request"] = stats["saved_tokens"] / stats["requests"] if stats["requests"] else 0.0
+        return stats
+
+
+# Labelled questions used to check the selector: (question, tools that must be offered).
+SELECTOR_EVAL_SAMPLES = [
+    ("What's new with TNC's conservation efforts?", {"news_search"}),
+    ("Any volunteer events in Denver this month?", {"event_search"}),
+    ("How can I help with conservation in Seattle?", {"event_search"}),
+    ("How can my company partner with TNC on sustainability?", {"get_website_structure", "get_media_accounts"}),
+    ("What research is TNC doing on climate change adaptation?", {"news_search"}),
+    ("Where is the page to renew my membership?", {"find_website_section"}),
+    ("Tell me about TNC's coral reef protection", set()),
+    ("How are my donations used by TNC?", set()),
+]
+
+
+def evaluate_selector(selector: ToolSelector, samples=SELECTOR_EVAL_SAMPLES) -> Dict[str, float]:
+    """
+    Measure how often the selector offers the tools a question needs, and
+    how many prompt tokens it saves on those questions.
+
+    Args:
+        selector: The selector to evaluate
+        samples: List of (question, required tool names) pairs
+
+    Returns:
+        Dictionary with recall and average saved tokens per completion
+    """
+    covered = saved = 0
+    for question, required in samples:
+        selection = selector.select([{"role": "user", "content": question}])
+        covered += required <= selection.names
+        saved += selection.saved_tokens + selection.saved_tool_tokens
+    return {
+        "samples": len(samples),
+        "recall": covered / len(samples) if samples else 1.0,
+        "saved_tokens_per_completion": saved / len(samples) if samples else 0.0,
+    }
+
+
+if __name__ == "__main__":
+    from .tools import TOOLS
+
+    selector = ToolSelector(TOOLS)
+    report = evaluate_selector(selector)
+    print(f"samples={report['samples']} recall={report['recall']:.1%} "
+          f"saved_tokens_per_completion={report['saved_tokens_per_completion']:.0f} "
+          f"of {estimate_tokens(selector.full_prompt) + sum(selector._tool_tokens.values())}")
+    for question, _ in SELECTOR_EVAL_SAMPLES:
+        print(f"{question!r}: {sorted(selector.select([{'role': 'user', 'content': question}]).names - CORE_TOOLS)}")
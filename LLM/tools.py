@@ -1,8 +1,42 @@
-import http.client
-from urllib.parse import quote_plus
-from bs4 import BeautifulSoup
-import streamlit as st
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+from urllib.parse import urldefrag
 import TNC.tnc_api as tnc
+from TNC.chunk_index import get_chunk_indexes
+from TNC.context import TNC_in_social_media
+from TNC.news_index import get_news_index, is_fresh
+from TNC.page_store import get_page_store
+from TNC.parse_pool import parser_for
+from TNC.prefetch import get_prefetcher, normalize_url
+from TNC.rerank import rerank
+from TNC.scraper import fetch_page, page_cache_ttl
+from TNC.settings import get_flag, get_setting
+from TNC.site_index import WEBSITE_MAP_JSON, find_sections_json
+from TNC.snapshot import get_snapshot
+from TNC.tasks import in_submitter_context
+from .request_context import current_question, current_session_id
+
+logger = logging.getLogger("Tools")
+
+# Maximum number of queries searched by one search_TNC_knowledge_base call.
+MAX_BATCH_QUERIES = 5
+
+_search_pool: Optional[ThreadPoolExecutor] = None
+_search_pool_lock = threading.Lock()
+
+
+def _get_search_pool() -> ThreadPoolExecutor:
+    """Threads shared by the batched searches of all sessions (KB_SEARCH_WORKERS, default 16)."""
+    global _search_pool
+    if _search_pool is None:
+        with _search_pool_lock:
+            if _search_pool is None:
+                _search_pool = ThreadPoolExecutor(max_workers=int(get_setting("KB_SEARCH_WORKERS", 16)),
+                                                  thread_name_prefix="kb-search")
+    return _search_pool
+
 
 TOOLS = [
     {
@@ -29,11 +63,28 @@ TOOLS = [
             }
         }
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "find_website_section",
+            "description": "Looks up the pages of TNC's website matching a topic and returns only their titles, sections and URLs. Prefer this over get_website_structure when looking for a specific page.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "topic": {
+                        "type": "string",
+                        "description": "The topic to look up, e.g. 'donate', 'volunteer' or 'carbon footprint'."
+                    }
+                },
+                "required": ["topic"]
+            }
+        }
+    },
     {
         "type": "function",
         "function": {
             "name": "visit_any_web_site",
-            "description": "Visit any website and returns the string representation of the web page under the given URL.",
+            "description": "Visit any website and returns the string representation of the web page under the given URL. Long pages are returned as their sections most relevant to the user's question.",
             "parameters": {
                 "type": "object",
                 "properties": {
@@ -46,20 +97,47 @@ TOOLS = [
             }
         }
     },
+    {
+        "type": "function",
+        "function": {
+            "name": "search_visited_pages",
+            "description": "Searches the pages already visited in this conversation and returns their sections most relevant to the query, without visiting them again. Use for follow-up questions about a page visited earlier.",
+            "parameters": {
+                "type": "object",
+                "properties": {
+                    "query": {
+                        "type": "string",
+                        "description": "What to look for in the visited pages."
+                    },
+                    "url": {
+                        "type": "string",
+                        "description": "Optional URL of one visited page to search only that page."
+                    }
+                },
+                "required": ["query"]
+            }
+        }
+    },
     {
         "type": "function",
         "function": {
             "name": "search_TNC_knowledge_base",
-            "description": "Key word search! Searches TNC's knowledge base for articles containing the query. This function is the main source of information about TNC's initiatives, projects, reports and anything else.",
+            "description": "Key word search! Searches TNC's knowledge base for articles containing the query. This function is the main source of information about TNC's initiatives, projects, reports and anything else. Pass several related queries at once in 'queries' to gather broad context in one call; results are merged without duplicates and tagged with the queries that matched them.",
             "parameters": {
                 "type": "object",
                 "properties": {
                     "query": {
                         "type": "string",
                         "description": "The query to search for in the knowledge base."
+                    },
+                    "queries": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "maxItems": MAX_BATCH_QUERIES,
+                        "description": "Several queries searched concurrently, e.g. ['wetlands', 'California wetlands', 'wetland restoration']. Use instead of 'query'."
                     }
                 },
-                "required": ["query"]
+                "required": []
             }
         }
     },
@@ -67,17 +145,25 @@ TOOLS = [
         "type": "function",
         "function": {
             "name": "event_search",
-            "description": "Searches for events regarding TNC in a specific region containing a specific keyword.",
+            "description": "Searches for events regarding TNC near a specific region containing a specific keyword. Results are ranked by distance from the region and by date, and include their distance in km.",
             "parameters": {
                 "type": "object",
                 "properties": {
                     "region": {
                         "type": "string",
-                        "description": "The region to search for events."
+                        "description": "The region to search for events: a city, state or area such as 'Boulder, CO' or 'West Texas'."
                     },
                     "key_word": {
                         "type": "string",
                         "description": "The keyword to search for in the event description."
+                    },
+                    "radius_km": {
+                        "type": "number",
+                        "description": "Optional search radius in km around the region. Defaults to the region's own size; the nearest events are returned if none are within it."
+                    },
+                    "limit": {
+                        "type": "integer",
+                        "description": "Optional maximum number of events to return (default 5)."
                     }
                 },
                 "required": ["region", "key_word"]
@@ -104,195 +190,220 @@ TOOLS = [
 ]
 
 
+def _rerank_for_question(query: str, results: list, text_fields: tuple) -> list:
+    """Keeps the results most relevant to the tool query and the user's question (see TNC/rerank.py)."""
+    if not get_flag("RERANK", True):
+        return results
+    
+    question = current_question.get()
+    rerank_query = f"{query} {question}" if question else query
+    return rerank(rerank_query, results, text_fields=text_fields, top_k=int(get_setting("RERANK_TOP_K", 8)))
+
+class JSONText(str):
+    """Tool result that is already serialized JSON and is sent to the model as-is."""
+
+
 def get_media_accounts():
     """Returns the public URLs for different TNC's social media accounts to follow, interact, or get updates.
     
     Returns:
         dict: A dictionary containing the URLs for TNC's social media accounts.
     """
-    return  {
-        "facebook": "https://www.facebook.com/thenatureconservancy/",
-        "twitter": "https://x.com/nature_org",
-        "linkedin": "https://www.linkedin.com/company/the-nature-conservancy/",
-        "instagram": "https://www.instagram.com/nature_org/?hl=en",
-        "youtube": "https://www.youtube.com/user/natureconservancy",
-        "tiktok": "https://www.tiktok.com/@thenatureconservancy",
-    }  
+    return dict(TNC_in_social_media)
     
 def get_website_structure():
     """Returns the structure of TNC's website with the main sections, subsections and external URLs. For more informed decisions and navigation regarding user requests.
     
     Returns:
-        dict: A dictionary containing the structure of TNC's website.
+        JSONText: The structure of TNC's website, pre-serialized.
     """
-    return {
-        "Nature Conservancy Website Structure": {
-          "Homepage": {
-            "URL": "https://www.nature.org/en-us/",
-            "Sections": [
-              "Donate",
-              "What We Do",
-              "About Us",
-              "Get Involved",
-              "Membership & Giving"
-            ]
-          },
-          "Main Sections": {
-            "Donate": {
-              "URL": "https://www.nature.org/en-us/donateredirect/support-nature/"
-            },
-            "What We Do": {
-              "Subpages": {
-                "Our Priorities": [
-                  {
-                    "Title": "Tackle Climate Change",
-                    "URL": "https://www.nature.org/en-us/what-we-do/our-priorities/tackle-climate-change/"
-                  },
-                  {
-                    "Title": "Protect Ocean, Land & Fresh Water",
-                    "URL": "https://www.nature.org/en-us/what-we-do/our-priorities/protect-water-and-land/"
-                  },
-                  {
-                    "Title": "Provide Food and Water",
-                    "URL": "https://www.nature.org/en-us/what-we-do/our-priorities/provide-food-and-water-sustainably/"
-                  }
-                ],
-                "Our Insights": [
-                  {
-                    "Title": "Perspectives",
-                    "URL": "https://www.nature.org/en-us/what-we-do/our-insights/perspectives/"
-                  },
-                  {
-                    "Title": "Reports",
-                    "URL": "https://www.nature.org/en-us/what-we-do/our-insights/reports/"
-                  },
-                  {
-                    "Title": "Data & Tools",
-                    "URL": "https://www.nature.org/en-us/what-we-do/our-insights/data-and-tools/"
-                  }
-                ]
-              }
-            },
-            "About Us": {
-              "Subpages": {
-                "Who We Are": [
-                  {
-                    "Title": "Our People",
-                    "URL": "https://www.nature.org/en-us/about-us/who-we-are/our-people/"
-                  },
-                  {
-                    "Title": "Our Science",
-                    "URL": "https://www.nature.org/en-us/about-us/who-we-are/our-science/"
-                  },
-                  {
-                    "Title": "Our Accountability",
-                    "URL": "https://www.nature.org/en-us/about-us/who-we-are/accountability/"
-                  },
-                  {
-                    "Title": "How We Work",
-                    "URL": "https://www.nature.org/en-us/about-us/who-we-are/how-we-work/"
-                  },
-                  {
-                    "Title": "Our History",
-                    "URL": "https://www.nature.org/en-us/about-us/who-we-are/our-history/"
-                  }
-                ],
-                "Where We Work": [
-                  {
-                    "Title": "Africa",
-                    "URL": "https://www.nature.org/en-us/about-us/where-we-work/africa/"
-                  },
-                  {
-                    "Title": "Asia Pacific",
-                    "URL": "https://www.nature.org/en-us/about-us/where-we-work/asia-pacific/"
-                  },
-                  {
-                    "Title": "Canada",
-                    "URL": "https://www.nature.org/en-us/about-us/where-we-work/canada/"
-                  }
-                ]
-              }
-            },
-            "Get Involved": {
-              "Subpages": {
-                "How To Help": [
-                  {
-                    "Title": "Volunteer",
-                    "URL": "https://www.nature.org/en-us/get-involved/how-to-help/volunteer/"
-                  },
-                  {
-                    "Title": "Attend Events",
-                    "URL": "https://www.nature.org/en-us/get-involved/how-to-help/events/"
-                  },
-                  {
-                    "Title": "Take Action",
-                    "URL": "https://preserve.nature.org/page/80352/action/1"
-                  },
-                  {
-                    "Title": "Calculate Your Carbon Footprint",
-                    "URL": "https://www.nature.org/en-us/get-involved/how-to-help/carbon-footprint-calculator/"
-                  }
-                ]
-              }
-            },
-            "Membership & Giving": {
-              "Subpages": {
-                "Donate": "https://www.nature.org/en-us/membership-and-giving/donate-to-our-mission/",
-                "Become a Member": "https://www.nature.org/en-us/membership-and-giving/donate-to-our-mission/become-a-member/",
-                "Renew": "https://www.nature.org/en-us/membership-and-giving/donate-to-our-mission/renew-membership/",
-                "Give Monthly": "https://www.nature.org/en-us/membership-and-giving/donate-to-our-mission/give-monthly/"
-              }
-            }
-          }
-        }
-    }   
+    return JSONText(WEBSITE_MAP_JSON)
+
+def find_website_section(topic: str):
+    """Finds the sections of TNC's website matching a topic and returns only those pages and URLs.
+    
+    Args:
+        topic (str): The topic to look up, e.g. "donate", "volunteer" or "carbon footprint".
+        
+    Returns:
+        JSONText: The matching pages with their section and URL, pre-serialized.
+    """
+    return JSONText(find_sections_json(topic.strip().lower()))
        
+def _format_chunks(chunks: list, total: int = 0) -> str:
+    """Chunks as text for the model, each headed by its page and position."""
+    parts = []
+    if total:
+        parts.append(f"[Showing the {len(chunks)} of {total} sections of this page most relevant to the question. "
+                     f"Use search_visited_pages to look up other parts of it.]")
+    for chunk in chunks:
+        parts.append(f"--- {chunk.title or chunk.url} (section {chunk.position + 1}) ---\n{chunk.text}")
+    return "\n\n".join(parts)
+
+def _page_text(url: str) -> tuple:
+    """Title and readable text of a page, from the snapshot, the prefetcher, the page store or a fetch."""
+    # Pages in the shared corpus snapshot are served as extracted text
+    snapshot = get_snapshot()
+    records = snapshot.by_url(url.strip(), kind="page") if snapshot else []
+    if records:
+        return records[0].title, records[0].text
+
+    # Pages behind recent top search results may already be fetched in the background
+    page = get_prefetcher().get(url)
+    if page is None:
+        page = fetch_page(url, max_age=page_cache_ttl())
+
+    # Same extraction as for snapshot pages; large pages are parsed in the parse pool if it is enabled
+    extracted = get_page_store().parse_cached("page", page, parser_for("page"))
+    return extracted["title"], extracted["text"]
+
 def visit_any_web_site(url: str):
-    """Visit any website and returns the string (utf-8) representation of the web page under the given URL.
+    """Visit any website and returns the readable text of the web page under the given URL.
+    
+    Pages are indexed in chunks for the session. A long page, or a page the
+    session has visited before, is answered with the chunks most relevant to
+    the user's question instead of the whole text.
     
     Args:
         url (str): String representation of the URL to visit.
         
     Returns:
-        str: String representation of the web page under the given URL.
+        str: The page title and its visible text, one block per line.
     """
 
-    conn = http.client.HTTPSConnection("api.scrapingant.com")
-    api_key = st.secrets["SCRAPINGANT_API_KEY"]
+    question = current_question.get()
+    chunking = get_flag("PAGE_CHUNKING", True)
+    index = get_chunk_indexes().get(current_session_id.get()) if chunking else None
+    key = normalize_url(url)
+    
+    # A page visited earlier in the session is not fetched again
+    chunks = index.page_chunks(key) if index is not None else None
+    if chunks is None:
+        title, text = _page_text(key)
+        if index is None or len(text) <= int(get_setting("PAGE_FULL_MAX_CHARS", 6000)) or not question:
+            if index is not None:
+                index.add_page(key, title, text)
+            return f"{title}\n\n{text}" if title else text
+        index.add_page(key, title, text)
+        chunks = index.page_chunks(key)
+    
+    top_k = int(get_setting("PAGE_TOP_CHUNKS", 4))
+    if len(chunks) <= top_k:
+        return _format_chunks(chunks)
+    relevant = index.search(question or "", limit=top_k, url=key) or chunks[:top_k]
+    # Page order reads better than score order
+    return _format_chunks(sorted(relevant, key=lambda chunk: chunk.position), total=len(chunks))
 
-    conn.request("GET", f"/v2/general?url={url}&x-api-key={api_key}")
+def search_visited_pages(query: str, url: str = None):
+    """Searches the pages visited earlier in this conversation without visiting them again.
+    
+    Args:
+        query (str): What to look for in the visited pages.
+        url (str, optional): Only search this visited page.
+        
+    Returns:
+        str: The most relevant sections of the visited pages, or a message if none match.
+    """
+    
+    index = get_chunk_indexes().get(current_session_id.get())
+    if not index:
+        return {"error": "No pages have been visited in this conversation yet; use visit_any_web_site first"}
+    
+    key = normalize_url(url) if url else None
+    if key is not None and key not in index:
+        return {"error": f"{url} has not been visited in this conversation", "visited": index.pages()}
+    
+    # The user's question adds context to the model's (often terse) query
+    question = current_question.get()
+    chunks = index.search(f"{query} {question}" if question else query, limit=int(get_setting("PAGE_TOP_CHUNKS", 4)),
+                          url=key)
+    if not chunks:
+        return {"error": f"Nothing about '{query}' in the visited pages", "visited": index.pages()}
+    return _format_chunks(chunks)
+  
+def _merge_search_results(queries: List[str], result_lists: list) -> list:
+    """Interleaves the per-query results best first, dropping repeated URLs and tagging each result with its queries."""
+    merged = {}
+    for rank in range(max(map(len, result_lists), default=0)):
+        for query, results in zip(queries, result_lists):
+            if rank >= len(results):
+                continue
+            result = results[rank]
+            key = urldefrag(result.url.strip())[0].rstrip("/") or f"{query}#{rank}"
+            if key in merged:
+                merged[key].matched_queries.append(query)
+            else:
+                merged[key] = result.model_copy(update={"matched_queries": [query]})
+    return list(merged.values())
 
-    res = conn.getresponse()
-    data = res.read()
+def _search_batch_query(query: str) -> tuple:
+    """Results of one query of a batch and the error if it failed, so one failure does not sink the batch."""
+    try:
+        return tnc.get_search_results(query), None
+    except Exception as e:
+        logger.warning(f"Knowledge base search for {query!r} failed", exc_info=True)
+        return [], str(e)
 
-    return data.decode("utf-8")  
-  
-def search_TNC_knowledge_base(query: str):
+def search_TNC_knowledge_base(query: str = None, queries: List[str] = None):
     """Key word search! Searches TNC's knowledge base for articles containing the query. This function is the main source of information about TNC's initiatives, projects, reports and anything else.
     
     Args:
         query (str): The query to search for in the knowledge base.
+        queries (List[str], optional): Several queries searched concurrently and merged without duplicate URLs.
         
     Returns:
-        List[dict]: A list of dictionaries containing the article details.
+        List[dict]: A list of dictionaries containing the article details. If some of several
+            queries failed, a dict with the "results" of the others and the "failed_queries".
     """
     
-    search_results = tnc.get_search_results(query)
+    all_queries = [q.strip() for q in ([query] if query else []) + list(queries or []) if q and q.strip()]
+    all_queries = list(dict.fromkeys(all_queries))[:MAX_BATCH_QUERIES]
+    if not all_queries:
+        return {"error": "Provide a query or a list of queries"}
+    
+    failed_queries = []
+    if len(all_queries) == 1:
+        search_results = tnc.get_search_results(all_queries[0])
+        search_results = _rerank_for_question(all_queries[0], search_results, text_fields=("content",))
+    else:
+        outcomes = list(_get_search_pool().map(in_submitter_context(_search_batch_query), all_queries))
+        failed_queries = [q for q, (_, error) in zip(all_queries, outcomes) if error]
+        if len(failed_queries) == len(all_queries):
+            return {"error": f"Searches failed: {outcomes[0][1]}", "failed_queries": failed_queries}
+        result_lists = [results for results, _ in outcomes]
+        result_lists = [
+            _rerank_for_question(q, results, text_fields=("content",))
+            for q, results in zip(all_queries, result_lists)
+        ]
+        top_k = int(get_setting("RERANK_TOP_K", 8))
+        search_results = _merge_search_results(all_queries, result_lists)[:2 * top_k]
     
-    return search_results  
+    # The model usually visits one of the top results next
+    if get_flag("PREFETCH", True):
+        top_n = int(get_setting("PREFETCH_TOP_N", 3))
+        get_prefetcher().prefetch(result.url for result in search_results[:top_n] if result.url)
+    
+    if len(all_queries) == 1:
+        # matched_queries only means something when several queries were merged
+        return [result.model_dump(exclude={"matched_queries"}) for result in search_results]
+    if failed_queries:
+        return {"results": search_results, "failed_queries": failed_queries}
+    return search_results
    
-def event_search(region: str, key_word: str):
-    """Searches for events regarding TNC in a specific region containing a specific keyword.
+def event_search(region: str, key_word: str, radius_km: float = None, limit: int = None):
+    """Searches for events regarding TNC near a specific region containing a specific keyword.
     
     Args:
         region (str): The region to search for events.
         key_word (str): The keyword to search for in the event description.
+        radius_km (float, optional): Search radius around the region in km.
+        limit (int, optional): Maximum number of events to return.
         
     Returns:
-        List[dict]: A list of dictionaries containing the event details.
+        List[dict]: A list of dictionaries containing the event details, closest first.
     """
     
-    search_results = tnc.event_search(region, key_word)
+    search_results = tnc.event_search(region, key_word, radius_km=radius_km, limit=limit)
     
     return search_results
       
@@ -306,6 +417,15 @@ def news_search(query: str):
         List[dict]: A list of dictionaries containing the news article details.
     """
     
-    search_results = tnc.get_news_cards(query)
+    # The newsroom poller keeps a local index; fall back to the live newsroom search
+    news_index = get_news_index()
+    search_results = []
+    if is_fresh(news_index):
+        # More candidates than are kept, so the rerank below has a choice like on the live path
+        search_results = news_index.search(query, limit=3 * int(get_setting("RERANK_TOP_K", 8)))
+    # A topic with only a hit or two among recent news is worth a live search
+    if not search_results or len(search_results) < min(3, len(news_index)):
+        search_results = tnc.get_news_cards(query)
+        news_index.add(search_results)
     
-    return search_results
\ No newline at end of file
+    return _rerank_for_question(query, search_results, text_fields=("excerpt", "byline"))
\ No newline at end of file
@@ -0,0 +1,279 @@
+"""
+Per-session index of the pages a conversation has visited, split into
+chunks, so follow-up questions about a long page are answered from its
+most relevant chunks instead of fetching and sending the whole page again.
+
+Chunk terms are kept as flat numpy arrays (term id, chunk, count), the
+same layout as a sparse matrix in CSR form. A query is scored with BM25
+over the postings of its own terms in a few vectorized operations.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional
+import numpy as np
+from .memory import register_evictor
+from .rerank import tokenize
+from .settings import get_setting
+
+logger = logging.getLogger("ChunkIndex")
+
+# Section titles are taken from a chunk's first line if it is at most this long.
+_MAX_HEADING_CHARS = 80
+
+
+class Chunk(NamedTuple):
+    url: str
+    title: str
+    position: int
+    section: str
+    text: str
+
+
+def split_chunks(text: str, chunk_chars: int = 1200) -> List[str]:
+    """
+    Split page text (one block per line) into chunks of about chunk_chars
+    characters, on line boundaries. A single longer line is split on spaces.
+    """
+    chunks, current, size = [], [], 0
+    for line in text.splitlines():
+        line = line.strip()
+        while len(line) > chunk_chars:
+            cut = line.rfind(" ", 0, chunk_chars)
+            cut = cut if cut > 0 else chunk_chars
+            if current:
+                chunks.append("\n".join(current))
+                current, size = [], 0
+            chunks.append(line[:cut])
+            line = line[cut:].strip()
+        if not line:
+            continue
+        if current and size + len(line) > chunk_chars:
+            chunks.append("\n".join(current))
+            current, size = [], 0
+        current.append(line)
+        size += len(line) + 1
+    if current:
+        chunks.append("\n".join(current))
+    return chunks
+
+
+class ChunkIndex:
+    """BM25 index over the chunks of a bounded number of pages, least recently visited dropped first."""
+
+    def __init__(self, chunk_chars: int = 1200, max_pages: int = 20):
+        """
+        Args:
+            chunk_chars: Target chunk size in characters
+            max_pages: Pages kept; visiting another drops the least recently visited one
+        """
+        self.chunk_chars = chunk_chars
+        self.max_pages = max_pages
+        self._lock = threading.Lock()
+        # url -> (title, chunks with their term ids and counts)
+        self._pages: "OrderedDict[str, tuple]" = OrderedDict()
+        self._vocab: Dict[str, int] = {}
+        self._compiled = None
+        self.last_used = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._pages)
+
+    def __contains__(self, url: str) -> bool:
+        return url in self._pages
+
+    def add_page(self, url: str, title: str, text: str) -> int:
+        """
+        Index a page, replacing an earlier copy of it.
+
+        Returns:
+            Number of chunks
+        """
+        chunks = []
+        for position, chunk_text in enumerate(split_chunks(text, self.chunk_chars)):
+            first_line = chunk_text.split("\n", 1)[0]
+            section = first_line if len(first_line) <= _MAX_HEADING_CHARS else ""
+            chunks.append(Chunk(url, title, position, section, chunk_text))
+        with self._lock:
+            postings = []
+            for chunk in chunks:
+                # The page title counts towards every chunk of the page
+                tokens = tokenize(f"{chunk.title} {chunk.section} {chunk.text}")
+                ids = np.fromiter((self._vocab.setdefault(token, len(self._vocab)) for token in tokens),
+                                  dtype=np.int32, count=len(tokens))
+                terms, counts = np.unique(ids, return_counts=True)
+                postings.append((terms, counts.astype(np.float32), len(tokens)))
+            self._pages[url] = (title, chunks, postings)
+            self._pages.move_to_end(url)
+            if len(self._pages) > self.max_pages:
+                while len(self._pages) > self.max_pages:
+                    self._pages.popitem(last=False)
+                self._compact_vocab()
+            self._compiled = None
+            self.last_used = time.monotonic()
+        return len(chunks)
+
+    def _compact_vocab(self) -> None:
+        """
+        Drop the terms only dropped pages used once they make up half of the
+        vocabulary, renumbering the rest. Called with the lock held.
+        """
+        used = [terms for _, _, postings in self._pages.values() for terms, _, _ in postings]
+        used = np.unique(np.concatenate(used)) if used else np.empty(0, dtype=np.int32)
+        if 2 * len(used) > len(self._vocab):
+            return
+        # Renumbering keeps the order of the ids, so each chunk's terms stay sorted
+        remap = np.full(len(self._vocab), -1, dtype=np.int32)
+        remap[used] = np.arange(len(used), dtype=np.int32)
+        self._vocab = {token: int(remap[i]) for token, i in self._vocab.items() if remap[i] >= 0}
+        for url, (title, chunks, postings) in self._pages.items():
+            self._pages[url] = (title, chunks, [(remap[terms], counts, length) for terms, counts, length in postings])
+
+    def page_chunks(self, url: str) -> Optional[List[Chunk]]:
+        """The chunks of an indexed page in page order, or None if it is not indexed."""
+        with self._lock:
+            page = self._pages.get(url)
+            if page is None:
+                return None
+            self._pages.move_to_end(url)
+            self.last_used = time.monotonic()
+            return list(page[1])
+
+    def _compile(self):
+        """Flatten the postings of every chunk into (term, chunk, count) arrays. Called with the lock held."""
+        chunks, terms, owners, counts, lengths = [], [], [], [], []
+        for _, page_chunks, postings in self._pages.values():
+            for chunk, (chunk_terms, chunk_counts, length) in zip(page_chunks, postings):
+                owners.append(np.full(len(chunk_terms), len(chunks), dtype=np.int32))
+                terms.append(chunk_terms)
+                counts.append(chunk_counts)
+                lengths.append(length)
+                chunks.append(chunk)
+        if not chunks:
+            return chunks, None
+        term_ids = np.concatenate(terms)
+        lengths = np.array(lengths, dtype=np.float32)
+        df = np.bincount(term_ids, minlength=len(self._vocab)).astype(np.float32)
+        idf = np.log1p((len(chunks) - df + 0.5) / (df + 0.5))
+        return chunks, (term_ids, np.concatenate(owners), np.concatenate(counts), lengths, idf)
+
+    def search(self, query: str, limit: int = 4, url: Optional[str] = None, k1: float = 1.2,
+               b: float = 0.75) -> List[Chunk]:
+        """
+        Find the chunks most relevant to a query.
+
+        Args:
+            query: Free text, e.g. the user's question
+            limit: Maximum number of chunks
+            url: Only chunks of this page
+            k1: BM25 term frequency saturation
+            b: BM25 length normalization
+
+        Returns:
+            Matching chunks, best first; chunks matching no query term are left out
+        """
+        with self._lock:
+            if self._compiled is None:
+                self._compiled = self._compile()
+            chunks, arrays = self._compiled
+            query_ids = np.array(sorted({self._vocab[t] for t in tokenize(query) if t in self._vocab}), dtype=np.int32)
+            self.last_used = time.monotonic()
+        if arrays is None or not len(query_ids):
+            return []
+        term_ids, owners, counts, lengths, idf = arrays
+        hits = np.isin(term_ids, query_ids)
+        owner, tf = owners[hits], counts[hits]
+        norm = k1 * (1 - b + b * lengths[owner] / (lengths.mean() or 1.0))
+        scores = np.bincount(owner, weights=tf * (k1 + 1) / (tf + norm) * idf[term_ids[hits]],
+                             minlength=len(chunks))
+        if url is not None:
+            scores[[i for i, chunk in enumerate(chunks) if chunk.url != url]] = 0
+        order = np.argsort(-scores, kind="stable")[:limit]
+        return [chunks[i] for i in order if scores[i] > 0]
+
+    def pages(self) -> List[Dict[str, object]]:
+        """Indexed pages, most recently visited last."""
+        with self._lock:
+            return [{"url": url, "title": title, "chunks": len(chunks)} for url, (title, chunks, _) in self._pages.items()]
+
+
+class SessionChunkIndexes:
+    """One ChunkIndex per session, for a bounded number of recently active sessions."""
+
+    def __init__(self, max_sessions: int = 256, idle_seconds: float = 1800.0, chunk_chars: int = 1200,
+                 max_pages: int = 20):
+        """
+        Args:
+            max_sessions: Sessions kept; the least recently active one is dropped beyond that
+            idle_seconds: Indexes of sessions idle for this long are dropped
+            chunk_chars: Target chunk size in characters
+            max_pages: Pages kept per session
+        """
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.chunk_chars = chunk_chars
+        self.max_pages = max_pages
+        self._lock = threading.Lock()
+        self._indexes: "OrderedDict[str, ChunkIndex]" = OrderedDict()
+
+    def get(self, session_id: Optional[str]) -> ChunkIndex:
+        """
+        The index of a session, created on first use. Requests without a
+        session get a fresh index that is not kept.
+        """
+        if not session_id:
+            return ChunkIndex(self.chunk_chars, self.max_pages)
+        with self._lock:
+            index = self._indexes.get(session_id)
+            if index is None:
+                index = self._indexes[session_id] = ChunkIndex(self.chunk_chars, self.max_pages)
+            self._indexes.move_to_end(session_id)
+            cutoff = time.monotonic() - self.idle_seconds
+            while self._indexes and (len(self._indexes) > self.max_sessions
+                                     or next(iter(self._indexes.values())).last_used < cutoff):
+                oldest = next(iter(self._indexes))
+                if oldest == session_id:
+                    break
+                del self._indexes[oldest]
+            return index
+
+    def has_pages(self, session_id: Optional[str]) -> bool:
+        """Whether a session has visited any page."""
+        with self._lock:
+            index = self._indexes.get(session_id) if session_id else None
+            return bool(index)
+
+    def clear(self) -> int:
+        """
+        Drop every session's index.
+
+        Returns:
+            Number of indexes dropped
+        """
+        with self._lock:
+            dropped = len(self._indexes)
+            self._indexes.clear()
+        return dropped
+
+
+_indexes: Optional[SessionChunkIndexes] = None
+_indexes_lock = threading.Lock()
+
+
+def get_chunk_indexes() -> SessionChunkIndexes:
+    """
+    Return the process-wide per-session chunk indexes, configured from
+    PAGE_CHUNK_CHARS, PAGE_CHUNK_MAX_PAGES and SESSION_IDLE_SECONDS.
+    """
+    global _indexes
+    if _indexes is None:
+        with _indexes_lock:
+            if _indexes is None:
+                _indexes = SessionChunkIndexes(
+                    idle_seconds=float(get_setting("SESSION_IDLE_SECONDS", 1800)),
+                    chunk_chars=int(get_setting("PAGE_CHUNK_CHARS", 1200)),
+                    max_pages=int(get_setting("PAGE_CHUNK_MAX_PAGES", 20)),
+                )
+                register_evictor("chunk indexes", _indexes.clear)
+    return _indexes
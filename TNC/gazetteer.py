@@ -0,0 +1,334 @@
+import math
+import re
+from functools import lru_cache
+from typing import Dict, Generic, Iterable, List, NamedTuple, Optional, Set, Tuple, TypeVar
+
+EARTH_RADIUS_KM = 6371.0
+
+
+class Place(NamedTuple):
+    name: str
+    kind: str  # "city", "region" or "state"
+    state: str
+    lat: float
+    lon: float
+    radius_km: float
+
+
+# name, code, latitude, longitude, approximate radius in km
+_STATES = [
+    ("Alabama", "AL", 32.8, -86.8, 250), ("Alaska", "AK", 64.0, -150.0, 1000),
+    ("Arizona", "AZ", 34.3, -111.7, 350), ("Arkansas", "AR", 34.9, -92.4, 220),
+    ("California", "CA", 37.2, -119.5, 600), ("Colorado", "CO", 39.0, -105.5, 300),
+    ("Connecticut", "CT", 41.6, -72.7, 80), ("Delaware", "DE", 39.0, -75.5, 70),
+    ("Florida", "FL", 28.6, -82.4, 450), ("Georgia", "GA", 32.7, -83.4, 250),
+    ("Hawaii", "HI", 20.8, -156.3, 300), ("Idaho", "ID", 44.4, -114.6, 350),
+    ("Illinois", "IL", 40.0, -89.2, 300), ("Indiana", "IN", 39.9, -86.3, 220),
+    ("Iowa", "IA", 42.1, -93.5, 250), ("Kansas", "KS", 38.5, -98.4, 320),
+    ("Kentucky", "KY", 37.5, -85.3, 300), ("Louisiana", "LA", 31.1, -92.0, 250),
+    ("Maine", "ME", 45.4, -69.2, 250), ("Maryland", "MD", 39.0, -76.8, 180),
+    ("Massachusetts", "MA", 42.3, -71.8, 150), ("Michigan", "MI", 44.3, -85.4, 400),
+    ("Minnesota", "MN", 46.3, -94.3, 350), ("Mississippi", "MS", 32.7, -89.7, 250),
+    ("Missouri", "MO", 38.4, -92.5, 300), ("Montana", "MT", 47.0, -109.6, 450),
+    ("Nebraska", "NE", 41.5, -99.8, 350), ("Nevada", "NV", 39.3, -116.6, 400),
+    ("New Hampshire", "NH", 43.7, -71.6, 120), ("New Jersey", "NJ", 40.2, -74.7, 120),
+    ("New Mexico", "NM", 34.4, -106.1, 350), ("New York", "NY", 42.9, -75.5, 350),
+    ("North Carolina", "NC", 35.6, -79.4, 350), ("North Dakota", "ND", 47.5, -100.5, 300),
+    ("Ohio", "OH", 40.3, -82.8, 220), ("Oklahoma", "OK", 35.6, -97.5, 350),
+    ("Oregon", "OR", 43.9, -120.6, 350), ("Pennsylvania", "PA", 40.9, -77.8, 250),
+    ("Rhode Island", "RI", 41.7, -71.5, 40), ("South Carolina", "SC", 33.9, -80.9, 220),
+    ("South Dakota", "SD", 44.4, -100.2, 300), ("Tennessee", "TN", 35.9, -86.4, 350),
+    ("Texas", "TX", 31.5, -99.3, 650), ("Utah", "UT", 39.3, -111.7, 300),
+    ("Vermont", "VT", 44.1, -72.7, 120), ("Virginia", "VA", 37.5, -78.9, 300),
+    ("Washington", "WA", 47.4, -120.5, 300), ("West Virginia", "WV", 38.6, -80.6, 180),
+    ("Wisconsin", "WI", 44.6, -89.9, 280), ("Wyoming", "WY", 43.0, -107.6, 320),
+    ("District of Columbia", "DC", 38.9, -77.0, 15),
+]
+
+# name, state code, latitude, longitude
+_CITIES = [
+    ("New York", "NY", 40.71, -74.01), ("Los Angeles", "CA", 34.05, -118.24), ("Chicago", "IL", 41.88, -87.63),
+    ("Houston", "TX", 29.76, -95.37), ("Phoenix", "AZ", 33.45, -112.07), ("Philadelphia", "PA", 39.95, -75.17),
+    ("San Antonio", "TX", 29.42, -98.49), ("San Diego", "CA", 32.72, -117.16), ("Dallas", "TX", 32.78, -96.80),
+    ("Austin", "TX", 30.27, -97.74), ("San Francisco", "CA", 37.77, -122.42), ("Seattle", "WA", 47.61, -122.33),
+    ("Denver", "CO", 39.74, -104.99), ("Boulder", "CO", 40.01, -105.27), ("Colorado Springs", "CO", 38.83, -104.82),
+    ("Fort Collins", "CO", 40.59, -105.08), ("Aspen", "CO", 39.19, -106.82), ("Telluride", "CO", 37.94, -107.81),
+    ("Durango", "CO", 37.28, -107.88), ("Grand Junction", "CO", 39.06, -108.55), ("Boston", "MA", 42.36, -71.06),
+    ("Washington DC", "DC", 38.91, -77.04), ("Arlington", "VA", 38.88, -77.10), ("Atlanta", "GA", 33.75, -84.39),
+    ("Savannah", "GA", 32.08, -81.09), ("Miami", "FL", 25.76, -80.19), ("Orlando", "FL", 28.54, -81.38),
+    ("Tampa", "FL", 27.95, -82.46), ("Jacksonville", "FL", 30.33, -81.66), ("Tallahassee", "FL", 30.44, -84.28),
+    ("Key West", "FL", 24.56, -81.78), ("Minneapolis", "MN", 44.98, -93.27), ("Saint Paul", "MN", 44.95, -93.09),
+    ("Portland", "OR", 45.52, -122.68), ("Portland", "ME", 43.66, -70.26), ("Eugene", "OR", 44.05, -123.09),
+    ("Bend", "OR", 44.06, -121.31), ("Salt Lake City", "UT", 40.76, -111.89), ("Park City", "UT", 40.65, -111.50),
+    ("Moab", "UT", 38.57, -109.55), ("Las Vegas", "NV", 36.17, -115.14), ("Reno", "NV", 39.53, -119.81),
+    ("Albuquerque", "NM", 35.08, -106.65), ("Santa Fe", "NM", 35.69, -105.94), ("Tucson", "AZ", 32.22, -110.97),
+    ("Flagstaff", "AZ", 35.20, -111.65), ("Boise", "ID", 43.62, -116.20), ("Sacramento", "CA", 38.58, -121.49),
+    ("Nashville", "TN", 36.16, -86.78), ("Memphis", "TN", 35.15, -90.05), ("Knoxville", "TN", 35.96, -83.92),
+    ("New Orleans", "LA", 29.95, -90.07), ("Saint Louis", "MO", 38.63, -90.20), ("Kansas City", "MO", 39.10, -94.58),
+    ("Omaha", "NE", 41.26, -95.93), ("Lincoln", "NE", 40.81, -96.70), ("Detroit", "MI", 42.33, -83.05),
+    ("Lansing", "MI", 42.73, -84.56), ("Cleveland", "OH", 41.50, -81.69), ("Columbus", "OH", 39.96, -83.00),
+    ("Cincinnati", "OH", 39.10, -84.51), ("Pittsburgh", "PA", 40.44, -79.99), ("Baltimore", "MD", 39.29, -76.61),
+    ("Annapolis", "MD", 38.98, -76.49), ("Richmond", "VA", 37.54, -77.44), ("Charlottesville", "VA", 38.03, -78.48),
+    ("Charlotte", "NC", 35.23, -80.84), ("Raleigh", "NC", 35.78, -78.64), ("Durham", "NC", 35.99, -78.90),
+    ("Asheville", "NC", 35.60, -82.55), ("Charleston", "SC", 32.78, -79.93), ("Columbia", "SC", 34.00, -81.03),
+    ("Anchorage", "AK", 61.22, -149.90), ("Juneau", "AK", 58.30, -134.42), ("Honolulu", "HI", 21.31, -157.86),
+    ("Hilo", "HI", 19.71, -155.09), ("Albany", "NY", 42.65, -73.76), ("Buffalo", "NY", 42.89, -78.88),
+    ("Rochester", "NY", 43.16, -77.61), ("Syracuse", "NY", 43.05, -76.15), ("Hartford", "CT", 41.76, -72.69),
+    ("New Haven", "CT", 41.31, -72.92), ("Providence", "RI", 41.82, -71.41), ("Burlington", "VT", 44.48, -73.21),
+    ("Concord", "NH", 43.21, -71.54), ("Newark", "NJ", 40.74, -74.17), ("Wilmington", "DE", 39.74, -75.55),
+    ("Madison", "WI", 43.07, -89.40), ("Milwaukee", "WI", 43.04, -87.91), ("Indianapolis", "IN", 39.77, -86.16),
+    ("Louisville", "KY", 38.25, -85.76), ("Lexington", "KY", 38.04, -84.50), ("Little Rock", "AR", 34.75, -92.29),
+    ("Birmingham", "AL", 33.52, -86.80), ("Jackson", "MS", 32.30, -90.18), ("Oklahoma City", "OK", 35.47, -97.52),
+    ("Tulsa", "OK", 36.15, -95.99), ("Wichita", "KS", 37.69, -97.34), ("Billings", "MT", 45.78, -108.50),
+    ("Missoula", "MT", 46.87, -113.99), ("Bozeman", "MT", 45.68, -111.04), ("Cheyenne", "WY", 41.14, -104.82),
+    ("Jackson Hole", "WY", 43.48, -110.76), ("Fargo", "ND", 46.88, -96.79), ("Bismarck", "ND", 46.81, -100.78),
+    ("Sioux Falls", "SD", 43.55, -96.73), ("Rapid City", "SD", 44.08, -103.23), ("Des Moines", "IA", 41.59, -93.62),
+    ("Spokane", "WA", 47.66, -117.43), ("Tacoma", "WA", 47.25, -122.44), ("Olympia", "WA", 47.04, -122.90),
+    ("El Paso", "TX", 31.76, -106.49), ("Fort Davis", "TX", 30.59, -103.89), ("Alpine", "TX", 30.36, -103.66),
+    ("Marfa", "TX", 30.31, -104.02), ("Midland", "TX", 32.00, -102.08), ("Fort Worth", "TX", 32.76, -97.33),
+    ("Corpus Christi", "TX", 27.80, -97.40), ("Fresno", "CA", 36.74, -119.79), ("Monterey", "CA", 36.60, -121.89),
+    ("Santa Barbara", "CA", 34.42, -119.70), ("Oakland", "CA", 37.80, -122.27), ("Palm Springs", "CA", 33.83, -116.55),
+]
+
+# TNC chapter and landscape regions: name, state code, latitude, longitude, approximate radius in km
+_REGIONS = [
+    ("West Texas", "TX", 31.0, -103.5, 250), ("Davis Mountains", "TX", 30.6, -104.1, 60),
+    ("Texas Hill Country", "TX", 30.0, -99.0, 150), ("Upstate New York", "NY", 43.0, -75.5, 250),
+    ("Long Island", "NY", 40.8, -73.1, 80), ("Adirondacks", "NY", 44.1, -74.3, 100),
+    ("Hudson Valley", "NY", 41.7, -73.9, 80), ("Catskills", "NY", 42.1, -74.4, 60),
+    ("Front Range", "CO", 39.7, -105.2, 150), ("Western Slope", "CO", 39.0, -108.0, 150),
+    ("Eastern Shore", "MD", 38.4, -75.8, 100), ("Chesapeake Bay", "MD", 38.5, -76.4, 150),
+    ("Puget Sound", "WA", 47.6, -122.5, 100), ("Columbia River Gorge", "OR", 45.7, -121.8, 80),
+    ("Central Valley", "CA", 36.8, -119.8, 250), ("Southern California", "CA", 34.0, -117.5, 200),
+    ("Northern California", "CA", 39.5, -122.0, 250), ("Bay Area", "CA", 37.8, -122.3, 70),
+    ("Mojave Desert", "CA", 35.0, -116.0, 150), ("Sonoran Desert", "AZ", 32.5, -112.5, 200),
+    ("Florida Keys", "FL", 24.7, -81.2, 120), ("Florida Panhandle", "FL", 30.4, -86.0, 200),
+    ("Everglades", "FL", 25.8, -80.9, 100), ("Upper Peninsula", "MI", 46.5, -87.0, 250),
+    ("Black Hills", "SD", 44.0, -103.7, 80), ("Great Smoky Mountains", "TN", 35.6, -83.5, 80),
+    ("Ozarks", "MO", 36.5, -92.5, 200), ("Sandhills", "NE", 42.0, -101.0, 200),
+    ("Flint Hills", "KS", 38.5, -96.5, 120), ("Lowcountry", "SC", 32.6, -80.3, 100),
+    ("Cape Cod", "MA", 41.7, -70.3, 60), ("Pocono Mountains", "PA", 41.1, -75.4, 70),
+    ("Great Salt Lake", "UT", 41.1, -112.5, 100), ("Pacific Northwest", "WA", 46.0, -122.0, 450),
+    ("New England", "MA", 43.5, -71.5, 350), ("Gulf Coast", "TX", 29.5, -92.0, 600),
+]
+
+# Default radius for cities, which are listed without one.
+CITY_RADIUS_KM = 80.0
+
+_ALIASES = {
+    "nyc": "new york", "new york city": "new york", "big apple": "new york",
+    "dc": "washington dc", "washington d c": "washington dc", "district of columbia": "washington dc",
+    "st louis": "saint louis", "st paul": "saint paul", "la": "los angeles", "sf": "san francisco",
+    "the keys": "florida keys", "adirondack": "adirondacks", "adirondack mountains": "adirondacks",
+    "smokies": "great smoky mountains", "smoky mountains": "great smoky mountains", "poconos": "pocono mountains",
+    "catskill mountains": "catskills", "hill country": "texas hill country", "socal": "southern california",
+    "norcal": "northern california", "the upper peninsula": "upper peninsula", "the ozarks": "ozarks",
+    "nebraska sandhills": "sandhills", "columbia gorge": "columbia river gorge",
+    "upstate ny": "upstate new york", "upstate": "upstate new york",
+}
+
+# Words around a place name that do not change where it is.
+_FILLER = {
+    "united", "states", "usa", "us", "u", "s", "america", "area", "metro", "greater", "near", "around",
+    "in", "the", "of", "region", "county", "city", "downtown", "state",
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# State codes count when written in capitals ("CO") or after a comma at the end ("Portland, me")
+_UPPER_CODE_RE = re.compile(r"\b[A-Z]{2}\b")
+_TRAILING_CODE_RE = re.compile(r",\s*([A-Za-z]{2})\.?\s*$")
+
+
+def normalize_place(text: str) -> str:
+    """Lowercase a place name and reduce it to space-separated alphanumeric words."""
+    return " ".join(_TOKEN_RE.findall(text.lower()))
+
+
+def _build_index() -> Tuple[Dict[str, List[Place]], Dict[str, Place]]:
+    names: Dict[str, List[Place]] = {}
+    codes: Dict[str, Place] = {}
+
+    def add(key: str, place: Place) -> None:
+        names.setdefault(normalize_place(key), []).append(place)
+
+    # Cities first, so "New York" means the city unless the state is asked for
+    for name, state, lat, lon in _CITIES:
+        add(name, Place(name, "city", state, lat, lon, CITY_RADIUS_KM))
+    for name, state, lat, lon, radius in _REGIONS:
+        add(name, Place(name, "region", state, lat, lon, radius))
+    for name, code, lat, lon, radius in _STATES:
+        place = Place(name, "state", code, lat, lon, radius)
+        add(name, place)
+        add(f"{name} state", place)
+        codes[code.lower()] = place
+
+    for alias, target in _ALIASES.items():
+        names.setdefault(alias, []).extend(names.get(target, []))
+    return names, codes
+
+
+NAME_INDEX, STATE_CODES = _build_index()
+_MAX_NAME_WORDS = max(len(name.split()) for name in NAME_INDEX)
+
+
+def _state_codes_in(region: str) -> Set[str]:
+    """Lowercased state codes written as codes in a region, e.g. {"co"} for "Boulder, CO"."""
+    codes = {code.lower() for code in _UPPER_CODE_RE.findall(region)}
+    codes = {code for code in codes if code in STATE_CODES and code not in _FILLER}
+    trailing = _TRAILING_CODE_RE.search(region)
+    if trailing and trailing.group(1).lower() in STATE_CODES:
+        codes.add(trailing.group(1).lower())
+    return codes
+
+
+@lru_cache(maxsize=4096)
+def resolve_region(region: str) -> Optional[Place]:
+    """
+    Resolve a free-text region ("Boulder, CO", "West Texas", "United States
+    Washington") to a known place.
+
+    The longest known place name in the text wins. Ties go to the place whose
+    state is also mentioned (e.g. "Portland, ME"), then to the more specific
+    place. Two-letter state codes only count when written in capitals or
+    after a trailing comma ("Portland, me"), since many of them are also
+    English words ("hi", "me", "or").
+
+    Args:
+        region: The region as written by the user or the model
+
+    Returns:
+        The matching place, or None if nothing in the text is known
+    """
+    text = normalize_place(region)
+    if not text:
+        return None
+    if text in NAME_INDEX:
+        return NAME_INDEX[text][0]
+    codes = _state_codes_in(region)
+    if text in codes:
+        return STATE_CODES[text]
+
+    tokens = text.split()
+    hinted_states = {STATE_CODES[code].state for code in codes}
+
+    for size in range(min(_MAX_NAME_WORDS, len(tokens)), 0, -1):
+        candidates = []
+        for start in range(len(tokens) - size + 1):
+            words = tokens[start:start + size]
+            if size == 1 and words[0] in _FILLER:
+                continue
+            candidates.extend(NAME_INDEX.get(" ".join(words), []))
+        if candidates:
+            hinted = [place for place in candidates if place.state in hinted_states]
+            return (hinted or candidates)[0]
+
+    # Nothing but a state code, e.g. "US-CO"
+    if len(hinted_states) == 1 and all(token in codes or token in _FILLER for token in tokens):
+        return STATE_CODES[next(iter(hinted_states)).lower()]
+    return None
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two points in kilometers."""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi, dlambda = phi2 - phi1, math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+T = TypeVar("T")
+
+# Kilometers per degree of latitude.
+_KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+class GridIndex(Generic[T]):
+    """
+    Spatial index bucketing items into fixed-size latitude/longitude cells, for
+    radius and nearest-N queries without scanning every item.
+    """
+
+    def __init__(self, points: Iterable[Tuple[float, float, T]], cell_degrees: float = 1.0):
+        """
+        Args:
+            points: (latitude, longitude, item) tuples
+            cell_degrees: Cell size in degrees
+        """
+        self.cell_degrees = cell_degrees
+        self._cells: Dict[Tuple[int, int], List[Tuple[float, float, T]]] = {}
+        self._size = 0
+        for lat, lon, item in points:
+            self._cells.setdefault(self._cell(lat, lon), []).append((lat, lon, item))
+            self._size += 1
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _cell(self, lat: float, lon: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_degrees), math.floor(lon / self.cell_degrees)
+
+    def _ring(self, center: Tuple[int, int], ring: int) -> Iterable[Tuple[int, int]]:
+        row, col = center
+        if ring == 0:
+            yield center
+            return
+        for d in range(-ring, ring + 1):
+            yield row - ring, col + d
+            yield row + ring, col + d
+        for d in range(-ring + 1, ring):
+            yield row + d, col - ring
+            yield row + d, col + ring
+
+    def _ring_min_km(self, lat: float, ring: int) -> float:
+        # Closest any point in ring `ring` can be; longitude cells shrink towards the poles
+        if ring == 0:
+            return 0.0
+        shrink = max(math.cos(math.radians(min(89.0, abs(lat) + ring * self.cell_degrees))), 0.01)
+        return (ring - 1) * self.cell_degrees * _KM_PER_DEGREE * shrink
+
+    def nearest(self, lat: float, lon: float, n: int = 5, max_km: Optional[float] = None) -> List[Tuple[float, T]]:
+        """
+        Return the n items closest to a point.
+
+        Args:
+            lat: Latitude of the point
+            lon: Longitude of the point
+            n: Maximum number of items
+            max_km: Ignore items farther away than this
+
+        Returns:
+            (distance in km, item) tuples, closest first
+        """
+        if not self._size:
+            return []
+        center = self._cell(lat, lon)
+        found: List[Tuple[float, T]] = []
+        scanned = 0
+        # Enough rings to cover the whole globe in the worst case
+        max_ring = int(360 / self.cell_degrees) + 1
+        for ring in range(max_ring):
+            lower_bound = self._ring_min_km(lat, ring)
+            if max_km is not None and lower_bound > max_km:
+                break
+            if len(found) >= n and lower_bound > found[n - 1][0]:
+                break
+            for cell in self._ring(center, ring):
+                for item_lat, item_lon, item in self._cells.get(cell, ()):
+                    scanned += 1
+                    distance = haversine_km(lat, lon, item_lat, item_lon)
+                    if max_km is None or distance <= max_km:
+                        found.append((distance, item))
+            found.sort(key=lambda entry: entry[0])
+            if scanned == self._size:
+                break
+        return found[:n]
+
+    def within(self, lat: float, lon: float, radius_km: float) -> List[Tuple[float, T]]:
+        """
+        Return every item within a radius of a point.
+
+        Returns:
+            (distance in km, item) tuples, closest first
+        """
+        return self.nearest(lat, lon, n=self._size, max_km=radius_km)
@@ -0,0 +1,335 @@
+"""
+Memory accounting for the long-running server processes.
+
+With MEMORY_TRACE on, allocations are traced with tracemalloc. Each tracked
+request's net growth in traced memory is attributed to it and its session.
+A background thread then logs, every MEMORY_REPORT_INTERVAL seconds:
+  - the code that grew the most since the last report, grouped by the
+    innermost frame in this repository, so growth inside BeautifulSoup or
+    json is charged to our caller;
+  - counts of our model objects, message dicts and parse trees;
+  - the sessions whose requests retained the most.
+Requests overlap, so per-request figures are approximate under load.
+
+Independently of tracing, MEMORY_SOFT_LIMIT_MB sets a soft ceiling on the
+resident set size. Above it, the registered evictors (page store, prefetcher,
+idle sessions) are called in turn until memory is back under the limit.
+"""
+import contextlib
+import functools
+import gc
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from .settings import get_flag, get_setting
+
+logger = logging.getLogger("Memory")
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Frames that are never worth reporting: the tracer itself and the import system.
+_TRACE_FILTERS = [
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+    tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+    tracemalloc.Filter(False, "<unknown>"),
+]
+
+# Seconds between two eviction rounds, so memory the allocator keeps after
+# an eviction does not trigger eviction again right away.
+_EVICTION_COOLDOWN = 60.0
+
+# Evictors in registration order: (name, callable returning the number of items freed).
+_evictors: List[Tuple[str, Callable[[], int]]] = []
+_evictors_lock = threading.Lock()
+
+
+def register_evictor(name: str, evict: Callable[[], int]) -> None:
+    """
+    Register a cache that can give memory back under pressure. Evictors are
+    called in registration order; registering a name again replaces it.
+
+    Args:
+        name: Name used in the logs
+        evict: Drops (part of) the cache and returns how many items it freed
+    """
+    with _evictors_lock:
+        for i, (existing, _) in enumerate(_evictors):
+            if existing == name:
+                _evictors[i] = (name, evict)
+                return
+        _evictors.append((name, evict))
+
+
+def rss_bytes() -> Optional[int]:
+    """Resident set size of this process, or None where /proc is not available."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _mb(size: float, signed: bool = False) -> str:
+    return f"{size / (1 << 20):{'+' if signed else ''}.1f} MB"
+
+
+def _owner(traceback: tracemalloc.Traceback) -> str:
+    """The innermost frame in this repository, or the innermost frame if none is."""
+    for frame in reversed(traceback):
+        if frame.filename.startswith(_ROOT) and frame.filename != __file__:
+            return f"{os.path.relpath(frame.filename, _ROOT)}:{frame.lineno}"
+    frame = traceback[-1]
+    return f"{'/'.join(frame.filename.replace(os.sep, '/').split('/')[-2:])}:{frame.lineno}"
+
+
+def count_objects() -> Dict[str, int]:
+    """
+    Count live instances of the models, chat message dicts and parse trees,
+    and the characters held in tool messages. Walks every object the garbage
+    collector tracks, so it takes a while on a large heap.
+    """
+    from .models import EventCard, NewsCard, SearchResult
+
+    types: Dict[str, type] = {"SearchResult": SearchResult, "NewsCard": NewsCard, "EventCard": EventCard}
+    if "bs4" in sys.modules:
+        bs4 = sys.modules["bs4"]
+        types.update(BeautifulSoup=bs4.BeautifulSoup, Tag=bs4.element.Tag)
+    counts = dict.fromkeys(list(types) + ["message dicts", "tool message chars"], 0)
+    seen = set()
+
+    def count_message(item: Any) -> None:
+        if type(item) is dict and "role" in item and id(item) not in seen:
+            seen.add(id(item))
+            counts["message dicts"] += 1
+            if item["role"] == "tool" and isinstance(item.get("content"), str):
+                counts["tool message chars"] += len(item["content"])
+
+    for obj in gc.get_objects():
+        for name, cls in types.items():
+            if isinstance(obj, cls):
+                counts[name] += 1
+        count_message(obj)
+        # Dicts holding only strings are not tracked by the collector; find them through their lists
+        if type(obj) is list:
+            for item in obj:
+                count_message(item)
+    return counts
+
+
+class MemoryMonitor:
+    """
+    Periodic memory reports and soft-ceiling eviction; see the module
+    docstring.
+    """
+
+    def __init__(self, trace: bool = False, frames: int = 8, interval: float = 600.0, top: int = 10,
+                 soft_limit: Optional[int] = None, check_interval: float = 30.0):
+        """
+        Args:
+            trace: Trace allocations with tracemalloc (slows allocation down noticeably)
+            frames: Frames kept per traced allocation
+            interval: Seconds between reports (tracing only)
+            top: Growth sites and sessions listed per report
+            soft_limit: Resident bytes above which caches are evicted; None for no ceiling
+            check_interval: Seconds between checks against the ceiling
+        """
+        self.trace = trace
+        self.frames = frames
+        self.interval = interval
+        self.top = top
+        self.soft_limit = soft_limit
+        self.check_interval = check_interval
+        self._lock = threading.Lock()
+        self._previous: Optional[tracemalloc.Snapshot] = None
+        self._previous_counts: Dict[str, int] = {}
+        self._last_eviction = 0.0
+        # label -> [requests, net bytes], session -> [requests, net bytes]
+        self.requests: Dict[str, List[int]] = {}
+        self.sessions: Dict[str, List[int]] = {}
+        self.stats = {"reports": 0, "evictions": 0, "evicted_items": 0}
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self) -> None:
+        if self.trace and not tracemalloc.is_tracing():
+            tracemalloc.start(self.frames)
+            self._previous = self._snapshot()
+            logger.info(f"Tracing allocations with {self.frames} frame(s)")
+        if self._thread is None and (self.trace or self.soft_limit):
+            self._thread = threading.Thread(target=self._run, name="memory-monitor", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def _snapshot(self) -> tracemalloc.Snapshot:
+        return tracemalloc.take_snapshot().filter_traces(_TRACE_FILTERS)
+
+    # -- attribution --------------------------------------------------------
+
+    @contextlib.contextmanager
+    def _tracked(self, label: str, session: Optional[Callable[[], Optional[str]]]):
+        start = tracemalloc.get_traced_memory()[0]
+        try:
+            yield
+        finally:
+            grown = tracemalloc.get_traced_memory()[0] - start
+            # The session id may only be set once the request has started
+            session_id = (session() if session else None) or "-"
+            with self._lock:
+                for table, key in ((self.requests, label), (self.sessions, session_id)):
+                    entry = table.setdefault(key, [0, 0])
+                    entry[0] += 1
+                    entry[1] += grown
+
+    def tracked(self, label: str, session: Optional[Callable[[], Optional[str]]] = None):
+        """Context manager attributing the net growth of traced memory to a request and its session."""
+        if not tracemalloc.is_tracing():
+            return contextlib.nullcontext()
+        return self._tracked(label, session)
+
+    # -- reports ------------------------------------------------------------
+
+    def growth(self) -> List[Tuple[str, int, int]]:
+        """
+        Growth since the previous call, by owning code.
+
+        Returns:
+            (owner, bytes grown, allocations grown) for the top sites, largest growth first
+        """
+        snapshot = self._snapshot()
+        previous, self._previous = self._previous, snapshot
+        if previous is None:
+            return []
+        sites: Dict[str, List[int]] = {}
+        for diff in snapshot.compare_to(previous, "traceback"):
+            entry = sites.setdefault(_owner(diff.traceback), [0, 0])
+            entry[0] += diff.size_diff
+            entry[1] += diff.count_diff
+        ranked = sorted(sites.items(), key=lambda item: -item[1][0])
+        return [(owner, size, count) for owner, (size, count) in ranked[:self.top]]
+
+    def report(self) -> Dict[str, Any]:
+        """
+        Take a report: growth sites, object counts and the sessions that
+        retained the most, and log it.
+        """
+        counts = count_objects()
+        report = {
+            "rss_bytes": rss_bytes(),
+            "traced_bytes": tracemalloc.get_traced_memory()[0] if tracemalloc.is_tracing() else None,
+            "growth": self.growth() if tracemalloc.is_tracing() else [],
+            "objects": counts,
+            "object_growth": {name: count - self._previous_counts.get(name, 0) for name, count in counts.items()},
+        }
+        self._previous_counts = counts
+        with self._lock:
+            report["sessions"] = sorted(((sid, n, size) for sid, (n, size) in self.sessions.items()),
+                                        key=lambda item: -item[2])[:self.top]
+            report["requests"] = {label: {"requests": n, "net_bytes": size} for label, (n, size) in self.requests.items()}
+            self.stats["reports"] += 1
+
+        lines = [f"Memory report: rss {_mb(report['rss_bytes'] or 0)}"
+                 + (f", traced {_mb(report['traced_bytes'])}" if report["traced_bytes"] is not None else "")]
+        lines += [f"  {_mb(size, signed=True)} ({count:+d} blocks) {owner}" for owner, size, count in report["growth"]]
+        lines.append("  objects: " + ", ".join(f"{name} {count} ({report['object_growth'][name]:+d})"
+                                               for name, count in counts.items()))
+        lines += [f"  session {sid}: {n} request(s) retained {_mb(size, signed=True)}" for sid, n, size in report["sessions"]]
+        logger.info("\n".join(lines))
+        return report
+
+    # -- soft ceiling -------------------------------------------------------
+
+    def enforce(self) -> int:
+        """
+        Evict caches if the process is above the soft ceiling.
+
+        Returns:
+            Number of items evicted
+        """
+        used = rss_bytes()
+        if not self.soft_limit or used is None or used <= self.soft_limit:
+            return 0
+        if time.monotonic() - self._last_eviction < _EVICTION_COOLDOWN:
+            return 0
+        self._last_eviction = time.monotonic()
+        with _evictors_lock:
+            evictors = list(_evictors)
+        freed = 0
+        for name, evict in evictors:
+            try:
+                items = evict()
+            except Exception:
+                logger.warning(f"Evictor {name} failed", exc_info=True)
+                continue
+            freed += items
+            gc.collect()
+            now_used = rss_bytes() or 0
+            logger.warning(f"Above the soft memory limit ({_mb(used)} > {_mb(self.soft_limit)}): "
+                           f"evicted {items} item(s) from {name}, now {_mb(now_used)}")
+            if now_used <= self.soft_limit:
+                break
+        self.stats["evictions"] += 1
+        self.stats["evicted_items"] += freed
+        return freed
+
+    def _run(self) -> None:
+        next_report = time.monotonic() + self.interval
+        while not self._stop.wait(self.check_interval if self.soft_limit else self.interval):
+            try:
+                self.enforce()
+                if self.trace and time.monotonic() >= next_report:
+                    next_report = time.monotonic() + self.interval
+                    self.report()
+            except Exception:
+                logger.warning("Memory monitor failed", exc_info=True)
+
+
+_monitor: Optional[MemoryMonitor] = None
+_monitor_lock = threading.Lock()
+
+
+def get_memory_monitor() -> MemoryMonitor:
+    """
+    Return the process-wide memory monitor, started on first use and
+    configured from MEMORY_TRACE, MEMORY_TRACE_FRAMES, MEMORY_REPORT_INTERVAL,
+    MEMORY_REPORT_TOP and MEMORY_SOFT_LIMIT_MB.
+    """
+    global _monitor
+    if _monitor is None:
+        with _monitor_lock:
+            if _monitor is None:
+                soft_limit_mb = float(get_setting("MEMORY_SOFT_LIMIT_MB", 0) or 0)
+                monitor = MemoryMonitor(
+                    trace=get_flag("MEMORY_TRACE", False),
+                    frames=int(get_setting("MEMORY_TRACE_FRAMES", 8)),
+                    interval=float(get_setting("MEMORY_REPORT_INTERVAL", 600)),
+                    top=int(get_setting("MEMORY_REPORT_TOP", 10)),
+                    soft_limit=int(soft_limit_mb * (1 << 20)) if soft_limit_mb > 0 else None,
+                )
+                monitor.start()
+                _monitor = monitor
+    return _monitor
+
+
+def memory_tracked(label: str, session: Optional[Callable[[], Optional[str]]] = None) -> Callable:
+    """
+    Decorator attributing the traced memory a request entry point retains
+    to the request and its session. A no-op unless MEMORY_TRACE is on.
+
+    Args:
+        label: Name of the entry point in reports
+        session: Returns the current session id; read when the call returns
+    """
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with get_memory_monitor().tracked(label, session):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -1,3 +1,4 @@
+from typing import List, Optional
 from pydantic import BaseModel
 
 # Define the Pydantic model with an extra field for recommended items.
@@ -8,6 +9,7 @@ class SearchResult(BaseModel):
     date: str = ""
     content: str = ""
     recommended: bool = False
+    matched_queries: List[str] = []
     
     
 class NewsCard(BaseModel):
@@ -15,6 +17,8 @@ class NewsCard(BaseModel):
     title: str
     excerpt: str
     byline: str
+    location: str = ""
+    published: str = ""
     
     
 class EventCard(BaseModel):
@@ -23,4 +27,5 @@ class EventCard(BaseModel):
     site: str
     title: str
     time: str
-    description: str
\ No newline at end of file
+    description: str
+    distance_km: Optional[float] = None
\ No newline at end of file
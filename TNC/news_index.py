@@ -0,0 +1,257 @@
+import heapq
+import logging
+import re
+import threading
+import time
+from datetime import date, datetime
+from typing import Dict, List, Optional, Set, Tuple
+from .models import NewsCard
+from .rerank import tokenize
+from .settings import get_flag, get_setting
+
+logger = logging.getLogger("NewsIndex")
+
+NEWSROOM_URL = "https://www.nature.org/en-us/newsroom/"
+
+_DATE_RE = re.compile(r"([A-Z][a-z]+\.?)\s+(\d{1,2}),\s*(\d{4})")
+
+# Words that ask for recency rather than a topic.
+_RECENCY_WORDS = {
+    "latest", "recent", "recently", "new", "newest", "news", "today", "week", "month", "update", "updates",
+    "press", "release", "releases", "announcement", "announcements", "headline", "headlines", "current", "last",
+}
+
+
+def parse_byline(byline: str) -> Tuple[str, Optional[date]]:
+    """
+    Split a press release byline such as "Arlington, VA | June 10, 2021" into
+    its location and publication date.
+
+    Args:
+        byline: The byline text
+
+    Returns:
+        Tuple of (location, date); the date is None if it cannot be parsed
+    """
+    published = None
+    match = _DATE_RE.search(byline)
+    if match:
+        month, day, year = match.groups()
+        month = month.rstrip(".")
+        # Full month names ("June") or abbreviations of any length ("Sept.")
+        for text, fmt in ((month, "%B"), (month[:3], "%b")):
+            try:
+                published = datetime.strptime(f"{text} {day} {year}", f"{fmt} %d %Y").date()
+                break
+            except ValueError:
+                continue
+        location = byline[:match.start()]
+    else:
+        location = byline
+    return location.strip(" |-–—"), published
+
+
+def _published(card: NewsCard) -> str:
+    return card.published or ""
+
+
+class NewsIndex:
+    """
+    Press release cards ordered by publication date, newest first, with an
+    inverted index for keyword lookup. Each newsroom poll only reads the
+    first listing page, so the index grows from successive polls and the
+    cards of live searches; beyond max_cards the oldest cards are dropped.
+    """
+
+    def __init__(self, max_cards: int = 500):
+        """
+        Args:
+            max_cards: Cards kept; the oldest by publication date are dropped first
+        """
+        self.max_cards = max_cards
+        self._lock = threading.Lock()
+        self._cards: List[NewsCard] = []
+        # (title, byline) -> insertion number, which breaks ties between cards of the same date
+        self._seqs: Dict[Tuple[str, str], int] = {}
+        self._next_seq = 0
+        # term -> keys of the cards containing it
+        self._terms: Dict[str, Set[Tuple[str, str]]] = {}
+        self._cards_by_key: Dict[Tuple[str, str], NewsCard] = {}
+        # Any add, including cards from live searches
+        self.updated_at: Optional[float] = None
+        # Last successful newsroom poll; only this says the index covers recent news
+        self.polled_at: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._cards)
+
+    @staticmethod
+    def _card_terms(card: NewsCard) -> Set[str]:
+        return set(tokenize(f"{card.title} {card.title} {card.excerpt} {card.location}"))
+
+    def add(self, cards: List[NewsCard], polled: bool = False) -> int:
+        """
+        Add cards that are not indexed yet.
+
+        Args:
+            cards: Cards from the newsroom or from a live search
+            polled: Whether the cards are a full newsroom poll
+
+        Returns:
+            Number of new cards
+        """
+        with self._lock:
+            new = []
+            for card in cards:
+                key = (card.title, card.byline)
+                if card.title and key not in self._seqs:
+                    self._seqs[key] = self._next_seq
+                    self._next_seq += 1
+                    new.append(card)
+            self.updated_at = time.time()
+            if polled:
+                self.polled_at = self.updated_at
+            if not new:
+                return 0
+            for card in new:
+                key = (card.title, card.byline)
+                self._cards_by_key[key] = card
+                for term in self._card_terms(card):
+                    self._terms.setdefault(term, set()).add(key)
+            # Undated cards sort last; ties keep indexed cards first, then the site's order
+            self._cards = list(heapq.merge(self._cards, sorted(new, key=_published, reverse=True),
+                                           key=_published, reverse=True))
+            while len(self._cards) > self.max_cards:
+                self._drop(self._cards.pop())
+        return len(new)
+
+    def _drop(self, card: NewsCard) -> None:
+        key = (card.title, card.byline)
+        del self._seqs[key]
+        del self._cards_by_key[key]
+        for term in self._card_terms(card):
+            keys = self._terms.get(term)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._terms[term]
+
+    def latest(self, limit: int = 10) -> List[NewsCard]:
+        """The most recent cards."""
+        with self._lock:
+            return self._cards[:limit]
+
+    def search(self, query: str, limit: int = 10) -> List[NewsCard]:
+        """
+        Look up cards by keyword. Queries that only ask for recent news
+        ("latest news", "what's new") return the most recent cards.
+
+        Args:
+            query: The search query
+            limit: Maximum number of cards
+
+        Returns:
+            Matching cards, those matching the most query terms first, then newest first
+        """
+        terms = [term for term in tokenize(query) if term not in _RECENCY_WORDS]
+        if not terms:
+            return self.latest(limit)
+
+        with self._lock:
+            counts: Dict[Tuple[str, str], int] = {}
+            for term in set(terms):
+                for key in self._terms.get(term, ()):
+                    counts[key] = counts.get(key, 0) + 1
+            # Same order as the card list: newest first, then insertion order
+            ranked = sorted(counts, key=self._seqs.__getitem__)
+            ranked.sort(key=lambda key: _published(self._cards_by_key[key]), reverse=True)
+            ranked.sort(key=lambda key: -counts[key])
+            return [self._cards_by_key[key] for key in ranked[:limit]]
+
+
+class NewsPoller:
+    """
+    Pulls the newsroom listing in the background and adds new press release
+    cards to a news index.
+    """
+
+    def __init__(self, index: NewsIndex, interval: float = 1800.0):
+        """
+        Args:
+            index: The index to fill
+            interval: Seconds between polls
+        """
+        self.index = index
+        self.interval = interval
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def poll(self) -> int:
+        """
+        Fetch the first page of the newsroom listing once (the newest releases).
+
+        Returns:
+            Number of new cards
+        """
+        from .tnc_api import fetch_news_cards
+
+        start = time.perf_counter()
+        added = self.index.add(fetch_news_cards(NEWSROOM_URL), polled=True)
+        logger.info(f"Newsroom poll added {added} card(s) in {time.perf_counter() - start:.2f}s "
+                    f"({len(self.index)} indexed)")
+        return added
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.poll()
+            except Exception:
+                logger.warning("Newsroom poll failed", exc_info=True)
+            self._stop.wait(self.interval)
+
+    def start(self) -> None:
+        """Start polling in a daemon thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="news-poller", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+
+_index: Optional[NewsIndex] = None
+_poller: Optional[NewsPoller] = None
+_index_lock = threading.Lock()
+
+
+def get_news_index() -> NewsIndex:
+    """
+    Return the process-wide news index, starting the newsroom poller on
+    first use unless NEWS_POLL is off (NEWS_POLL_INTERVAL sets its period,
+    NEWS_INDEX_MAX_CARDS its size).
+    """
+    global _index, _poller
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                index = NewsIndex(max_cards=int(get_setting("NEWS_INDEX_MAX_CARDS", 500)))
+                if get_flag("NEWS_POLL", True):
+                    _poller = NewsPoller(index, interval=float(get_setting("NEWS_POLL_INTERVAL", 1800)))
+                    _poller.start()
+                _index = index
+    return _index
+
+
+def peek_news_index() -> Optional[NewsIndex]:
+    """The process-wide news index if it has been created, without starting the poller."""
+    return _index
+
+
+def is_fresh(index: NewsIndex, max_age: Optional[float] = None) -> bool:
+    """
+    Whether the newsroom was polled recently enough to answer from the index
+    (NEWS_INDEX_MAX_AGE, default 7200s). Cards added by live searches do not
+    count, since they only cover the topics searched.
+    """
+    max_age = float(get_setting("NEWS_INDEX_MAX_AGE", 7200)) if max_age is None else max_age
+    return bool(index) and index.polled_at is not None and time.time() - index.polled_at <= max_age
@@ -0,0 +1,365 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
+from .memory import register_evictor
+from .settings import get_setting
+
+logger = logging.getLogger("PageStore")
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+_DISK_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    codec TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    data BLOB NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS urls (
+    url TEXT PRIMARY KEY,
+    digest TEXT NOT NULL,
+    fetched_at REAL NOT NULL
+);
+"""
+
+
+def content_digest(content: bytes) -> str:
+    """Content address of a page."""
+    return hashlib.blake2b(content, digest_size=20).hexdigest()
+
+
+class _Codec:
+    """zstd when the zstandard package is installed, zlib otherwise."""
+
+    def __init__(self):
+        if zstandard is not None:
+            self.name = "zstd"
+            self._compressor = zstandard.ZstdCompressor(level=6)
+            self._decompressor = zstandard.ZstdDecompressor()
+        else:
+            self.name = "zlib"
+
+    def compress(self, data: bytes) -> bytes:
+        if self.name == "zstd":
+            return self._compressor.compress(data)
+        return zlib.compress(data, 6)
+
+    def decompress(self, codec: str, data: bytes) -> bytes:
+        if codec == "zstd":
+            if zstandard is None:
+                raise ValueError("Page was stored with zstd but zstandard is not installed")
+            return self._decompressor.decompress(data)
+        return zlib.decompress(data)
+
+
+class PageStore:
+    """
+    Stores fetched pages compressed and deduplicated by content hash, with a
+    URL-to-hash mapping. A size-bounded in-memory LRU holds the hot pages; an
+    optional SQLite file keeps a larger, also size-bounded, second tier.
+    Parse results are memoized by content hash so an unchanged page is never
+    parsed twice.
+    """
+
+    def __init__(self, max_bytes: int = 64 << 20, path: Optional[str] = None, max_disk_bytes: int = 512 << 20,
+                 max_parsed: int = 256):
+        """
+        Args:
+            max_bytes: Compressed bytes kept in memory
+            path: SQLite file for the on-disk tier, or None for memory only
+            max_disk_bytes: Compressed bytes kept on disk
+            max_parsed: Number of memoized parse results
+        """
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.max_parsed = max_parsed
+        self._codec = _Codec()
+        self._lock = threading.RLock()
+        # digest -> (codec, compressed bytes, raw size)
+        self._blobs: "OrderedDict[str, Tuple[str, bytes, int]]" = OrderedDict()
+        self._bytes = 0
+        # url -> (digest, fetched_at), only for digests held in memory
+        self._urls: Dict[str, Tuple[str, float]] = {}
+        # digest -> urls mapped to it, to drop those entries with the blob
+        self._digest_urls: Dict[str, Set[str]] = {}
+        # (kind, digest) -> parse result
+        self._parsed: "OrderedDict[Tuple[str, str], Any]" = OrderedDict()
+        self.stats = {"puts": 0, "dedup": 0, "hits": 0, "misses": 0, "disk_hits": 0,
+                      "evictions": 0, "parse_hits": 0, "parse_misses": 0, "raw_bytes": 0}
+
+        self._db = None
+        self._disk_bytes = 0
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.executescript(_DISK_SCHEMA)
+            self._disk_bytes = self._disk_total()
+
+    # -- memory tier --------------------------------------------------------
+
+    def _remember(self, digest: str, codec: str, data: bytes, size: int) -> None:
+        if digest in self._blobs:
+            self._blobs.move_to_end(digest)
+            return
+        self._blobs[digest] = (codec, data, size)
+        self._bytes += len(data)
+        self.stats["raw_bytes"] += size
+        while self._bytes > self.max_bytes and len(self._blobs) > 1:
+            self._evict_lru()
+
+    def _evict_lru(self) -> None:
+        """Drop the least recently used blob and the URL entries pointing at it."""
+        digest, (_, evicted, evicted_size) = self._blobs.popitem(last=False)
+        self._bytes -= len(evicted)
+        self.stats["raw_bytes"] -= evicted_size
+        self.stats["evictions"] += 1
+        for url in self._digest_urls.pop(digest, ()):
+            del self._urls[url]
+
+    def _map_url(self, url: str, digest: str, fetched_at: float) -> None:
+        previous = self._urls.get(url)
+        if previous is not None and previous[0] != digest:
+            urls = self._digest_urls.get(previous[0])
+            if urls is not None:
+                urls.discard(url)
+        self._urls[url] = (digest, fetched_at)
+        self._digest_urls.setdefault(digest, set()).add(url)
+
+    # -- disk tier ----------------------------------------------------------
+
+    def _disk_total(self) -> int:
+        return self._db.execute("SELECT COALESCE(SUM(LENGTH(data)), 0) FROM blobs").fetchone()[0]
+
+    def _disk_put(self, url: str, digest: str, codec: str, data: bytes, size: int, now: float) -> None:
+        inserted = self._db.execute(
+            "INSERT OR IGNORE INTO blobs (digest, codec, size, data, last_used) VALUES (?, ?, ?, ?, ?)",
+            (digest, codec, size, data, now)
+        ).rowcount
+        self._db.execute("INSERT OR REPLACE INTO urls (url, digest, fetched_at) VALUES (?, ?, ?)", (url, digest, now))
+        # Running total, so a put does not scan the whole table
+        self._disk_bytes += len(data) if inserted > 0 else 0
+        if self._disk_bytes > self.max_disk_bytes:
+            # Other processes may share the file; resync before evicting
+            self._disk_bytes = self._disk_total()
+        if self._disk_bytes > self.max_disk_bytes:
+            # Drop least recently used blobs until a tenth of the budget is free
+            target = self._disk_bytes - int(self.max_disk_bytes * 0.9)
+            freed = 0
+            for old_digest, length in self._db.execute(
+                "SELECT digest, LENGTH(data) FROM blobs ORDER BY last_used"
+            ).fetchall():
+                if freed >= target:
+                    break
+                self._db.execute("DELETE FROM blobs WHERE digest = ?", (old_digest,))
+                self._db.execute("DELETE FROM urls WHERE digest = ?", (old_digest,))
+                freed += length
+            self._disk_bytes -= freed
+
+    def _disk_lookup(self, url: str) -> Optional[Tuple[str, float, str, bytes, int]]:
+        row = self._db.execute(
+            "SELECT u.digest, u.fetched_at, b.codec, b.data, b.size FROM urls u JOIN blobs b ON b.digest = u.digest "
+            "WHERE u.url = ?", (url,)
+        ).fetchone()
+        if row:
+            self._db.execute("UPDATE blobs SET last_used = ? WHERE digest = ?", (time.time(), row[0]))
+        return row
+
+    # -- public API ---------------------------------------------------------
+
+    def put(self, url: str, content: bytes) -> str:
+        """
+        Store a fetched page.
+
+        Args:
+            url: The URL the page was fetched from
+            content: The raw page
+
+        Returns:
+            The page's content digest
+        """
+        digest = content_digest(content)
+        now = time.time()
+        with self._lock:
+            self.stats["puts"] += 1
+            if digest in self._blobs:
+                self.stats["dedup"] += 1
+                self._blobs.move_to_end(digest)
+                codec, data, _ = self._blobs[digest]
+            else:
+                codec, data = self._codec.name, self._codec.compress(content)
+                self._remember(digest, codec, data, len(content))
+            self._map_url(url, digest, now)
+            if self._db is not None:
+                self._disk_put(url, digest, codec, data, len(content), now)
+        return digest
+
+    def get(self, url: str, max_age: Optional[float] = None) -> Optional[bytes]:
+        """
+        Return the stored page for a URL.
+
+        Args:
+            url: The page's URL
+            max_age: Maximum age in seconds; older pages are treated as missing
+
+        Returns:
+            The raw page, or None if it is not stored or too old
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._urls.get(url)
+            blob = self._blobs.get(entry[0]) if entry else None
+            if blob is None and self._db is not None:
+                row = self._disk_lookup(url)
+                if row:
+                    digest, fetched_at, codec, data, size = row
+                    entry, blob = (digest, fetched_at), (codec, data, size)
+                    self._remember(digest, codec, data, size)
+                    self._map_url(url, digest, fetched_at)
+                    self.stats["disk_hits"] += 1
+            if blob is None or (max_age is not None and now - entry[1] > max_age):
+                self.stats["misses"] += 1
+                return None
+            self._blobs.move_to_end(entry[0])
+            self.stats["hits"] += 1
+            codec, data, _ = blob
+        return self._codec.decompress(codec, data)
+
+    def age(self, url: str) -> Optional[float]:
+        """Seconds since the page for a URL was stored, or None if it is not stored."""
+        with self._lock:
+            entry = self._urls.get(url)
+            if entry is None and self._db is not None:
+                row = self._db.execute("SELECT fetched_at FROM urls WHERE url = ?", (url,)).fetchone()
+                entry = (None, row[0]) if row else None
+        return None if entry is None else time.time() - entry[1]
+
+    def parse_cached(self, kind: str, content: str, parse: Callable[[str], Any]) -> Any:
+        """
+        Parse a page, reusing the result for identical content.
+
+        Args:
+            kind: Name of the parser, e.g. "search" or "news"
+            content: The page content
+            parse: Parser called on a cache miss
+
+        Returns:
+            The parse result (shared between callers; do not mutate it)
+        """
+        key = (kind, content_digest(content.encode("utf-8")))
+        with self._lock:
+            if key in self._parsed:
+                self._parsed.move_to_end(key)
+                self.stats["parse_hits"] += 1
+                return self._parsed[key]
+            self.stats["parse_misses"] += 1
+        result = parse(content)
+        with self._lock:
+            self._parsed[key] = result
+            while len(self._parsed) > self.max_parsed:
+                self._parsed.popitem(last=False)
+        return result
+
+    def parsed_pages(self, kind: str) -> List[Tuple[str, Any]]:
+        """
+        The memoized parse results of one kind for the URLs in memory.
+
+        Returns:
+            List of (url, parse result) pairs (shared results; do not mutate them)
+        """
+        with self._lock:
+            return [(url, self._parsed[(kind, digest)]) for url, (digest, _) in self._urls.items()
+                    if (kind, digest) in self._parsed]
+
+    def iter_pages(self) -> Iterator[Tuple[str, float, bytes]]:
+        """
+        Iterate over every stored page, from the disk tier if there is one and
+        from memory otherwise.
+
+        Yields:
+            Tuples of (url, fetched_at, raw page)
+        """
+        if self._db is not None:
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT u.url, u.fetched_at, b.codec, b.data FROM urls u JOIN blobs b ON b.digest = u.digest "
+                    "ORDER BY u.url"
+                ).fetchall()
+            for url, fetched_at, codec, data in rows:
+                yield url, fetched_at, self._codec.decompress(codec, data)
+            return
+
+        with self._lock:
+            entries = [(url, fetched_at, self._blobs.get(digest)) for url, (digest, fetched_at) in self._urls.items()]
+        for url, fetched_at, blob in sorted(entries, key=lambda entry: entry[0]):
+            if blob is not None:
+                yield url, fetched_at, self._codec.decompress(blob[0], blob[1])
+
+    def trim(self, fraction: float = 0.5) -> int:
+        """
+        Shrink the in-memory tier to a fraction of its current size, least
+        recently used pages first, and drop the memoized parse results. Pages
+        stay on disk if there is a disk tier.
+
+        Returns:
+            Number of pages and parse results dropped
+        """
+        with self._lock:
+            dropped = len(self._parsed)
+            self._parsed.clear()
+            target = self._bytes * fraction
+            while self._blobs and self._bytes > target:
+                self._evict_lru()
+                dropped += 1
+        return dropped
+
+    def clear(self) -> None:
+        """Drop the in-memory tier and memoized parse results (the disk tier is kept)."""
+        with self._lock:
+            self._blobs.clear()
+            self._urls.clear()
+            self._digest_urls.clear()
+            self._parsed.clear()
+            self._bytes = 0
+            self.stats["raw_bytes"] = 0
+
+    def report(self) -> Dict[str, Any]:
+        """Counters plus memory usage and compression ratio of the in-memory tier."""
+        with self._lock:
+            stats = dict(self.stats)
+            stats.update(codec=self._codec.name, pages=len(self._blobs), urls=len(self._urls),
+                         compressed_bytes=self._bytes, parsed=len(self._parsed))
+        stats["compression_ratio"] = stats["raw_bytes"] / stats["compressed_bytes"] if stats["compressed_bytes"] else 0.0
+        return stats
+
+
+_store: Optional[PageStore] = None
+_store_lock = threading.Lock()
+
+
+def get_page_store() -> PageStore:
+    """
+    Return the process-wide page store, configured from PAGE_STORE_MAX_MB,
+    PAGE_STORE_PATH and PAGE_STORE_MAX_DISK_MB.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = PageStore(
+                    max_bytes=int(float(get_setting("PAGE_STORE_MAX_MB", 64)) * (1 << 20)),
+                    path=get_setting("PAGE_STORE_PATH"),
+                    max_disk_bytes=int(float(get_setting("PAGE_STORE_MAX_DISK_MB", 512)) * (1 << 20)),
+                )
+                register_evictor("page store", _store.trim)
+    return _store
@@ -0,0 +1,240 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional, Tuple
+from .settings import get_flag, get_setting
+
+logger = logging.getLogger("ParsePool")
+
+# Fields of the parse results, in the order they are sent back from the
+# workers. Results travel as tuples so that dictionary keys are not pickled
+# once per item.
+RESULT_FIELDS: Dict[str, Tuple[str, ...]] = {
+    "search": ("id", "url", "title", "date", "content", "recommended"),
+    "news": ("image_url", "title", "excerpt", "byline"),
+    "page": ("title", "text"),
+}
+
+
+def _parser(kind: str) -> Callable[[str], Any]:
+    from .tnc_api import _extract_news_cards, _extract_page_text, _extract_search_results
+
+    return {"search": _extract_search_results, "news": _extract_news_cards, "page": _extract_page_text}[kind]
+
+
+def _init_worker() -> None:
+    """Import the parsers (and BeautifulSoup) once per worker, before the first page arrives."""
+    import bs4  # noqa: F401
+
+    for kind in RESULT_FIELDS:
+        _parser(kind)
+
+
+def _warm() -> int:
+    return os.getpid()
+
+
+def _parse_in_worker(kind: str, data: bytes) -> Any:
+    """Parse raw page bytes and return the result as compact tuples."""
+    result = _parser(kind)(data.decode("utf-8", errors="replace"))
+    fields = RESULT_FIELDS[kind]
+    if isinstance(result, dict):
+        return tuple(result[field] for field in fields)
+    return [tuple(item[field] for field in fields) for item in result]
+
+
+def _expand(kind: str, packed: Any) -> Any:
+    fields = RESULT_FIELDS[kind]
+    if isinstance(packed, tuple):
+        return dict(zip(fields, packed))
+    return [dict(zip(fields, item)) for item in packed]
+
+
+def _terminate(executor: ProcessPoolExecutor) -> None:
+    """Shut an executor down without waiting, killing its worker processes."""
+    processes = list((executor._processes or {}).values())
+    executor.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+
+
+class ParsePool:
+    """
+    Runs HTML parsing of large pages in worker processes, so that parsing
+    does not hold the GIL of the process serving the chat sessions. Pages
+    below a size threshold are parsed inline, where handing them over would
+    cost more than it saves.
+    """
+
+    def __init__(self, workers: int = 2, min_bytes: int = 64 * 1024, timeout: float = 30.0):
+        """
+        Args:
+            workers: Number of worker processes
+            min_bytes: Pages at least this large (in UTF-8 bytes) are parsed in a worker
+            timeout: Seconds to wait for a worker before parsing inline instead
+        """
+        self.workers = workers
+        self.min_bytes = min_bytes
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        # Set only once its workers are up, so parse never waits for a start
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._starting = False
+        self.stats = {"inline": 0, "offloaded": 0, "fallbacks": 0, "restarts": 0, "offloaded_seconds": 0.0}
+
+    def start(self) -> None:
+        """Start the worker processes and wait until each has imported the parsers."""
+        with self._lock:
+            if self._executor is not None or self._starting:
+                return
+            self._starting = True
+        try:
+            # Forking a process that runs threads (Streamlit, the backend pool)
+            # is unsafe, so workers are spawned
+            executor = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_worker,
+                                           mp_context=multiprocessing.get_context("spawn"))
+            start = time.perf_counter()
+            try:
+                pids = {future.result() for future in [executor.submit(_warm) for _ in range(self.workers)]}
+            except BaseException:
+                _terminate(executor)
+                raise
+            logger.info(f"Started {len(pids)} parse worker(s) in {time.perf_counter() - start:.2f}s")
+            with self._lock:
+                self._executor = executor
+        finally:
+            with self._lock:
+                self._starting = False
+
+    def start_in_background(self) -> None:
+        """Start the worker processes on a daemon thread unless they are running or starting."""
+        with self._lock:
+            if self._executor is not None or self._starting:
+                return
+
+        def _start():
+            try:
+                self.start()
+            except Exception:
+                logger.warning("Could not start the parse workers", exc_info=True)
+        threading.Thread(target=_start, name="parse-pool-start", daemon=True).start()
+
+    def _count(self, outcome: str, seconds: float = 0.0) -> None:
+        with self._lock:
+            self.stats[outcome] += 1
+            if seconds:
+                self.stats["offloaded_seconds"] += seconds
+
+    def _restart(self, executor: ProcessPoolExecutor) -> None:
+        """Kill a broken executor's workers (a stuck one would never exit) and start new ones in the background."""
+        with self._lock:
+            if self._executor is not executor:
+                return
+            self._executor = None
+            self.stats["restarts"] += 1
+        _terminate(executor)
+        self.start_in_background()
+
+    def parse(self, kind: str, content: str) -> Any:
+        """
+        Parse a page with the extractor for its kind.
+
+        Args:
+            kind: "search", "news" or "page"
+            content: The page's HTML
+
+        Returns:
+            The extractor's result (a list of dicts, or a dict for "page")
+        """
+        data = content.encode("utf-8")
+        if len(data) < self.min_bytes:
+            self._count("inline")
+            return _parser(kind)(content)
+
+        executor = self._executor
+        if executor is None:
+            # Not started yet, or being restarted after a failure
+            self.start_in_background()
+            self._count("fallbacks")
+            return _parser(kind)(content)
+        start = time.perf_counter()
+        try:
+            packed = executor.submit(_parse_in_worker, kind, data).result(timeout=self.timeout)
+        except (BrokenProcessPool, TimeoutError, RuntimeError) as e:
+            # A crashed or stuck worker must not lose the page
+            logger.warning(f"Parse worker failed ({e!r}), parsing {len(data)} bytes inline")
+            self._count("fallbacks")
+            self._restart(executor)
+            return _parser(kind)(content)
+        self._count("offloaded", time.perf_counter() - start)
+        return _expand(kind, packed)
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown()
+
+    def report(self) -> Dict[str, Any]:
+        """Pages parsed inline and in workers, and the average round trip of offloaded pages."""
+        with self._lock:
+            stats = dict(self.stats)
+        stats["avg_offloaded_seconds"] = stats["offloaded_seconds"] / stats["offloaded"] if stats["offloaded"] else 0.0
+        return stats
+
+
+_pool: Optional[ParsePool] = None
+_pool_lock = threading.Lock()
+
+
+def get_parse_pool() -> Optional[ParsePool]:
+    """
+    Return the process-wide parse pool, or None unless PARSE_POOL is on.
+    PARSE_POOL_WORKERS and PARSE_POOL_MIN_KB size the pool and its routing
+    threshold.
+    """
+    global _pool
+    if _pool is None and get_flag("PARSE_POOL", False):
+        with _pool_lock:
+            if _pool is None:
+                _pool = ParsePool(
+                    workers=int(get_setting("PARSE_POOL_WORKERS", max(1, (os.cpu_count() or 2) - 1))),
+                    min_bytes=int(float(get_setting("PARSE_POOL_MIN_KB", 64)) * 1024),
+                )
+    return _pool
+
+
+def parse_html(kind: str, content: str) -> Any:
+    """
+    Parse a page with the extractor for its kind, in the parse pool if it
+    is enabled and the page is large enough.
+
+    Args:
+        kind: "search", "news" or "page"
+        content: The page's HTML
+
+    Returns:
+        The extractor's result (a list of dicts, or a dict for "page")
+    """
+    pool = get_parse_pool()
+    if pool is None:
+        return _parser(kind)(content)
+    return pool.parse(kind, content)
+
+
+def parser_for(kind: str) -> Callable[[str], Any]:
+    """parse_html bound to one kind, for PageStore.parse_cached."""
+    return lambda content: parse_html(kind, content)
+
+
+def warm_up() -> None:
+    """Start the parse pool's workers ahead of the first large page, if the pool is enabled."""
+    pool = get_parse_pool()
+    if pool is not None:
+        pool.start()
+
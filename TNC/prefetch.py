@@ -0,0 +1,190 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Callable, Dict, Iterable, Optional
+from urllib.parse import urldefrag
+from .memory import register_evictor
+from .page_store import get_page_store
+from .scraper import fetch_page
+from .settings import get_setting
+from .tasks import in_submitter_context
+
+logger = logging.getLogger("Prefetcher")
+
+
+def normalize_url(url: str) -> str:
+    """Cache key for a URL: stripped and without fragment."""
+    return urldefrag(url.strip())[0]
+
+
+class Prefetcher:
+    """
+    Fetches the pages behind top search results in the background, so a
+    follow-up visit_any_web_site for one of them returns without another
+    ScrapingAnt render. The pages themselves are kept (compressed) in the page
+    store; the prefetcher only tracks which fetches it started and when they
+    expire.
+    """
+
+    def __init__(self, workers: int = 2, ttl: float = 300.0, max_entries: int = 64, max_queued: int = 8,
+                 wait: float = 10.0, fetch: Callable[..., str] = fetch_page):
+        """
+        Args:
+            workers: Background fetch threads; kept small so prefetching never competes with live requests
+            ttl: Seconds a prefetched page stays usable
+            max_entries: Maximum number of pages kept (oldest are dropped first)
+            max_queued: Prefetches waiting for a worker beyond which new ones are skipped
+            wait: Default seconds get() waits for an in-flight fetch before giving up on it
+            fetch: Function fetching a page's content; called with max_age to read it back from the page store
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_queued = max_queued
+        self.wait = wait
+        self._fetch = fetch
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch")
+        self._lock = threading.Lock()
+        # url -> {"future", "expires", "used"}
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._queued = 0
+        self.stats = {"scheduled": 0, "skipped": 0, "completed": 0, "failed": 0, "hits": 0, "misses": 0,
+                      "timeouts": 0, "wasted": 0}
+
+    def _discard(self, url: str) -> None:
+        entry = self._entries.pop(url)
+        if not entry["used"] and entry["future"].done():
+            self.stats["wasted"] += 1
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        for url in [url for url, entry in self._entries.items() if entry["expires"] < now]:
+            self._discard(url)
+        while len(self._entries) > self.max_entries:
+            self._discard(next(iter(self._entries)))
+
+    def _run(self, url: str) -> None:
+        with self._lock:
+            self._queued -= 1
+        try:
+            self._fetch(url)
+        except Exception:
+            with self._lock:
+                self.stats["failed"] += 1
+                self._entries.pop(url, None)
+            logger.info(f"Prefetch of {url} failed", exc_info=True)
+            raise
+        with self._lock:
+            self.stats["completed"] += 1
+
+    def prefetch(self, urls: Iterable[str]) -> None:
+        """
+        Schedule background fetches for pages that are not cached yet.
+
+        Args:
+            urls: Pages to fetch, most promising first
+        """
+        with self._lock:
+            self._expire()
+            for url in map(normalize_url, urls):
+                if not url or url in self._entries:
+                    continue
+                if self._queued >= self.max_queued:
+                    self.stats["skipped"] += 1
+                    continue
+                self._queued += 1
+                self.stats["scheduled"] += 1
+                future = self._pool.submit(in_submitter_context(self._run), url)
+                self._entries[url] = {"future": future, "expires": time.monotonic() + self.ttl, "used": False}
+
+    def get(self, url: str, timeout: Optional[float] = None) -> Optional[str]:
+        """
+        Return a prefetched page, waiting for it if its fetch is still running.
+
+        Args:
+            url: Page to look up
+            timeout: Maximum seconds to wait for an in-flight fetch (default: the prefetcher's wait)
+
+        Returns:
+            The page content, or None if it was not prefetched, the fetch failed,
+            did not finish in time or its page has left the page store; the
+            caller then fetches the page itself
+        """
+        key = normalize_url(url)
+        with self._lock:
+            self._expire()
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            entry["used"] = True
+            future: Future = entry["future"]
+        timeout = self.wait if timeout is None else timeout
+        try:
+            future.result(timeout=timeout)
+            # Read back under the key the background fetch stored the page with;
+            # only a stored copy counts, never a fetch made here
+            data = get_page_store().get(key, self.ttl)
+        except FutureTimeout:
+            with self._lock:
+                self.stats["misses"] += 1
+                self.stats["timeouts"] += 1
+            logger.info(f"Prefetch of {key} still running after {timeout:.0f}s; fetching it directly")
+            return None
+        except Exception:
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+        if data is None:
+            # Evicted from the page store since the fetch finished
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+        with self._lock:
+            self.stats["hits"] += 1
+        report = self.report()
+        logger.info(f"Prefetch hit for {key} (hit rate {report['hit_rate']:.0%}, "
+                    f"waste rate {report['waste_rate']:.0%})")
+        return data.decode("utf-8")
+
+    def report(self) -> Dict[str, float]:
+        """Counters plus hit rate of visits and share of fetches never used."""
+        with self._lock:
+            stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        stats["waste_rate"] = stats["wasted"] / stats["completed"] if stats["completed"] else 0.0
+        return stats
+
+    def clear(self) -> int:
+        """
+        Drop every cached page.
+
+        Returns:
+            Number of pages dropped
+        """
+        with self._lock:
+            urls = list(self._entries)
+            for url in urls:
+                self._discard(url)
+        return len(urls)
+
+
+_prefetcher: Optional[Prefetcher] = None
+_prefetcher_lock = threading.Lock()
+
+
+def get_prefetcher() -> Prefetcher:
+    """Return the process-wide prefetcher, configured from PREFETCH_WORKERS, PREFETCH_TTL and PREFETCH_WAIT."""
+    global _prefetcher
+    if _prefetcher is None:
+        with _prefetcher_lock:
+            if _prefetcher is None:
+                _prefetcher = Prefetcher(
+                    workers=int(get_setting("PREFETCH_WORKERS", 2)),
+                    ttl=float(get_setting("PREFETCH_TTL", 300)),
+                    wait=float(get_setting("PREFETCH_WAIT", 10)),
+                )
+                register_evictor("prefetcher", _prefetcher.clear)
+    return _prefetcher
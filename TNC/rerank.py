@@ -0,0 +1,126 @@
+import re
+import zlib
+from typing import Any, List, Sequence
+import numpy as np
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+_STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "do", "does", "for",
+    "from", "has", "have", "how", "i", "in", "is", "it", "its", "me", "my", "of",
+    "on", "or", "our", "s", "that", "the", "their", "this", "to", "was", "we",
+    "what", "when", "where", "which", "who", "why", "will", "with", "you", "your",
+    "tnc", "tncs", "nature", "conservancy", "about", "tell", "please",
+}
+
+# Dimensions of the hashed term vectors used for near-duplicate detection.
+_HASH_DIMS = 1 << 12
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercases and tokenizes text, dropping stopwords and folding plurals."""
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower()):
+        if token in _STOPWORDS:
+            continue
+        if len(token) > 4 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+
+def _field_text(item: Any, fields: Sequence[str]) -> List[str]:
+    return [str(getattr(item, field, "") or "") for field in fields]
+
+
+def bm25_scores(query_tokens: List[str], docs: List[List[str]], k1: float = 1.2, b: float = 0.75) -> np.ndarray:
+    """
+    Score tokenized documents against a tokenized query with BM25.
+
+    Args:
+        query_tokens: Query terms
+        docs: Documents as lists of terms
+        k1: Term frequency saturation
+        b: Document length normalization
+
+    Returns:
+        Array of one score per document
+    """
+    terms = sorted(set(query_tokens))
+    if not terms or not docs:
+        return np.zeros(len(docs))
+
+    column = {term: j for j, term in enumerate(terms)}
+    tf = np.zeros((len(docs), len(terms)))
+    for i, doc in enumerate(docs):
+        for token in doc:
+            j = column.get(token)
+            if j is not None:
+                tf[i, j] += 1
+
+    lengths = np.array([len(doc) for doc in docs], dtype=float)
+    avg_length = lengths.mean() or 1.0
+    df = (tf > 0).sum(axis=0)
+    idf = np.log1p((len(docs) - df + 0.5) / (df + 0.5))
+    norm = k1 * (1 - b + b * lengths / avg_length)
+    return ((tf * (k1 + 1)) / (tf + norm[:, None]) * idf).sum(axis=1)
+
+
+def _hashed_vectors(docs: List[List[str]]) -> np.ndarray:
+    """L2-normalized hashed term-count vectors, one row per document."""
+    vectors = np.zeros((len(docs), _HASH_DIMS), dtype=np.float32)
+    for i, doc in enumerate(docs):
+        for token in doc:
+            vectors[i, zlib.crc32(token.encode("utf-8")) % _HASH_DIMS] += 1
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return vectors / norms
+
+
+def rerank(query: str, items: List[Any], title_field: str = "title", text_fields: Sequence[str] = ("content",),
+           top_k: int = 8, min_keep: int = 3, relative_threshold: float = 0.25,
+           duplicate_threshold: float = 0.9) -> List[Any]:
+    """
+    Re-rank scraped results by relevance to a query, drop near-duplicates and
+    keep the top results.
+
+    Args:
+        query: The search query, optionally extended with the user's question
+        items: Result objects (e.g. SearchResult or NewsCard) in site order
+        title_field: Attribute holding the title; its terms count double
+        text_fields: Attributes holding the body text
+        top_k: Maximum number of results returned
+        min_keep: Results always kept (if available) regardless of score
+        relative_threshold: Results scoring below this fraction of the best score are dropped
+        duplicate_threshold: Cosine similarity above which two results are considered the same
+
+    Returns:
+        The selected items, best first
+    """
+    if not items:
+        return []
+
+    docs = []
+    for item in items:
+        title = str(getattr(item, title_field, "") or "")
+        docs.append(tokenize(title) * 2 + tokenize(" ".join(_field_text(item, text_fields))))
+
+    scores = bm25_scores(tokenize(query), docs)
+    # Site order breaks ties and carries the site's own relevance when no term matches
+    site_rank = np.arange(len(items), dtype=float)
+    order = np.lexsort((site_rank, -scores))
+
+    vectors = _hashed_vectors(docs)
+    best = scores.max()
+    selected: List[int] = []
+    for index in order:
+        if len(selected) >= top_k:
+            break
+        if len(selected) >= min_keep and best > 0 and scores[index] < relative_threshold * best:
+            break
+        if selected and float((vectors[selected] @ vectors[index]).max()) >= duplicate_threshold:
+            continue
+        selected.append(int(index))
+
+    return [items[index] for index in selected]
+
@@ -0,0 +1,165 @@
+import http.client
+import logging
+import queue
+import threading
+from typing import Optional
+from .page_store import get_page_store
+from .settings import get_setting
+
+logger = logging.getLogger("Scraper")
+
+SCRAPINGANT_HOST = "api.scrapingant.com"
+
+# nature.org responses come back with more headers than http.client allows by default.
+http.client._MAXHEADERS = 1000
+
+
+class FetchError(RuntimeError):
+    """ScrapingAnt answered with an error status (failed render, rate limit, exhausted quota)."""
+
+    def __init__(self, url: str, status: int, body: bytes):
+        super().__init__(f"ScrapingAnt returned {status} for {url}: {body[:200]!r}")
+        self.url = url
+        self.status = status
+
+
+class ScrapingAntClient:
+    """
+    Fetches rendered pages through the ScrapingAnt API over a pool of
+    keep-alive HTTPS connections, so repeated fetches skip the TLS handshake.
+    """
+
+    def __init__(self, pool_size: int = 8, timeout: float = 60.0):
+        """
+        Args:
+            pool_size: Maximum number of idle connections kept open
+            timeout: Socket timeout in seconds for each request
+        """
+        self.timeout = timeout
+        self._idle = queue.LifoQueue(maxsize=pool_size)
+        self._api_key: Optional[str] = None
+        self._lock = threading.Lock()
+
+    @property
+    def api_key(self) -> str:
+        """The ScrapingAnt API key, read from the settings once."""
+        if self._api_key is None:
+            with self._lock:
+                if self._api_key is None:
+                    api_key = get_setting("SCRAPINGANT_API_KEY")
+                    if not api_key:
+                        raise ValueError("SCRAPINGANT_API_KEY is not set")
+                    self._api_key = api_key
+        return self._api_key
+
+    def _acquire(self) -> http.client.HTTPSConnection:
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return http.client.HTTPSConnection(SCRAPINGANT_HOST, timeout=self.timeout)
+
+    def _release(self, conn: http.client.HTTPSConnection) -> None:
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+
+    def fetch(self, url: str) -> bytes:
+        """
+        Fetch the rendered page under the given URL.
+
+        Args:
+            url: The page to render
+
+        Returns:
+            The raw response body
+
+        Raises:
+            FetchError: If ScrapingAnt answers with a non-2xx status; error
+                bodies must never be stored as the page
+        """
+        path = f"/v2/general?url={url}&x-api-key={self.api_key}"
+
+        # A pooled connection may have been closed by the server while idle;
+        # retry once on a fresh connection in that case.
+        for attempt in range(2):
+            conn = self._acquire()
+            try:
+                conn.request("GET", path)
+                res = conn.getresponse()
+                data = res.read()
+            except (http.client.HTTPException, ConnectionError, OSError):
+                conn.close()
+                if attempt:
+                    raise
+                logger.info("Pooled connection was stale, reconnecting")
+                continue
+            if res.will_close:
+                conn.close()
+            else:
+                self._release(conn)
+            if not 200 <= res.status < 300:
+                raise FetchError(url, res.status, data)
+            return data
+
+    def warm_up(self, connections: int = 2) -> None:
+        """
+        Open connections ahead of the first request.
+
+        Args:
+            connections: Number of connections to pre-open
+        """
+        for _ in range(connections):
+            conn = http.client.HTTPSConnection(SCRAPINGANT_HOST, timeout=self.timeout)
+            try:
+                conn.connect()
+            except OSError:
+                logger.warning("Could not pre-open a ScrapingAnt connection", exc_info=True)
+                conn.close()
+                return
+            self._release(conn)
+        logger.info(f"Pre-opened {connections} ScrapingAnt connection(s)")
+
+
+_client: Optional[ScrapingAntClient] = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> ScrapingAntClient:
+    """Return the process-wide ScrapingAnt client."""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = ScrapingAntClient()
+    return _client
+
+
+def page_cache_ttl() -> float:
+    """Seconds a stored page is served instead of fetching it again (PAGE_CACHE_TTL, default 900)."""
+    return float(get_setting("PAGE_CACHE_TTL", 900))
+
+
+def fetch_page(url: str, max_age: Optional[float] = None) -> str:
+    """
+    Fetch the rendered page under the given URL as a UTF-8 string. Every
+    successfully fetched page is kept in the page store; a failed fetch
+    raises FetchError and leaves any stored copy alone.
+
+    Args:
+        url: The page to render
+        max_age: Serve a stored copy of the page if it is at most this many
+            seconds old; None always fetches a fresh copy
+
+    Returns:
+        The decoded page content
+    """
+    store = get_page_store()
+    if max_age is not None:
+        cached = store.get(url, max_age)
+        if cached is not None:
+            return cached.decode("utf-8")
+
+    data = get_client().fetch(url)
+    store.put(url, data)
+    return data.decode("utf-8")
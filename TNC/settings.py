@@ -0,0 +1,31 @@
+import os
+from typing import Any
+
+
+def get_setting(name: str, default: Any = None) -> Any:
+    """
+    Read a configuration value from the environment, then from Streamlit secrets.
+
+    Args:
+        name: Name of the setting, e.g. "SCRAPINGANT_API_KEY"
+        default: Value returned when the setting is not configured
+
+    Returns:
+        The configured value (environment values are strings) or the default
+    """
+    if name in os.environ:
+        return os.environ[name]
+    try:
+        import streamlit as st
+        return st.secrets.get(name, default)
+    except Exception:
+        # No secrets file outside of a configured Streamlit deployment
+        return default
+
+
+def get_flag(name: str, default: bool = False) -> bool:
+    """Read a boolean setting; accepts 1/0, true/false, yes/no, on/off."""
+    value = get_setting(name, default)
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
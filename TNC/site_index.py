@@ -0,0 +1,121 @@
+import json
+import math
+import re
+from collections import defaultdict
+from functools import lru_cache
+from typing import Any, Dict, List, Set, Tuple
+from .context import TNC_website_map
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Structural keys of the website map that are not meaningful in a page path.
+_STRUCTURAL_KEYS = {"Nature Conservancy Website Structure", "Main Sections", "Subpages"}
+
+_STOPWORDS = {"a", "an", "and", "the", "of", "to", "for", "our", "your", "we", "us", "how", "page"}
+
+# Folds common variants onto the words used in page titles.
+_ALIASES = {
+    "donation": "donate", "donations": "donate", "donating": "donate", "give": "donate", "giving": "donate",
+    "volunteering": "volunteer", "volunteers": "volunteer",
+    "event": "events", "members": "member", "membership": "member",
+    "renewal": "renew", "renewing": "renew",
+    "calculator": "calculate", "report": "reports",
+    "oceans": "ocean", "lands": "land", "waters": "water", "tools": "tool",
+    "staff": "people", "leadership": "people",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercases, tokenizes and alias-folds a piece of text for the site index."""
+    tokens = []
+    for token in _TOKEN_RE.findall(text.lower().replace("'", "")):
+        token = _ALIASES.get(token, token)
+        if token not in _STOPWORDS:
+            tokens.append(token)
+    return tokens
+
+
+def _flatten(node: Any, path: Tuple[str, ...] = ()) -> List[Dict[str, str]]:
+    """Flattens the nested website map into title/section/url entries."""
+    entries = []
+    if isinstance(node, dict):
+        if isinstance(node.get("URL"), str):
+            if node.get("Title"):
+                title, section = node["Title"], path
+            else:
+                # Untitled nodes are named by their key in the map
+                title, section = (path[-1], path[:-1]) if path else ("Homepage", ())
+            entries.append({"title": title, "section": " > ".join(section), "url": node["URL"]})
+        for key, value in node.items():
+            if key in ("URL", "Title", "Sections"):
+                continue
+            if isinstance(value, str):
+                entries.append({"title": key, "section": " > ".join(path), "url": value})
+            else:
+                child_path = path if key in _STRUCTURAL_KEYS else path + (key,)
+                entries.extend(_flatten(value, child_path))
+    elif isinstance(node, list):
+        for item in node:
+            entries.extend(_flatten(item, path))
+    return entries
+
+
+def _build_token_index(pages: List[Dict[str, str]]) -> Tuple[Dict[str, Set[int]], Dict[str, Set[int]]]:
+    """Builds inverted indexes from title tokens and section tokens to page ids."""
+    title_index: Dict[str, Set[int]] = defaultdict(set)
+    section_index: Dict[str, Set[int]] = defaultdict(set)
+    for page_id, page in enumerate(pages):
+        for token in tokenize(page["title"]):
+            title_index[token].add(page_id)
+        for token in tokenize(page["section"]):
+            section_index[token].add(page_id)
+    return dict(title_index), dict(section_index)
+
+
+# Compiled once at import: flat page list and token indexes over it.
+SITE_PAGES: List[Dict[str, str]] = _flatten(TNC_website_map)
+TITLE_INDEX, SECTION_INDEX = _build_token_index(SITE_PAGES)
+TOP_LEVEL_SECTIONS: List[str] = list(TNC_website_map["Nature Conservancy Website Structure"]["Main Sections"])
+
+# Pre-serialized full map for the get_website_structure tool.
+WEBSITE_MAP_JSON = json.dumps(TNC_website_map)
+
+
+def _idf(token: str) -> float:
+    matches = len(TITLE_INDEX.get(token, ())) + len(SECTION_INDEX.get(token, ()))
+    return math.log(1 + len(SITE_PAGES) / (1 + matches))
+
+
+def find_sections(topic: str, limit: int = 5) -> List[Dict[str, str]]:
+    """
+    Find the website pages matching a topic.
+
+    Args:
+        topic: Free-text topic, e.g. "donate monthly" or "carbon footprint"
+        limit: Maximum number of pages to return
+
+    Returns:
+        List of {"title", "section", "url"} dictionaries ordered by relevance
+    """
+    scores: Dict[int, float] = defaultdict(float)
+    for token in set(tokenize(topic)):
+        weight = _idf(token)
+        for page_id in TITLE_INDEX.get(token, ()):
+            scores[page_id] += weight
+        for page_id in SECTION_INDEX.get(token, ()):
+            scores[page_id] += 0.5 * weight
+
+    ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+    return [SITE_PAGES[page_id] for page_id, _ in ranked[:limit]]
+
+
+@lru_cache(maxsize=256)
+def find_sections_json(topic: str, limit: int = 5) -> str:
+    """
+    Same as find_sections, serialized to the JSON sent back to the model.
+    Falls back to the list of top-level sections when nothing matches.
+    """
+    matches = find_sections(topic, limit)
+    if matches:
+        return json.dumps({"topic": topic, "matches": matches})
+    return json.dumps({"topic": topic, "matches": [], "available_sections": TOP_LEVEL_SECTIONS})
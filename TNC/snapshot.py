@@ -0,0 +1,372 @@
+"""
+Read-only corpus snapshots of extracted nature.org content.
+
+A snapshot is a single file laid out as
+
+    header | records | url index | source index | string heap
+
+Records are fixed-width structs holding the record kind, its position on the
+page it was extracted from and (offset, length) references into the string
+heap. The two indexes are arrays of record numbers sorted by URL and by source
+page, so lookups are binary searches over the mapped file. Readers open the
+file with mmap, so every process on a node shares the same physical pages and
+nothing is copied until a string is actually decoded.
+
+Snapshots are built offline from the page store and swapped in atomically with
+os.replace; readers notice the new inode and reopen.
+
+Usage:
+    python -m TNC.snapshot build -o snapshot.bin --page-store pages.db
+    python -m TNC.snapshot info snapshot.bin
+    python -m TNC.snapshot get snapshot.bin https://www.nature.org/en-us/search/?q=wetlands
+"""
+import argparse
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+from typing import Iterable, Iterator, List, NamedTuple, Optional
+from .settings import get_setting
+
+logger = logging.getLogger("Snapshot")
+
+MAGIC = b"TNCSNAP1"
+VERSION = 1
+
+# magic, version, record count, records offset, url index offset, source index offset, heap offset, built at
+_HEADER = struct.Struct("<8sIIQQQQd")
+
+# String fields of a record, in storage order.
+FIELDS = ("source", "url", "title", "date", "text", "extra")
+
+# kind, flags, reserved, position, then (heap offset, length) per string field
+_RECORD = struct.Struct("<BBHI" + "QI" * len(FIELDS))
+
+_INDEX = struct.Struct("<I")
+
+KINDS = ("page", "search", "news")
+FLAG_RECOMMENDED = 1
+
+
+class SnapshotRecord(NamedTuple):
+    """One extracted item: a search result, a news card or a whole page."""
+    kind: str
+    position: int
+    source: str
+    url: str
+    title: str
+    date: str = ""
+    text: str = ""
+    extra: str = ""
+    recommended: bool = False
+
+
+def write_snapshot(records: Iterable[SnapshotRecord], path: str) -> int:
+    """
+    Write a snapshot and atomically replace the file at path with it.
+
+    Args:
+        records: The records to store
+        path: Destination file
+
+    Returns:
+        Number of records written
+    """
+    heap = bytearray()
+    interned = {}
+
+    def intern(value: str):
+        # Identical strings (source URLs, dates, ...) are stored once
+        ref = interned.get(value)
+        if ref is None:
+            data = value.encode("utf-8")
+            ref = interned[value] = (len(heap), len(data))
+            heap.extend(data)
+        return ref
+
+    records = list(records)
+    packed = []
+    for record in records:
+        refs = []
+        for field in FIELDS:
+            refs.extend(intern(getattr(record, field) or ""))
+        flags = FLAG_RECOMMENDED if record.recommended else 0
+        packed.append(_RECORD.pack(KINDS.index(record.kind), flags, 0, record.position, *refs))
+
+    url_order = sorted(range(len(records)), key=lambda i: (records[i].url.encode("utf-8"), i))
+    source_order = sorted(range(len(records)), key=lambda i: (records[i].source.encode("utf-8"), records[i].position, i))
+
+    records_offset = _HEADER.size
+    url_index_offset = records_offset + _RECORD.size * len(records)
+    source_index_offset = url_index_offset + _INDEX.size * len(records)
+    heap_offset = source_index_offset + _INDEX.size * len(records)
+
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(MAGIC, VERSION, len(records), records_offset, url_index_offset,
+                             source_index_offset, heap_offset, time.time()))
+        f.writelines(packed)
+        f.writelines(_INDEX.pack(i) for i in url_order)
+        f.writelines(_INDEX.pack(i) for i in source_order)
+        f.write(heap)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+    return len(records)
+
+
+class Snapshot:
+    """A memory-mapped, read-only snapshot file."""
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Snapshot file written by write_snapshot
+        """
+        self.path = path
+        with open(path, "rb") as f:
+            stat = os.fstat(f.fileno())
+            self.inode = (stat.st_dev, stat.st_ino)
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count, self._records, self._url_index, self._source_index, self._heap, self.built_at = \
+            _HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} snapshot")
+
+    def __len__(self) -> int:
+        return self.count
+
+    def _refs(self, index: int) -> tuple:
+        return _RECORD.unpack_from(self._mm, self._records + index * _RECORD.size)
+
+    def view(self, index: int, field: str) -> memoryview:
+        """Zero-copy view of one string field of a record (UTF-8 bytes)."""
+        refs = self._refs(index)
+        slot = 4 + 2 * FIELDS.index(field)
+        offset, length = refs[slot], refs[slot + 1]
+        return memoryview(self._mm)[self._heap + offset:self._heap + offset + length]
+
+    def _bytes(self, offset: int, length: int) -> bytes:
+        return self._mm[self._heap + offset:self._heap + offset + length]
+
+    def record(self, index: int) -> SnapshotRecord:
+        """Decode the record at the given position."""
+        kind, flags, _, position, *refs = self._refs(index)
+        values = [self._bytes(refs[i], refs[i + 1]).decode("utf-8") for i in range(0, len(refs), 2)]
+        return SnapshotRecord(KINDS[kind], position, *values, recommended=bool(flags & FLAG_RECOMMENDED))
+
+    def __iter__(self) -> Iterator[SnapshotRecord]:
+        return (self.record(i) for i in range(self.count))
+
+    def _lookup(self, index_offset: int, field: str, key: str) -> List[int]:
+        """Record numbers whose field equals key, via binary search over a sorted index."""
+        target = key.encode("utf-8")
+        slot = 4 + 2 * FIELDS.index(field)
+
+        def value_at(position: int) -> bytes:
+            record = _INDEX.unpack_from(self._mm, index_offset + position * _INDEX.size)[0]
+            refs = self._refs(record)
+            return self._bytes(refs[slot], refs[slot + 1])
+
+        low, high = 0, self.count
+        while low < high:
+            mid = (low + high) // 2
+            if value_at(mid) < target:
+                low = mid + 1
+            else:
+                high = mid
+        matches = []
+        while low < self.count and value_at(low) == target:
+            matches.append(_INDEX.unpack_from(self._mm, index_offset + low * _INDEX.size)[0])
+            low += 1
+        return matches
+
+    def by_url(self, url: str, kind: Optional[str] = None) -> List[SnapshotRecord]:
+        """Records extracted for the given URL."""
+        records = [self.record(i) for i in self._lookup(self._url_index, "url", url)]
+        return [record for record in records if kind is None or record.kind == kind]
+
+    def by_source(self, source: str, kind: Optional[str] = None) -> List[SnapshotRecord]:
+        """Records extracted from the given page, in page order."""
+        records = [self.record(i) for i in self._lookup(self._source_index, "source", source)]
+        return [record for record in records if kind is None or record.kind == kind]
+
+    def close(self) -> None:
+        self._mm.close()
+
+
+class SnapshotReader:
+    """
+    Hands out the current snapshot for a path and reopens it once an offline
+    build has replaced the file.
+    """
+
+    def __init__(self, path: str, check_interval: float = 5.0, max_age: Optional[float] = None):
+        """
+        Args:
+            path: Snapshot file
+            check_interval: Minimum seconds between checks for a replaced file
+            max_age: Seconds after its build a snapshot is no longer served, or None for no limit
+        """
+        self.path = path
+        self.check_interval = check_interval
+        self.max_age = max_age
+        self._snapshot: Optional[Snapshot] = None
+        self._checked = 0.0
+        self._stale_logged = None
+        self._lock = threading.Lock()
+
+    def get(self) -> Optional[Snapshot]:
+        """Return the current snapshot, or None if the file does not exist or is too old."""
+        return self._fresh(self._current())
+
+    def _fresh(self, snapshot: Optional[Snapshot]) -> Optional[Snapshot]:
+        if snapshot is None or self.max_age is None or time.time() - snapshot.built_at <= self.max_age:
+            return snapshot
+        if self._stale_logged != snapshot.inode:
+            # Logged once per file; callers fall back to live fetches until a new build replaces it
+            self._stale_logged = snapshot.inode
+            built = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(snapshot.built_at))
+            logger.warning(f"Snapshot {self.path} was built at {built}, more than {self.max_age:.0f}s ago; "
+                           f"not serving it")
+        return None
+
+    def _current(self) -> Optional[Snapshot]:
+        now = time.monotonic()
+        if now - self._checked < self.check_interval:
+            return self._snapshot
+        with self._lock:
+            if now - self._checked < self.check_interval:
+                return self._snapshot
+            self._checked = now
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                self._snapshot = None
+                return None
+            if self._snapshot is None or self._snapshot.inode != (stat.st_dev, stat.st_ino):
+                try:
+                    snapshot = Snapshot(self.path)
+                except (OSError, ValueError):
+                    logger.warning(f"Could not open snapshot {self.path}", exc_info=True)
+                    return self._snapshot
+                # The previous mapping is released once no caller references it
+                self._snapshot = snapshot
+                logger.info(f"Opened snapshot {self.path} with {len(snapshot)} records")
+            return self._snapshot
+
+
+_reader: Optional[SnapshotReader] = None
+_reader_lock = threading.Lock()
+
+
+def get_snapshot() -> Optional[Snapshot]:
+    """
+    Return the process-wide snapshot configured by SNAPSHOT_PATH, or None if
+    there is none or it is older than SNAPSHOT_MAX_AGE seconds (default 86400,
+    0 for no limit).
+    """
+    global _reader
+    if _reader is None:
+        path = get_setting("SNAPSHOT_PATH")
+        if not path:
+            return None
+        with _reader_lock:
+            if _reader is None:
+                max_age = float(get_setting("SNAPSHOT_MAX_AGE", 86400))
+                _reader = SnapshotReader(path, max_age=max_age or None)
+    return _reader.get()
+
+
+def extract_records(url: str, content: str) -> List[SnapshotRecord]:
+    """
+    Extract snapshot records from a stored page: search results and news
+    cards for listing pages, the readable text for any other page.
+
+    Args:
+        url: The page's URL
+        content: The page's HTML
+
+    Returns:
+        The extracted records
+    """
+    from .tnc_api import _extract_news_cards, _extract_page_text, _extract_search_results
+
+    if "/en-us/search/" in url:
+        return [
+            SnapshotRecord("search", item["id"], url, item["url"], item["title"], item["date"], item["content"],
+                           recommended=item["recommended"])
+            for item in _extract_search_results(content)
+        ]
+    if "/en-us/newsroom/" in url:
+        cards = _extract_news_cards(content)
+        if cards:
+            return [
+                SnapshotRecord("news", position, url, "", card["title"], card["byline"], card["excerpt"],
+                               card["image_url"])
+                for position, card in enumerate(cards)
+            ]
+    page = _extract_page_text(content)
+    return [SnapshotRecord("page", 0, url, url, page["title"], "", page["text"])]
+
+
+def build_from_page_store(path: str) -> Iterator[SnapshotRecord]:
+    """Extract records from every page in a page store SQLite file."""
+    from .page_store import PageStore
+
+    store = PageStore(path=path)
+    for url, _, content in store.iter_pages():
+        yield from extract_records(url, content.decode("utf-8", errors="replace"))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build and inspect corpus snapshots.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="Build a snapshot from the page store")
+    build.add_argument("-o", "--output", default=get_setting("SNAPSHOT_PATH", "snapshot.bin"),
+                       help="Snapshot file to (atomically) replace")
+    build.add_argument("--page-store", default=get_setting("PAGE_STORE_PATH"),
+                       help="Page store SQLite file (default: PAGE_STORE_PATH)")
+
+    info = subparsers.add_parser("info", help="Print a snapshot's size and record counts")
+    info.add_argument("path")
+
+    get = subparsers.add_parser("get", help="Print the records for a URL or source page")
+    get.add_argument("path")
+    get.add_argument("url")
+
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "build":
+        if not args.page_store:
+            parser.error("--page-store (or PAGE_STORE_PATH) is required")
+        start = time.perf_counter()
+        count = write_snapshot(build_from_page_store(args.page_store), args.output)
+        print(f"Wrote {count} records to {args.output} ({os.path.getsize(args.output)} bytes) "
+              f"in {time.perf_counter() - start:.1f}s")
+    elif args.command == "info":
+        snapshot = Snapshot(args.path)
+        kinds = {}
+        for i in range(len(snapshot)):
+            kind = KINDS[snapshot._refs(i)[0]]
+            kinds[kind] = kinds.get(kind, 0) + 1
+        print(json.dumps({
+            "records": len(snapshot),
+            "bytes": os.path.getsize(args.path),
+            "built_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(snapshot.built_at)),
+            "kinds": kinds,
+        }, indent=2))
+    else:
+        snapshot = Snapshot(args.path)
+        records = snapshot.by_source(args.url) or snapshot.by_url(args.url)
+        for record in records:
+            print(json.dumps(record._asdict(), ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,289 @@
+"""
+Type-ahead suggestions over the titles and URLs of everything already known
+locally: the website map, the events, the corpus snapshot, and the search
+results, news cards and pages in the page store and news index.
+
+Every title is indexed under each of its word positions ("Protect Wetlands"
+under "protect wetlands" and "wetlands"), so a prefix of any word run
+matches. Keys live in one sorted list searched with bisect. Suggestions
+carry the text already known about them, so choosing one shows a result
+without a model round trip.
+"""
+import logging
+import math
+import re
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+from .settings import get_setting
+
+logger = logging.getLogger("Suggest")
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Title words from which suffix keys are indexed; later words are only
+# reachable through a key starting earlier.
+_MAX_KEY_WORDS = 8
+
+# Keys scanned per lookup, so very short prefixes stay fast.
+_MAX_SCAN = 400
+
+# Base weight per suggestion kind: curated site pages first.
+KIND_WEIGHTS = {"site": 1.0, "event": 0.8, "page": 0.6, "search": 0.5, "news": 0.5}
+
+# Characters of text kept with a suggestion to show when it is chosen.
+_DETAIL_CHARS = 300
+
+
+def normalize(text: str) -> str:
+    """Lowercase words separated by single spaces."""
+    return " ".join(_TOKEN_RE.findall(text.lower().replace("'", "")))
+
+
+def _snippet(text: str) -> str:
+    text = " ".join((text or "").split())
+    return text if len(text) <= _DETAIL_CHARS else text[:_DETAIL_CHARS].rsplit(" ", 1)[0] + "…"
+
+
+class Suggestion:
+    """One suggestable title with what is known about it."""
+
+    __slots__ = ("title", "url", "kind", "detail", "popularity", "weight")
+
+    def __init__(self, title: str, url: str, kind: str, detail: str = "", popularity: float = 0.0):
+        """
+        Args:
+            title: Title shown in the suggestion list
+            url: Page the title links to ("" for news cards, which have none)
+            kind: "site", "event", "page", "search" or "news"
+            detail: Text shown when the suggestion is chosen
+            popularity: Calls and appearances counted for the page
+        """
+        self.title = title
+        self.url = url
+        self.kind = kind
+        self.detail = _snippet(detail)
+        self.popularity = popularity
+        self.weight = 0.0
+
+    def markdown(self) -> str:
+        """The suggestion as a short markdown answer."""
+        heading = f"**[{self.title}]({self.url})**" if self.url else f"**{self.title}**"
+        return f"{heading}\n\n{self.detail}" if self.detail else heading
+
+    def __repr__(self) -> str:
+        return f"Suggestion({self.title!r}, {self.kind}, weight={self.weight:.2f})"
+
+
+class SuggestIndex:
+    """Sorted-array prefix index over suggestion titles and URL slugs."""
+
+    def __init__(self, suggestions: Iterable[Suggestion], popularity: Optional[Dict[str, float]] = None):
+        """
+        Args:
+            suggestions: Entries to index; repeated URLs (or titles without a
+                URL) are merged and count as more popular
+            popularity: Calls per URL, e.g. from the query log
+        """
+        popularity = popularity or {}
+        merged: Dict[Tuple[str, str], Suggestion] = {}
+        for suggestion in suggestions:
+            if not suggestion.title.strip():
+                continue
+            key = (suggestion.url, "") if suggestion.url else ("", normalize(suggestion.title))
+            existing = merged.get(key)
+            if existing is None:
+                merged[key] = suggestion
+                continue
+            existing.popularity += suggestion.popularity + 0.2
+            # Keep the most curated kind and any detail found elsewhere
+            if KIND_WEIGHTS[suggestion.kind] > KIND_WEIGHTS[existing.kind]:
+                existing.title, existing.kind = suggestion.title, suggestion.kind
+            existing.detail = existing.detail or suggestion.detail
+
+        self.suggestions: List[Suggestion] = list(merged.values())
+        entries: List[Tuple[str, int]] = []
+        for position, suggestion in enumerate(self.suggestions):
+            suggestion.popularity += popularity.get(suggestion.url, 0.0)
+            suggestion.weight = KIND_WEIGHTS[suggestion.kind] + math.log1p(suggestion.popularity)
+            words = normalize(suggestion.title).split()
+            for start in range(min(len(words), _MAX_KEY_WORDS)):
+                # Position 0 marks a match at the start of the title
+                entries.append((" ".join(words[start:]), position * 2 + (start > 0)))
+            slug = normalize(urlsplit(suggestion.url).path.rstrip("/").rsplit("/", 1)[-1]) if suggestion.url else ""
+            if slug and slug != " ".join(words):
+                entries.append((slug, position * 2 + 1))
+        entries.sort()
+        self._keys = [key for key, _ in entries]
+        self._refs = [ref for _, ref in entries]
+        self.built_at = time.time()
+
+    def __len__(self) -> int:
+        return len(self.suggestions)
+
+    def suggest(self, prefix: str, limit: int = 8) -> List[Suggestion]:
+        """
+        Suggestions whose title (or URL slug) has a word run starting with the prefix.
+
+        Args:
+            prefix: What the user has typed so far, e.g. "fire sea"
+            limit: Maximum number of suggestions
+
+        Returns:
+            Matches, title-start matches and then the most popular first
+        """
+        query = normalize(prefix)
+        if len(query) < 2:
+            return []
+        scores: Dict[int, float] = {}
+        end = min(len(self._keys), bisect_left(self._keys, query) + _MAX_SCAN)
+        for i in range(bisect_left(self._keys, query), end):
+            if not self._keys[i].startswith(query):
+                break
+            position, inner = divmod(self._refs[i], 2)
+            score = self.suggestions[position].weight + (0.0 if inner else 1.0)
+            if score > scores.get(position, -1.0):
+                scores[position] = score
+        suggestions, titles = [], set()
+        for position in sorted(scores, key=lambda position: -scores[position]):
+            # Pages sharing a title (e.g. two "Donate" links) would look identical in the list
+            title = normalize(self.suggestions[position].title)
+            if title not in titles:
+                titles.add(title)
+                suggestions.append(self.suggestions[position])
+                if len(suggestions) == limit:
+                    break
+        return suggestions
+
+
+def collect_suggestions() -> List[Suggestion]:
+    """Everything known locally that can be suggested, without fetching anything."""
+    from .news_index import peek_news_index
+    from .page_store import get_page_store
+    from .site_index import SITE_PAGES
+    from .snapshot import get_snapshot
+    from .tnc_api import _EVENTS
+
+    suggestions = [Suggestion(page["title"], page["url"], "site", page["section"]) for page in SITE_PAGES]
+    suggestions += [
+        Suggestion(event.title, event.url, "event", f"{event.date}, {event.time}, {event.site}. {event.description}")
+        for event in _EVENTS
+    ]
+
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        for record in snapshot:
+            suggestions.append(Suggestion(record.title, record.url, record.kind,
+                                          f"{record.date} {record.text}".strip(),
+                                          popularity=1.0 if record.recommended else 0.0))
+
+    store = get_page_store()
+    for _, items in store.parsed_pages("search"):
+        suggestions += [Suggestion(item["title"], item["url"], "search", item["content"],
+                                   popularity=1.0 if item["recommended"] else 0.0) for item in items]
+    for _, items in store.parsed_pages("news"):
+        suggestions += [Suggestion(item["title"], "", "news", f"{item['byline']}. {item['excerpt']}")
+                        for item in items]
+    for url, page in store.parsed_pages("page"):
+        suggestions.append(Suggestion(page["title"], url, "page", page["text"]))
+
+    news_index = peek_news_index()
+    if news_index is not None:
+        suggestions += [Suggestion(card.title, "", "news", f"{card.byline}. {card.excerpt}")
+                        for card in news_index.latest(len(news_index))]
+    return suggestions
+
+
+class SuggestService:
+    """Keeps a suggestion index and rebuilds it in the background when it gets old."""
+
+    def __init__(self, max_age: float = 300.0, popularity: Optional[Callable[[], Dict[str, float]]] = None):
+        """
+        Args:
+            max_age: Seconds before the index is rebuilt to include newly cached results
+            popularity: Returns calls per URL; read on each rebuild
+        """
+        self.max_age = max_age
+        self.popularity = popularity
+        self._index: Optional[SuggestIndex] = None
+        self._lock = threading.Lock()
+        self._rebuilding = False
+        self.stats = {"lookups": 0, "lookup_seconds": 0.0, "builds": 0, "build_seconds": 0.0}
+
+    def _build(self) -> SuggestIndex:
+        start = time.perf_counter()
+        try:
+            popularity = self.popularity() if self.popularity else None
+        except Exception:
+            logger.warning("Could not read suggestion popularity", exc_info=True)
+            popularity = None
+        index = SuggestIndex(collect_suggestions(), popularity)
+        elapsed = time.perf_counter() - start
+        self.stats["builds"] += 1
+        self.stats["build_seconds"] += elapsed
+        logger.info(f"Built the suggestion index over {len(index)} titles in {elapsed * 1000:.0f} ms")
+        return index
+
+    def _rebuild(self) -> None:
+        try:
+            self._index = self._build()
+        except Exception:
+            logger.warning("Could not rebuild the suggestion index; keeping the old one", exc_info=True)
+        finally:
+            self._rebuilding = False
+
+    def index(self) -> SuggestIndex:
+        """
+        The current index. The first build blocks its callers; afterwards a
+        stale index keeps being served while a background thread rebuilds it.
+        """
+        index = self._index
+        if index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = self._build()
+                return self._index
+        if time.time() - index.built_at >= self.max_age:
+            with self._lock:
+                start, self._rebuilding = not self._rebuilding, True
+            if start:
+                threading.Thread(target=self._rebuild, name="suggest-rebuild", daemon=True).start()
+        return index
+
+    def suggest(self, prefix: str, limit: int = 8) -> List[Suggestion]:
+        """See SuggestIndex.suggest."""
+        index = self.index()
+        start = time.perf_counter()
+        suggestions = index.suggest(prefix, limit)
+        self.stats["lookups"] += 1
+        self.stats["lookup_seconds"] += time.perf_counter() - start
+        return suggestions
+
+    def report(self) -> Dict[str, float]:
+        """Lookups and builds with their average time."""
+        stats = dict(self.stats)
+        stats["avg_lookup_ms"] = stats["lookup_seconds"] * 1000 / stats["lookups"] if stats["lookups"] else 0.0
+        stats["avg_build_ms"] = stats["build_seconds"] * 1000 / stats["builds"] if stats["builds"] else 0.0
+        return stats
+
+
+_service: Optional[SuggestService] = None
+_service_lock = threading.Lock()
+
+
+def get_suggest_service(popularity: Optional[Callable[[], Dict[str, float]]] = None) -> SuggestService:
+    """
+    Return the process-wide suggestion service, rebuilt every SUGGEST_MAX_AGE
+    seconds (default 300).
+
+    Args:
+        popularity: Source of calls per URL, used when the service is created
+    """
+    global _service
+    if _service is None:
+        with _service_lock:
+            if _service is None:
+                _service = SuggestService(max_age=float(get_setting("SUGGEST_MAX_AGE", 300)), popularity=popularity)
+    return _service
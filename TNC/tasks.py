@@ -0,0 +1,41 @@
+"""
+Runs work submitted to thread pools in the context of the code that
+submitted it, so context variables (session, question, active profile)
+carry over to pool threads, and registered hooks see the work run there.
+"""
+import contextlib
+import contextvars
+import functools
+from typing import Callable, ContextManager, List
+
+# Context managers entered around every task run through in_submitter_context.
+_task_hooks: List[Callable[[], ContextManager]] = []
+
+
+def register_task_hook(hook: Callable[[], ContextManager]) -> None:
+    """
+    Register a context manager factory entered, in the submitter's context,
+    around each task run on a pool thread (e.g. to sample that thread while a
+    profiled request waits for it).
+    """
+    _task_hooks.append(hook)
+
+
+def in_submitter_context(function: Callable) -> Callable:
+    """
+    Wrap a function about to be handed to a thread pool so it runs in a copy of
+    the current context. Each call gets its own copy, so the wrapper can be
+    passed to Executor.map.
+    """
+    context = contextvars.copy_context()
+
+    def _call(*args, **kwargs):
+        with contextlib.ExitStack() as stack:
+            for hook in _task_hooks:
+                stack.enter_context(hook())
+            return function(*args, **kwargs)
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        return context.copy().run(_call, *args, **kwargs)
+    return wrapper
@@ -1,10 +1,14 @@
-import http.client
-import json
+from datetime import datetime
+from functools import lru_cache
 from urllib.parse import quote_plus
-from typing import List
-from bs4 import BeautifulSoup
-import streamlit as st
+from typing import List, Optional
+from .gazetteer import GridIndex, resolve_region
+from .news_index import parse_byline
 from .models import SearchResult, NewsCard, EventCard
+from .page_store import get_page_store
+from .parse_pool import parser_for
+from .scraper import fetch_page, page_cache_ttl
+from .snapshot import get_snapshot
 
     
 def _extract_search_results(html_content: str) -> List[dict]:
@@ -19,6 +23,8 @@ def _extract_search_results(html_content: str) -> List[dict]:
       - content: from the <p> element with the content class.
       - recommended: a boolean flag indicating if this item is marked as recommended.
     """
+    from bs4 import BeautifulSoup
+
     soup = BeautifulSoup(html_content, "html.parser")
     
     # Select all <li> elements with the class "c-search-result-item"
@@ -58,6 +64,20 @@ def _extract_search_results(html_content: str) -> List[dict]:
     
     return results
 
+def normalize_query(query: str) -> str:
+    """
+    Canonical form of a search query: lowercase, single spaces. The site's
+    search ignores case, so "Wetland Restoration" and "wetland restoration"
+    share one listing URL, one cached page and one query log key.
+    """
+    return " ".join(str(query).lower().split())
+
+
+def search_url(query: str) -> str:
+    """Nature.org search listing URL for a query."""
+    return f"https://www.nature.org/en-us/search/?q={quote_plus(normalize_query(query))}"
+
+
 def get_search_results(query: str) -> List[SearchResult]:
     """
     Given a search query string, this function:
@@ -67,26 +87,24 @@ def get_search_results(query: str) -> List[SearchResult]:
       4. Returns a list of SearchResult Pydantic objects.
     """
     # URL-encode the query.
-    encoded_query = quote_plus(query)
-    base_search_url = f"https://www.nature.org/en-us/search/?q={encoded_query}"
+    base_search_url = search_url(query)
     
-    # API key for ScrapingAnt (example key).
-    api_key = st.secrets["SCRAPINGANT_API_KEY"]
-    api_path = f"/v2/general?url={base_search_url}&x-api-key={api_key}"
+    # Serve the listing from the shared corpus snapshot if it has it.
+    snapshot = get_snapshot()
+    records = snapshot.by_source(base_search_url, kind="search") if snapshot else []
+    if records:
+        return [
+            SearchResult(id=r.position, url=r.url, title=r.title, date=r.date, content=r.text,
+                         recommended=r.recommended)
+            for r in records
+        ]
     
-    # Retrieve HTML content from the API.
-    conn = http.client.HTTPSConnection("api.scrapingant.com")
+    # Retrieve HTML content through the pooled ScrapingAnt client (or the page store).
+    html_content = fetch_page(base_search_url, max_age=page_cache_ttl())
     
-    http.client._MAXHEADERS = 1000 
-
-    conn.request("GET", api_path)
-    res = conn.getresponse()
-    data = res.read()
-    
-    html_content = data.decode("utf-8")
-    
-    # Extract search results as a list of dictionaries.
-    results_dict = _extract_search_results(html_content)
+    # Extract search results as a list of dictionaries (memoized by page content;
+    # large pages are parsed in the parse pool if it is enabled).
+    results_dict = get_page_store().parse_cached("search", html_content, parser_for("search"))
     
     # Convert each dictionary to a Pydantic object.
     return [SearchResult(**item) for item in results_dict]
@@ -104,6 +122,8 @@ def _extract_news_cards(html_content: str) -> List[dict]:
       - excerpt: from the <p> element with class "c-cards-press-release__excerpt".
       - byline: from the <p> element with class "c-cards-press-release__byline".
     """
+    from bs4 import BeautifulSoup
+
     soup = BeautifulSoup(html_content, "html.parser")
     
     # Find the main container of news cards
@@ -141,6 +161,31 @@ def _extract_news_cards(html_content: str) -> List[dict]:
     
     return results
 
+def _news_card(image_url: str, title: str, excerpt: str, byline: str) -> NewsCard:
+    """Builds a NewsCard with the location and ISO publication date split out of the byline."""
+    location, published = parse_byline(byline)
+    return NewsCard(image_url=image_url, title=title, excerpt=excerpt, byline=byline, location=location,
+                    published=published.isoformat() if published else "")
+
+
+def fetch_news_cards(news_url: str, max_age: Optional[float] = None) -> List[NewsCard]:
+    """
+    Retrieves a newsroom listing page (or its stored copy if at most max_age
+    seconds old) and returns its press release cards.
+    """
+    html_content = fetch_page(news_url, max_age=max_age)
+    
+    # Extract news cards as a list of dictionaries (memoized by page content).
+    results_dict = get_page_store().parse_cached("news", html_content, parser_for("news"))
+    
+    # Convert each dictionary to a Pydantic NewsCard object.
+    return [_news_card(**item) for item in results_dict]
+
+def news_search_url(query: str) -> str:
+    """Newsroom search listing URL for a query."""
+    return f"https://www.nature.org/en-us/newsroom/?press_q={quote_plus(normalize_query(query))}"
+
+
 def get_news_cards(query: str) -> List[NewsCard]:
     """
     Given a search query string, this function:
@@ -150,64 +195,137 @@ def get_news_cards(query: str) -> List[NewsCard]:
       4. Returns a list of NewsCard Pydantic objects.
     """
     # URL-encode the query.
-    encoded_query = quote_plus(query)
-    base_news_url = f"https://www.nature.org/en-us/newsroom/?press_q={encoded_query}"
-    
-    # API key for ScrapingAnt (example key).
-    api_key = st.secrets["SCRAPINGANT_API_KEY"]
-    api_path = f"/v2/general?url={base_news_url}&x-api-key={api_key}"
+    base_news_url = news_search_url(query)
     
-    # Retrieve HTML content from the API.
-    conn = http.client.HTTPSConnection("api.scrapingant.com")
+    # Serve the listing from the shared corpus snapshot if it has it.
+    snapshot = get_snapshot()
+    records = snapshot.by_source(base_news_url, kind="news") if snapshot else []
+    if records:
+        return [_news_card(image_url=r.extra, title=r.title, excerpt=r.text, byline=r.date) for r in records]
     
-    http.client._MAXHEADERS = 1000 
+    # Retrieve the listing through the pooled ScrapingAnt client (or the page store).
+    return fetch_news_cards(base_news_url, max_age=page_cache_ttl())
+
 
-    conn.request("GET", api_path)
-    res = conn.getresponse()
-    data = res.read()
-    html_content = data.decode("utf-8")
-    
-    # Extract news cards as a list of dictionaries.
-    results_dict = _extract_news_cards(html_content)
-    
-    # Convert each dictionary to a Pydantic NewsCard object.
-    return [NewsCard(**item) for item in results_dict]
-
-
-
-def event_search(region: str, key_word: str):
-    return [
-        EventCard(
-            url="https://www.nature.org/en-us/get-involved/how-to-help/events/colorado-mountainfilm-on-tour/",
-            title="Mountainfilm on Tour",
-            description="Please join us at the Denver Museum of Nature & Science for an evening of conservation and science-focused short films, panel discussions, and treats!",
-            date="Mar 05, 2025",
-            site='Denver',
-            time='6:00 PM - 9:00 PM'
-        ),
-        EventCard(
-            url="https://www.nature.org/en-us/get-involved/how-to-help/events/utah-ski-for-nature/",
-            title="2025 Annual Meeting",
-            description="Join us for our annual meeting where we will discuss our progress, challenges, and future plans for conservation in 2025.",
-            date="Apr 12, 2025",
-            site='New York',
-            time='10:00 AM - 1:00 PM'
-        ),
-        EventCard(
-            url="https://www.nature.org/en-us/get-involved/how-to-help/events/tx-davis-mountains-open-days/",
-            title="2025 Annual Meeting",
-            description="Join us for our annual meeting where we will discuss our progress, challenges, and future plans for conservation in 2025.",
-            date="Apr 12, 2025",
-            site='New York',
-            time='10:00 AM - 1:00 PM'
-        ),
-        EventCard(
-            url="https://www.nature.org/en-us/get-involved/how-to-help/events/west-texas-springs-preserve-tours/",
-            title="2025 Annual Meeting",
-            description="Join us for our annual meeting where we will discuss our progress, challenges, and future plans for conservation in 2025.",
-            date="Apr 12, 2025",
-            site='New York',
-            time='10:00 AM - 1:00 PM'
-        ),   
-    ]
 
+def _extract_page_text(html_content: str) -> dict:
+    """
+    Parses an arbitrary HTML page and extracts its readable content:
+      - title: from the <title> element (or the first <h1>).
+      - text: the visible text with scripts, styles and site chrome removed,
+        one block per line.
+    """
+    from bs4 import BeautifulSoup
+
+    soup = BeautifulSoup(html_content, "html.parser")
+
+    title_tag = soup.find("title") or soup.find("h1")
+    title = title_tag.get_text(strip=True) if title_tag else ""
+
+    # Drop elements that never carry readable content.
+    for tag in soup(["script", "style", "noscript", "template", "svg", "nav", "header", "footer"]):
+        tag.decompose()
+
+    body = soup.body or soup
+    lines = (line.strip() for line in body.get_text("\n").splitlines())
+    text = "\n".join(line for line in lines if line)
+
+    return {"title": title, "text": text}
+
+
+# Upcoming events; sites are resolved to coordinates through the gazetteer.
+_EVENTS = [
+    EventCard(
+        url="https://www.nature.org/en-us/get-involved/how-to-help/events/colorado-mountainfilm-on-tour/",
+        title="Mountainfilm on Tour",
+        description="Please join us at the Denver Museum of Nature & Science for an evening of conservation and science-focused short films, panel discussions, and treats!",
+        date="Mar 05, 2025",
+        site='Denver',
+        time='6:00 PM - 9:00 PM'
+    ),
+    EventCard(
+        url="https://www.nature.org/en-us/get-involved/how-to-help/events/utah-ski-for-nature/",
+        title="2025 Annual Meeting",
+        description="Join us for our annual meeting where we will discuss our progress, challenges, and future plans for conservation in 2025.",
+        date="Apr 12, 2025",
+        site='Park City',
+        time='10:00 AM - 1:00 PM'
+    ),
+    EventCard(
+        url="https://www.nature.org/en-us/get-involved/how-to-help/events/tx-davis-mountains-open-days/",
+        title="2025 Annual Meeting",
+        description="Join us for our annual meeting where we will discuss our progress, challenges, and future plans for conservation in 2025.",
+        date="Apr 12, 2025",
+        site='Fort Davis',
+        time='10:00 AM - 1:00 PM'
+    ),
+    EventCard(
+        url="https://www.nature.org/en-us/get-involved/how-to-help/events/west-texas-springs-preserve-tours/",
+        title="2025 Annual Meeting",
+        description="Join us for our annual meeting where we will discuss our progress, challenges, and future plans for conservation in 2025.",
+        date="Apr 12, 2025",
+        site='West Texas',
+        time='10:00 AM - 1:00 PM'
+    ),   
+]
+
+
+@lru_cache(maxsize=1)
+def _event_index() -> GridIndex:
+    """Grid index over the events whose site resolves to a known place."""
+    points = []
+    for event in _EVENTS:
+        place = resolve_region(event.site)
+        if place is not None:
+            points.append((place.lat, place.lon, event))
+    return GridIndex(points)
+
+
+def _event_date(event: EventCard) -> datetime:
+    try:
+        return datetime.strptime(event.date, "%b %d, %Y")
+    except ValueError:
+        return datetime.max
+
+
+def event_search(region: str, key_word: str, radius_km: Optional[float] = None,
+                 limit: Optional[int] = None) -> List[EventCard]:
+    """
+    Given a free-text region and a keyword, this function:
+      1. Resolves the region to coordinates through the offline gazetteer.
+      2. Collects the events within radius_km of it (the region's own extent
+         by default), or the nearest ones if none are that close.
+      3. Ranks events matching the keyword first, then by distance (in 25 km
+         steps) and date.
+      4. Returns a list of EventCard Pydantic objects with their distance.
+    """
+    limit = limit or 5
+    place = resolve_region(region)
+
+    if place is None:
+        # Unknown region: no distances, keyword matches and date order only
+        candidates = [(None, event) for event in _EVENTS]
+    else:
+        if radius_km is None:
+            radius_km = place.radius_km
+        index = _event_index()
+        candidates = index.within(place.lat, place.lon, radius_km) or index.nearest(place.lat, place.lon, limit)
+
+    # "Volunteering" should match "volunteer"
+    words = [word[:-3] if word.endswith("ing") and len(word) > 5 else word
+             for word in key_word.lower().split() if len(word) > 2]
+
+    def matches(event: EventCard) -> bool:
+        text = f"{event.title} {event.description}".lower()
+        return any(word in text for word in words)
+
+    def rank(candidate):
+        distance, event = candidate
+        step = 0 if distance is None else int(distance // 25)
+        return not matches(event), step, _event_date(event)
+
+    results = []
+    for distance, event in sorted(candidates, key=rank)[:limit]:
+        distance_km = None if distance is None else round(distance, 1)
+        results.append(event.model_copy(update={"distance_km": distance_km}))
+    return results
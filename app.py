@@ -1,7 +1,118 @@
 # app.py
 import streamlit as st
+import logging
 import os
-from LLM.llm import GenerativeAI
+import re
+import threading
+import uuid
+from TNC.settings import get_flag, get_setting
+from LLM.request_context import profile_requested
+from LLM.session_store import get_session_store
+
+logger = logging.getLogger("App")
+
+
+@st.cache_resource(show_spinner=False)
+def get_generative_ai():
+    """
+    Build the conversation engine once per server process. With CHAT_SERVICE_URL
+    set, this is a thin client of the headless chat service (LLM/service.py);
+    otherwise GenerativeAI runs in this process. The import is done here so that
+    the page renders before openai, bs4 and pydantic are loaded.
+    """
+    service_url = get_setting("CHAT_SERVICE_URL")
+    if service_url:
+        from LLM.client import ChatServiceClient
+        return ChatServiceClient(service_url)
+    
+    from LLM.llm import GenerativeAI
+    return GenerativeAI()
+
+
+@st.cache_resource(show_spinner=False)
+def start_warm_up():
+    """
+    Build the engine and pre-open upstream connections in the background,
+    once per server process. Enabled with the WARM_UP setting.
+    """
+    def _warm_up():
+        try:
+            engine = get_generative_ai()
+            if hasattr(engine, "warm_up"):
+                engine.warm_up()
+        except Exception:
+            logger.warning("Warm-up failed; the first request will open connections itself", exc_info=True)
+
+    thread = threading.Thread(target=_warm_up, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+# Dollar signs not escaped yet; Streamlit would render "$5 to $10" as LaTeX
+_DOLLAR_RE = re.compile(r"(?<!\\)\$")
+
+
+def escape_markdown(content: str) -> str:
+    return _DOLLAR_RE.sub(r"\\$", content or "")
+
+
+@st.cache_data(max_entries=4096, show_spinner=False)
+def render_markdown(content: str) -> str:
+    """Markdown shown for one message, computed once per distinct message."""
+    return escape_markdown(content)
+
+
+@st.cache_data(max_entries=512, show_spinner=False)
+def render_earlier(_history, session_id: str, start: int, end: int) -> str:
+    """
+    One markdown block for the messages in [start, end) of a session. Histories
+    are append-only, so a range never changes and is read from disk only once.
+    """
+    parts = []
+    for msg in _history.load(start, end):
+        speaker = "**You:**" if msg["role"] == "user" else "**Assistant:**"
+        parts.append(f"{speaker} {render_markdown(msg['content'])}")
+    return "\n\n---\n\n".join(parts)
+
+
+@st.fragment
+def show_history(window: int):
+    """
+    Show the newest `window` messages as chat bubbles and older ones, in pages
+    of `window` messages, behind a "load earlier" button. Only this fragment
+    reruns when the button is clicked, and a rerun renders the same number of
+    elements however long the conversation is.
+    """
+    history = st.session_state.messages
+    window_start = len(history) - min(window, history.recent_count)
+    shown = st.session_state.get("earlier_pages", 0)
+    # Pages are aligned to absolute positions so their cache entries survive new messages
+    first_page = min(window_start, max(0, (window_start + window - 1) // window - shown) * window)
+
+    if first_page > 0:
+        st.button(f"Load earlier messages ({first_page} more)", key="load_earlier",
+                  on_click=lambda: st.session_state.update(earlier_pages=shown + 1))
+    if first_page < window_start:
+        with st.expander(f"Earlier messages ({window_start - first_page})", expanded=True):
+            for start in range(first_page, window_start, window):
+                st.markdown(render_earlier(history, st.session_state["session_id"], start,
+                                           min(start + window, window_start)))
+
+    for msg in list(history)[-min(window, history.recent_count):]:
+        st.chat_message(msg["role"]).markdown(render_markdown(msg["content"]))
+
+@st.cache_resource(show_spinner=False)
+def get_suggestions():
+    """Type-ahead suggestions over locally known titles, ranked by how often the query log saw them."""
+    from LLM.query_log import url_popularity
+    from TNC.suggest import get_suggest_service
+    return get_suggest_service(popularity=url_popularity)
+
+
+def choose_suggestion(suggestion):
+    """Answer a chosen suggestion from what is already known about it, without the assistant."""
+    st.session_state.messages.append({"role": "user", "content": suggestion.title})
+    st.session_state.messages.append({"role": "assistant", "content": suggestion.markdown()})
+    st.session_state["quick_find"] = ""
 
 # Page configuration
 st.set_page_config(
@@ -23,9 +134,21 @@ with st.sidebar:
     - 🗓️ **Event Search**: Discover TNC events by region and topic
     - 🌐 **Web Resources**: Access TNC's website sections
     - 📱 **Social Media**: Connect with TNC's social accounts
-    - 🔗 **Web Browsing**: Visit relevant conservation websites
+    - 🔗 **Web Browsing**: Visit relevant conservation websites and search the pages already visited
     """)
     
+    st.markdown("---")
+    st.subheader("Quick Find")
+    quick_find = st.text_input("Quick find", key="quick_find", placeholder="e.g. wetlands, volunteer",
+                               label_visibility="collapsed")
+    if quick_find:
+        suggestions = get_suggestions().suggest(quick_find)
+        for i, suggestion in enumerate(suggestions):
+            st.button(suggestion.title, key=f"suggestion_{i}", on_click=choose_suggestion, args=(suggestion,),
+                      use_container_width=True)
+        if not suggestions:
+            st.caption("No quick matches; ask the assistant instead.")
+    
     st.markdown("---")
     st.caption("© The Nature Conservancy")
 
@@ -33,30 +156,60 @@ with st.sidebar:
 st.title("🌿 TNC Conservation Assistant")
 st.caption("Ask me about conservation projects, events, or how to get involved with The Nature Conservancy")
 
-# Initialize session state for messages if it doesn't exist
-if "messages" not in st.session_state:
-    st.session_state["messages"] = [{"role": "assistant", "content": "Welcome to The Nature Conservancy's Conservation Assistant! How can I help you with conservation topics today?"}]
+# Resolve the session id: kept in the URL (?sid=...) so a conversation can be resumed after a restart
+if "session_id" not in st.session_state:
+    st.session_state["session_id"] = st.query_params.get("sid") or uuid.uuid4().hex
+    st.query_params["sid"] = st.session_state["session_id"]
 
-# Initialize GenerativeAI instance
-try:
-    generative_ai = GenerativeAI()
-except ValueError as e:
-    generative_ai = None
-    st.error(f"Error initializing conservation assistant: {str(e)}")
+# Open the session's history; only recent turns are held in memory, older ones live on disk
+messages = get_session_store().open(st.session_state["session_id"])
+if not messages:
+    messages.append({"role": "assistant", "content": "Welcome to The Nature Conservancy's Conservation Assistant! How can I help you with conservation topics today?"})
+st.session_state["messages"] = messages
 
-# Display chat messages
-for msg in st.session_state.messages:
-    st.chat_message(msg["role"]).write(msg["content"])
+# Optionally build the engine and open upstream connections ahead of the first message
+if get_flag("WARM_UP"):
+    start_warm_up()
+
+# Display the recent chat messages; earlier ones are loaded on demand
+show_history(int(get_setting("CHAT_WINDOW_MESSAGES", 12)))
 
 # Process new user input
 if prompt := st.chat_input("Ask about conservation topics..."):
+    # Initialize GenerativeAI instance (cached across reruns and sessions)
+    try:
+        generative_ai = get_generative_ai()
+    except ValueError as e:
+        generative_ai = None
+        st.error(f"Error initializing conservation assistant: {str(e)}")
+    
     if generative_ai:
         # Add user message to chat UI
-        st.chat_message("user").write(prompt)
-        
-        # Process message and get response
-        with st.spinner("Researching conservation information..."):
-            response = generative_ai.process_message_and_get_response(prompt, st.session_state)
+        st.chat_message("user").markdown(render_markdown(prompt))
         
-        # Display assistant response
-        st.chat_message("assistant").write(response)
\ No newline at end of file
+        # Process message and stream the response as it is generated
+        with st.chat_message("assistant"):
+            placeholder = st.empty()
+            streamed = []
+            
+            def on_event(event):
+                if event["type"] == "token":
+                    streamed.append(event["content"])
+                    # Partial answers are not worth caching
+                    placeholder.markdown(escape_markdown("".join(streamed)))
+                elif event["type"] == "tool_call":
+                    # Text before a tool call is the model thinking aloud, not the answer
+                    streamed.clear()
+                    placeholder.caption(f"Using {event['name']}...")
+                elif event["type"] == "queued":
+                    placeholder.caption(f"Many people are asking right now, you are number {event['position']} in line...")
+            
+            # ?profile=1 in the URL profiles this turn if PROFILE_ALLOW_REQUEST is on (see LLM/profiling.py)
+            profile_requested.set(st.query_params.get("profile") == "1")
+            with st.spinner("Researching conservation information..."):
+                response = generative_ai.process_message_and_get_response(
+                    prompt, st.session_state, on_event=on_event
+                )
+            
+            # Display assistant response
+            placeholder.markdown(render_markdown(response))
\ No newline at end of file
@@ -0,0 +1,183 @@
+"""
+Builds the HTML fixture corpus used by the parser benchmark.
+
+Two sources feed the corpus:
+  - capture: fetches a live nature.org search or newsroom page through
+    ScrapingAnt and stores it verbatim (needs SCRAPINGANT_API_KEY).
+  - synthetic: renders deterministic pages that follow the nature.org markup
+    the extractors depend on, padded with site chrome to reach each size tier.
+
+Usage:
+    python -m benchmarks.make_fixtures synthetic
+    python -m benchmarks.make_fixtures capture search wetlands --name search_wetlands
+"""
+import argparse
+import os
+import random
+from html import escape
+from urllib.parse import quote_plus
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+# Number of result items per size tier.
+SIZE_TIERS = {
+    "small": 10,
+    "medium": 50,
+    "large": 200,
+}
+
+# Amount of navigation/footer chrome per size tier, so that larger pages also
+# carry proportionally more markup the parser has to walk past.
+CHROME_LINKS = {
+    "small": 40,
+    "medium": 200,
+    "large": 800,
+}
+
+_WORDS = (
+    "conservation water land climate forest river wetland coral reef ocean "
+    "restoration community science partners wildlife habitat fire prairie "
+    "grassland species protect nature people food resilience carbon coast "
+    "watershed preserve volunteer policy research indigenous fisheries"
+).split()
+
+_PLACES = [
+    "Arlington, VA", "Denver, CO", "Austin, TX", "Sacramento, CA",
+    "Boise, ID", "Nairobi, Kenya", "Brisbane, Australia", "Seattle, WA",
+]
+
+_MONTHS = [
+    "January", "February", "March", "April", "May", "June", "July",
+    "August", "September", "October", "November", "December",
+]
+
+
+def _sentence(rng: random.Random, low: int, high: int) -> str:
+    words = [rng.choice(_WORDS) for _ in range(rng.randint(low, high))]
+    return " ".join(words).capitalize()
+
+
+def _chrome(rng: random.Random, links: int) -> str:
+    """Renders header navigation, inline scripts and footer noise."""
+    nav = "".join(
+        f'<li class="c-nav__item"><a href="https://www.nature.org/en-us/{rng.choice(_WORDS)}/{i}/">'
+        f"{escape(_sentence(rng, 1, 3))}</a></li>"
+        for i in range(links)
+    )
+    script = "<script>window.dataLayer=window.dataLayer||[];" + ";".join(
+        f"dataLayer.push({{'e':{i}}})" for i in range(links // 4)
+    ) + "</script>"
+    return f'<header class="c-header"><nav><ul class="c-nav">{nav}</ul></nav></header>{script}'
+
+
+def _search_page(rng: random.Random, items: int, links: int) -> str:
+    rows = []
+    for i in range(items):
+        recommended = " recommendedItem" if i < 2 else ""
+        slug = "-".join(rng.choice(_WORDS) for _ in range(3))
+        url = f"https://www.nature.org/en-us/what-we-do/our-insights/{slug}-{i}/"
+        title = escape(_sentence(rng, 3, 8))
+        date = f"{rng.choice(_MONTHS)[:3]} {rng.randint(1, 28):02d}, {rng.randint(2015, 2025)}"
+        content = escape(_sentence(rng, 20, 60))
+        date_span = f'<span class="c-search-result-item__date">{date}</span>' if i % 3 else ""
+        rows.append(
+            f'<li class="c-search-result-item{recommended}">'
+            f'<a href="{url}" title="{title}"><h3 class="c-search-result-item__title">{title}</h3></a>'
+            f"{date_span}"
+            f'<p class="c-search-result-item__content">{content}</p>'
+            f"</li>"
+        )
+    return (
+        "<!DOCTYPE html><html><head><title>Search | The Nature Conservancy</title></head><body>"
+        f"{_chrome(rng, links)}"
+        f'<main><ul class="c-search-results">{"".join(rows)}</ul></main>'
+        f"{_chrome(rng, links // 2)}</body></html>"
+    )
+
+
+def _news_page(rng: random.Random, items: int, links: int) -> str:
+    cards = []
+    for i in range(items):
+        image = f"https://www.nature.org/content/dam/tnc/nature/en/photos/press-{i}.jpg"
+        title = escape(_sentence(rng, 4, 10))
+        excerpt = escape(_sentence(rng, 15, 40))
+        byline = (
+            f"{rng.choice(_PLACES)} | {rng.choice(_MONTHS)} {rng.randint(1, 28)}, "
+            f"{rng.randint(2015, 2025)}"
+        )
+        cards.append(
+            '<div class="c-cards-press-release__card-container border-primary">'
+            f'<picture><img class="c-cards-press-release__image" src="{image}" alt=""></picture>'
+            f'<h4 class="c-cards-press-release__title">{title}</h4>'
+            f'<p class="c-cards-press-release__excerpt">{excerpt}</p>'
+            f'<p class="c-cards-press-release__byline">{escape(byline)}</p>'
+            "</div>"
+        )
+    return (
+        "<!DOCTYPE html><html><head><title>Newsroom | The Nature Conservancy</title></head><body>"
+        f"{_chrome(rng, links)}"
+        f'<main><div class="cards-container bs_row">{"".join(cards)}</div></main>'
+        f"{_chrome(rng, links // 2)}</body></html>"
+    )
+
+
+def build_synthetic(seed: int = 2025) -> None:
+    """Writes search_<tier>.html and news_<tier>.html for every size tier."""
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    for tier, items in SIZE_TIERS.items():
+        links = CHROME_LINKS[tier]
+        for kind, render in (("search", _search_page), ("news", _news_page)):
+            rng = random.Random(f"{seed}-{kind}-{tier}")
+            path = os.path.join(FIXTURES_DIR, f"{kind}_{tier}.html")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(render(rng, items, links))
+            print(f"Wrote {path} ({os.path.getsize(path) // 1024} KiB)")
+
+
+def capture(kind: str, query: str, name: str) -> None:
+    """Fetches a live page through ScrapingAnt and stores it in the corpus."""
+    import http.client
+    import streamlit as st
+
+    if kind == "search":
+        target = f"https://www.nature.org/en-us/search/?q={quote_plus(query)}"
+    else:
+        target = f"https://www.nature.org/en-us/newsroom/?press_q={quote_plus(query)}"
+
+    api_key = st.secrets["SCRAPINGANT_API_KEY"]
+    conn = http.client.HTTPSConnection("api.scrapingant.com")
+    http.client._MAXHEADERS = 1000
+    conn.request("GET", f"/v2/general?url={target}&x-api-key={api_key}")
+    data = conn.getresponse().read()
+
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    path = os.path.join(FIXTURES_DIR, f"{name}.html")
+    with open(path, "wb") as f:
+        f.write(data)
+    print(f"Captured {target} -> {path} ({len(data) // 1024} KiB)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build the parser benchmark fixture corpus.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    synthetic = sub.add_parser("synthetic", help="Render deterministic pages for every size tier.")
+    synthetic.add_argument("--seed", type=int, default=2025)
+
+    cap = sub.add_parser("capture", help="Capture a live nature.org page.")
+    cap.add_argument("kind", choices=["search", "news"])
+    cap.add_argument("query")
+    cap.add_argument("--name", help="Fixture name; must start with 'search_' or 'news_'.")
+
+    args = parser.parse_args()
+    if args.command == "synthetic":
+        build_synthetic(args.seed)
+    else:
+        name = args.name or f"{args.kind}_{quote_plus(args.query).lower()}"
+        if not name.startswith(f"{args.kind}_"):
+            parser.error(f"--name must start with '{args.kind}_'")
+        capture(args.kind, args.query, name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+Throughput benchmark for the parse pool in TNC.parse_pool.
+
+Parses the large fixtures from several threads at once, as concurrent chat
+sessions in one process would, first inline (serialized on the GIL) and
+then through a parse pool, and checks that both give the same results.
+
+Usage:
+    python -m benchmarks.parse_pool_bench
+    python -m benchmarks.parse_pool_bench --threads 16 --copies 8 --workers 4
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Tuple
+
+from TNC.parse_pool import ParsePool, _parser
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def _run(parse: Callable[[str, str], Any], pages: List[Tuple[str, str]], threads: int) -> Tuple[float, list]:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        results = list(executor.map(lambda page: parse(*page), pages))
+    return time.perf_counter() - start, results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare inline and pooled HTML parsing under concurrency.")
+    parser.add_argument("--threads", type=int, default=8, help="Concurrent parsing threads (default: 8)")
+    parser.add_argument("--copies", type=int, default=8, help="Times each large fixture is parsed (default: 8)")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) - 1),
+                        help="Parse worker processes (default: CPU count - 1)")
+    args = parser.parse_args()
+
+    pages = []
+    for path in sorted(glob.glob(os.path.join(FIXTURES_DIR, "*_large.html"))):
+        with open(path, encoding="utf-8") as f:
+            pages.append((os.path.basename(path).split("_")[0], f.read()))
+    pages *= args.copies
+
+    inline, expected = _run(lambda kind, html: _parser(kind)(html), pages, args.threads)
+    pool = ParsePool(workers=args.workers, min_bytes=0)
+    pool.start()
+    try:
+        pooled, results = _run(pool.parse, pages, args.threads)
+    finally:
+        pool.shutdown()
+
+    print(f"{len(pages)} pages on {args.threads} threads: inline {inline:.2f}s, "
+          f"{args.workers} parse worker(s) {pooled:.2f}s ({inline / pooled:.1f}x)")
+    if results != expected:
+        print("Pooled results differ from inline results")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
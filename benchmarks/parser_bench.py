@@ -0,0 +1,187 @@
+"""
+Micro-benchmark and regression gate for the HTML extractors in TNC.tnc_api.
+
+For every fixture in benchmarks/fixtures (search_*.html / news_*.html) this:
+  1. Checks the extractor output against the fixture's golden JSON.
+  2. Measures parse time over several repeats (min / median / mean).
+  3. Measures peak traced memory and the blocks retained by the result.
+
+Usage:
+    python -m benchmarks.parser_bench
+    python -m benchmarks.parser_bench --update-golden
+    python -m benchmarks.parser_bench --output after.json --baseline before.json
+
+The exit code is non-zero when an output differs from its golden file or when
+a fixture's median parse time regresses beyond --max-regression against the
+baseline report.
+"""
+import argparse
+import gc
+import glob
+import json
+import os
+import statistics
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List
+
+from TNC.tnc_api import _extract_news_cards, _extract_search_results
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+EXTRACTORS: Dict[str, Callable[[str], List[dict]]] = {
+    "search": _extract_search_results,
+    "news": _extract_news_cards,
+}
+
+
+def _golden_path(fixture_path: str) -> str:
+    return os.path.splitext(fixture_path)[0] + ".golden.json"
+
+
+def _time_parse(extract: Callable[[str], List[dict]], html: str, repeat: int) -> List[float]:
+    """Returns the wall time of each run in milliseconds (after one warm-up)."""
+    extract(html)
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        extract(html)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def _trace_parse(extract: Callable[[str], List[dict]], html: str) -> Dict[str, Any]:
+    """Runs one parse under tracemalloc and reports peak and retained memory."""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    result = extract(html)
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    diff = after.compare_to(before, "filename")
+    retained_blocks = sum(stat.count_diff for stat in diff if stat.count_diff > 0)
+    retained_bytes = sum(stat.size_diff for stat in diff if stat.size_diff > 0)
+    del result
+    return {
+        "peak_kib": round(peak / 1024, 1),
+        "retained_kib": round(retained_bytes / 1024, 1),
+        "retained_blocks": retained_blocks,
+    }
+
+
+def run_fixture(path: str, repeat: int, update_golden: bool) -> Dict[str, Any]:
+    """Benchmarks a single fixture and checks it against its golden output."""
+    name = os.path.splitext(os.path.basename(path))[0]
+    kind = name.split("_", 1)[0]
+    extract = EXTRACTORS[kind]
+
+    with open(path, encoding="utf-8") as f:
+        html = f.read()
+
+    output = extract(html)
+    golden_path = _golden_path(path)
+    if update_golden:
+        with open(golden_path, "w", encoding="utf-8") as f:
+            json.dump(output, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+        golden_status = "updated"
+    elif not os.path.exists(golden_path):
+        golden_status = "missing"
+    else:
+        with open(golden_path, encoding="utf-8") as f:
+            golden_status = "ok" if json.load(f) == output else "mismatch"
+
+    timings = _time_parse(extract, html, repeat)
+    return {
+        "fixture": name,
+        "kind": kind,
+        "size_kib": round(len(html.encode("utf-8")) / 1024, 1),
+        "items": len(output),
+        "golden": golden_status,
+        "min_ms": round(min(timings), 3),
+        "median_ms": round(statistics.median(timings), 3),
+        "mean_ms": round(statistics.fmean(timings), 3),
+        **_trace_parse(extract, html),
+    }
+
+
+def compare_to_baseline(results: List[Dict[str, Any]], baseline_path: str, max_regression: float) -> List[str]:
+    """Returns a description of every fixture whose median time regressed."""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {row["fixture"]: row for row in json.load(f)["results"]}
+
+    regressions = []
+    for row in results:
+        previous = baseline.get(row["fixture"])
+        if not previous or not previous["median_ms"]:
+            continue
+        change = row["median_ms"] / previous["median_ms"] - 1
+        row["median_change"] = round(change, 3)
+        if change > max_regression:
+            regressions.append(
+                f"{row['fixture']}: median {previous['median_ms']:.2f} ms -> {row['median_ms']:.2f} ms (+{change:.0%})"
+            )
+    return regressions
+
+
+def _print_table(results: List[Dict[str, Any]]) -> None:
+    header = f"{'fixture':<22}{'KiB':>8}{'items':>7}{'median ms':>11}{'min ms':>9}{'peak KiB':>10}{'blocks':>8}  golden"
+    print(header)
+    print("-" * len(header))
+    for row in results:
+        change = f" ({row['median_change']:+.0%})" if "median_change" in row else ""
+        print(
+            f"{row['fixture']:<22}{row['size_kib']:>8}{row['items']:>7}{row['median_ms']:>11.2f}"
+            f"{row['min_ms']:>9.2f}{row['peak_kib']:>10}{row['retained_blocks']:>8}  {row['golden']}{change}"
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the TNC HTML extractors.")
+    parser.add_argument("--fixtures", default=FIXTURES_DIR, help="Directory containing the fixture corpus.")
+    parser.add_argument("--filter", default="", help="Only run fixtures whose name contains this string.")
+    parser.add_argument("--repeat", type=int, default=20, help="Timed runs per fixture.")
+    parser.add_argument("--update-golden", action="store_true", help="Rewrite golden JSON from current output.")
+    parser.add_argument("--output", help="Write the report as JSON to this path.")
+    parser.add_argument("--baseline", help="Previous JSON report to compare median times against.")
+    parser.add_argument("--max-regression", type=float, default=0.15,
+                        help="Allowed relative median slowdown against the baseline (default 0.15).")
+    args = parser.parse_args()
+
+    paths = sorted(
+        path for path in glob.glob(os.path.join(args.fixtures, "*.html"))
+        if os.path.basename(path).split("_", 1)[0] in EXTRACTORS and args.filter in os.path.basename(path)
+    )
+    if not paths:
+        print(f"No fixtures found in {args.fixtures}")
+        return 1
+
+    results = [run_fixture(path, args.repeat, args.update_golden) for path in paths]
+
+    regressions = []
+    if args.baseline:
+        regressions = compare_to_baseline(results, args.baseline, args.max_regression)
+
+    _print_table(results)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version.split()[0], "repeat": args.repeat, "results": results}, f, indent=2)
+            f.write("\n")
+
+    failed = [row["fixture"] for row in results if row["golden"] in ("mismatch", "missing")]
+    if failed:
+        print(f"\nGolden output check failed for: {', '.join(failed)}")
+    if regressions:
+        print("\nPerformance regressions:")
+        for line in regressions:
+            print(f"  {line}")
+    return 1 if failed or regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())